@@ -9,6 +9,7 @@ import sanic
 from backend import utils
 from backend.db.queries import Queries  # noqa: TC001
 from backend.internal import errors
+from backend.internal import ratelimit
 from backend.internal import serialization
 from shared.models import requests
 from shared.models import responses
@@ -22,6 +23,7 @@ WRONG_CREDENTIALS_ERROR = sanic.SanicException(
 
 
 @router.post("/login")
+@ratelimit.rate_limit("login", ratelimit.RateLimit(rate=0.5, burst=10))
 @serialization.serialize()
 @serialization.deserialize()
 async def login(_: sanic.Request, request_body: requests.LoginRequest, queries: Queries) -> responses.LoginResponse:
@@ -3,12 +3,12 @@ from __future__ import annotations
 __all__ = ("Blackjack",)
 
 import asyncio
-import contextlib
 import typing
 
 from sanic.log import logger
 
 from backend.cards import CardStack
+from backend.internal import database
 from backend.internal.ws import GameLobbyBase
 from backend.internal.ws import add_event_listener
 from shared.models import events
@@ -16,6 +16,7 @@ from shared.models import events
 if typing.TYPE_CHECKING:
     from backend.db.queries import Queries
     from backend.internal.ws import WebsocketClient
+    from shared.internal import Snowflake
 
 
 def get_card_value(card: str) -> int:
@@ -47,6 +48,13 @@ def get_total_card_value(cards: list[events.BlackjackCardData]) -> int:
 class Blackjack(GameLobbyBase):
     """Blackjack lobby class handling all the logic behind the blackjack game.
 
+    Clients receive a full snapshot of the game state (`BlackjackUpdateGame`) when they join and whenever a new round
+    starts. Every other change is sent as a small patch event. Snapshots and patches are numbered using `state_seq`, so
+    that clients can detect missed patches and request a new snapshot.
+
+    Timeouts and giving cards run in the background, but every change of the game state they make runs through the
+    mailbox of the lobby, so it never interleaves with event listeners.
+
     Authors: Nina
     """
 
@@ -59,9 +67,10 @@ class Blackjack(GameLobbyBase):
         self.waiting_players: dict[WebsocketClient, events.BlackjackPlayerData] = {}
         self.dealer = events.BlackjackPlayerData(username="")
         self.hidden_card = events.BlackjackCardData(name="", value=0)
+        self.state_seq = 0
 
         self.current_waiting_task: None | tuple[int, str, asyncio.Task] = None
-        self.background_tasks: set[asyncio.Task] = set()
+        self.round_task: asyncio.Task | None = None
 
     ### Event Listeners
 
@@ -71,22 +80,26 @@ class Blackjack(GameLobbyBase):
         "waiting" list and if the game has not started he will be put into the active players.
         """
         user = await self.get_user_by_client(ws)
+        player_data = events.BlackjackPlayerData(username=user.username)
         if self.game_started:
-            self.waiting_players[ws] = events.BlackjackPlayerData(username=user.username)
+            self.waiting_players[ws] = player_data
         else:
-            self.active_players[ws] = events.BlackjackPlayerData(username=user.username)
-        await self.broadcast_update()
+            self.active_players[ws] = player_data
+        await self.broadcast_event(
+            events.BlackjackPlayerJoined(seq=self.next_seq(), player=player_data, waiting=self.game_started)
+        )
+        await self.send_event(self.snapshot(), ws)
 
     @add_event_listener(events.LeaveEvent)
     async def on_leave(self, _: events.LeaveEvent, ws: WebsocketClient) -> None:
         """Listener when a client leaves the lobby. He will be removed from waiting and active players and if he was
         the only client left in the lobby, everything will be reset after he left.
         """
-        self.waiting_players.pop(ws, None)
-        self.active_players.pop(ws, None)
+        player_data = self.waiting_players.pop(ws, None) or self.active_players.pop(ws, None)
         if len(self._clients) == 0:
             await self.reset_game()
-        await self.broadcast_update()
+        elif player_data is not None:
+            await self.broadcast_event(events.BlackjackPlayerLeft(seq=self.next_seq(), username=player_data.username))
 
     @add_event_listener(events.BlackjackSetBet)
     async def on_set_bet(self, event: events.BlackjackSetBet, ws: WebsocketClient) -> None:
@@ -105,15 +118,17 @@ class Blackjack(GameLobbyBase):
         if player_data.current_bet != 0:
             logger.debug("player tried setting bet even though he already did! %s", ws)
             return
-        user_money = (await self.get_user_by_client(ws)).money
-        if event.bet > user_money:
+        if event.bet <= 0:
+            logger.debug("player tried setting a bet that isn't positive! %s", ws)
+            return
+        balance = await self.queries.debit_user_money(amount=event.bet, id_=ws.user_id)
+        await database.commit(self.queries)
+        if balance is None:
             logger.debug("player tried setting bet to high! %s", ws)
             return
         player_data.current_bet = event.bet
-        await self.broadcast_update()
-        await self.queries.update_user_money(money=user_money - event.bet, id_=ws.user_id)
-        await self.queries.conn.commit()
-        await self.send_event(events.UpdateMoney(money=user_money - event.bet), ws)
+        await self.broadcast_bet(player_data)
+        await self.send_event(events.UpdateMoney(money=balance), ws)
 
         all_finished = True
         for p_data in self.active_players.values():
@@ -122,9 +137,9 @@ class Blackjack(GameLobbyBase):
 
         if all_finished:
             self.waiting_for_bets = False
-            task = asyncio.create_task(self.start_giving_cards())
-            self.background_tasks.add(task)
-            task.add_done_callback(self.background_tasks.discard)
+            if self.round_task is not None:
+                self.round_task.cancel()
+            self.round_task = self.create_task(self.start_giving_cards())
 
     @add_event_listener(events.BlackjackHoldCard)
     async def on_hold_card(self, _: events.BlackjackHoldCard, ws: WebsocketClient) -> None:
@@ -151,28 +166,31 @@ class Blackjack(GameLobbyBase):
         card = self.cards.give_card()
         value = get_card_value(card.name)
         card_data = events.BlackjackCardData(name=card.name, value=value)
-        self.active_players[ws].cards.append(card_data)
-        await self.broadcast_update()
+        await self.add_card(self.active_players[ws], card_data)
         if get_total_card_value(self.active_players[ws].cards) >= 21:
             await self.next_players_turn(self.current_waiting_task[0] + 1)
         else:
             await self.next_players_turn(self.current_waiting_task[0])
 
+    @add_event_listener(events.BlackjackRequestResync)
+    async def on_request_resync(self, _: events.BlackjackRequestResync, ws: WebsocketClient) -> None:
+        """Listener when a client missed a patch, it gets sent a fresh snapshot of the game state."""
+        await self.send_event(self.snapshot(), ws)
+
     @add_event_listener(events.BlackjackStartGame)
     async def on_start(self, _: events.BlackjackStartGame, __: WebsocketClient) -> None:
         """Listener when a user starts the game. This moves all waiting players into the active players list and
         starts waiting for bets.
         """
+        if self.game_started:
+            return
         for ws, data in self.waiting_players.items():
             self.active_players[ws] = data
         self.waiting_players = {}
         self.game_started = True
 
         await self.broadcast_update()
-        self.waiting_for_bets = True
-        task = asyncio.create_task(self.wait_for_bets())
-        self.background_tasks.add(task)
-        task.add_done_callback(self.background_tasks.discard)
+        await self.wait_for_bets()
 
     async def reset_game(self) -> None:
         """Function used to reset the game state.
@@ -183,64 +201,99 @@ class Blackjack(GameLobbyBase):
         self.waiting_for_bets = False
         self.dealer = events.BlackjackPlayerData(username="")
         self.hidden_card = events.BlackjackCardData(name="", value=0)
-        self.current_waiting_task = None
+        if self.round_task is not None:
+            self.round_task.cancel()
+            self.round_task = None
+        if self.current_waiting_task is not None:
+            self.current_waiting_task[2].cancel()
+            self.current_waiting_task = None
         for p_data in self.active_players.values():
             p_data.current_bet = 0
             p_data.cards = []
         await self.broadcast_update()
 
-    async def broadcast_update(self) -> None:
-        """Helper function to broadcast the current game state."""
+    def next_seq(self) -> int:
+        """Helper function returning the sequence number for the next state change."""
+        self.state_seq += 1
+        return self.state_seq
+
+    def snapshot(self) -> events.BlackjackUpdateGame:
+        """Helper function creating a snapshot of the current game state."""
         active_players = list(self.active_players.values())
         active_players.append(self.dealer)
+        return events.BlackjackUpdateGame(
+            seq=self.state_seq,
+            started=self.game_started,
+            active_players=active_players,
+            waiting_players=list(self.waiting_players.values()),
+        )
+
+    async def broadcast_update(self) -> None:
+        """Helper function to broadcast a snapshot of the current game state."""
+        self.next_seq()
+        await self.broadcast_event(self.snapshot())
+
+    async def broadcast_bet(self, player_data: events.BlackjackPlayerData) -> None:
+        """Helper function to broadcast the bet of a player."""
         await self.broadcast_event(
-            events.BlackjackUpdateGame(
-                started=self.game_started,
-                active_players=active_players,
-                waiting_players=list(self.waiting_players.values()),
-            )
+            events.BlackjackBetSet(seq=self.next_seq(), username=player_data.username, bet=player_data.current_bet)
+        )
+
+    async def add_card(self, player_data: events.BlackjackPlayerData, card_data: events.BlackjackCardData) -> None:
+        """Helper function that gives a card to a player (or the dealer) and broadcasts it."""
+        player_data.cards.append(card_data)
+        await self.broadcast_event(
+            events.BlackjackCardAdded(seq=self.next_seq(), username=player_data.username, card=card_data)
         )
 
     async def start_giving_cards(self) -> None:
-        """Function that draws cards and gives them to every player. Everyone gets 2 cards, but the second card of the
+        """Task that draws cards and gives them to every player. Everyone gets 2 cards, but the second card of the
         dealer is not visible to the players. After every player received their 2 cards, we start waiting for actions of
-        the players."""
+        the players.
+
+        Every card is given in the mailbox of the lobby, players that left in the meantime are skipped."""
         sleep_duration = 0.65
 
         for i in range(2):
-            card = self.cards.give_card()
-            value = get_card_value(card.name)
-            card_data = events.BlackjackCardData(name=card.name, value=value)
-            if i == 1:
-                self.hidden_card = card_data
-                self.dealer.cards.append(events.BlackjackCardData(name="", value=0))
-            else:
-                self.dealer.cards.append(card_data)
-
-            await self.broadcast_update()
+            await self.run_in_mailbox(self.give_dealer_card, i == 1)
             await asyncio.sleep(sleep_duration)
 
-            for p_data in self.active_players.values():
-                card = self.cards.give_card()
-                value = get_card_value(card.name)
-                card_data = events.BlackjackCardData(name=card.name, value=value)
-                p_data.cards.append(card_data)
-                await self.broadcast_update()
-                await asyncio.sleep(sleep_duration)
+            for ws in list(self.active_players):
+                if await self.run_in_mailbox(self.give_player_card, ws):
+                    await asyncio.sleep(sleep_duration)
 
-        player_one = next(iter(self.active_players.values()))
-        await self.broadcast_event(events.BlackjackPlayerAction(username=player_one.username))
-        waiting_task = asyncio.create_task(self.player_action_timeout(0))
-        self.current_waiting_task = (0, player_one.username, waiting_task)
+        await self.run_in_mailbox(self.next_players_turn, 0)
+
+    async def give_dealer_card(self, hidden: bool) -> None:
+        """Helper function that draws a card for the dealer, the card is only revealed in `dealers_turn` if `hidden`."""
+        card = self.cards.give_card()
+        card_data = events.BlackjackCardData(name=card.name, value=get_card_value(card.name))
+        if hidden:
+            self.hidden_card = card_data
+            await self.add_card(self.dealer, events.BlackjackCardData(name="", value=0))
+        else:
+            await self.add_card(self.dealer, card_data)
+
+    async def give_player_card(self, ws: WebsocketClient) -> bool:
+        """Helper function that draws a card for a player. Returns False if the player isn't playing anymore."""
+        if (p_data := self.active_players.get(ws)) is None:
+            return False
+        card = self.cards.give_card()
+        await self.add_card(p_data, events.BlackjackCardData(name=card.name, value=get_card_value(card.name)))
+        return True
 
     async def dealers_turn(self) -> None:
         """This function is called when the dealer has his turn. He draws cards as long his total value is under/or 16
         and after that he holds. After that we check for wins of each player.
         """
         await self.broadcast_event(events.BlackjackPlayerAction(username=""))
-        self.dealer.cards.pop(len(self.dealer.cards) - 1)
-        self.dealer.cards.append(self.hidden_card)
-        await self.broadcast_update()
+        hidden_index = len(self.dealer.cards) - 1
+        self.dealer.cards[hidden_index] = self.hidden_card
+        await self.broadcast_event(
+            events.BlackjackCardRevealed(
+                seq=self.next_seq(), username=self.dealer.username, index=hidden_index, card=self.hidden_card
+            )
+        )
 
         while True:
             total_value = get_total_card_value(self.dealer.cards)
@@ -248,8 +301,7 @@ class Blackjack(GameLobbyBase):
                 card = self.cards.give_card()
                 value = get_card_value(card.name)
                 card_data = events.BlackjackCardData(name=card.name, value=value)
-                self.dealer.cards.append(card_data)
-                await self.broadcast_update()
+                await self.add_card(self.dealer, card_data)
             else:
                 break
         await self.evaluate_wins()
@@ -265,83 +317,75 @@ class Blackjack(GameLobbyBase):
         possible and checks if its the dealers turn (every other player has made their action already).
         """
         if self.current_waiting_task is not None:
-            task = self.current_waiting_task[2]
-            if task.done():
-                return
-            task.cancel()
-            with contextlib.suppress(asyncio.CancelledError):
-                await task
+            self.current_waiting_task[2].cancel()
             self.current_waiting_task = None
         player_list = list(self.active_players.values())
 
-        if len(player_list) == player_num:
+        if player_num >= len(player_list):
             await self.dealers_turn()
             return
-        player = list(self.active_players.values())[player_num]
+        player = player_list[player_num]
         await self.broadcast_event(events.BlackjackPlayerAction(username=player.username))
-        waiting_task = asyncio.create_task(self.player_action_timeout(player_num))
+        waiting_task = self.call_later(7.5, self.player_action_timeout, player_num)
         self.current_waiting_task = (player_num, player.username, waiting_task)
 
     async def player_action_timeout(self, player_num: int) -> None:
-        """Task used by the `next_players_turn` function to continue with the next player if the current one didn't do
+        """Called by the `next_players_turn` function to continue with the next player if the current one didn't do
         any actions after 7.5 seconds
         """
-        await asyncio.sleep(7.5)
         self.current_waiting_task = None
         await self.next_players_turn(player_num + 1)
 
-    async def wait_for_end_game(self) -> None:
-        """Task that sleeps 5 seconds after every game until the game will be reset."""
-        await asyncio.sleep(5)
-        await self.reset_game()
-
     async def evaluate_wins(self) -> None:
         """Function called after the dealer made his turn to check which player has won/lost.
         Also updates the money for players that have won/drawn.
         """
         total_dealer = get_total_card_value(self.dealer.cards)
+        payouts: dict[Snowflake, int] = {}
         for ws, p_data in self.active_players.items():
             total = get_total_card_value(p_data.cards)
-            users_money = (await self.get_user_by_client(ws)).money
             if total > 21:
                 await self.send_event(events.BlackjackDefeat(), ws)
             elif total == total_dealer:
                 await self.send_event(events.BlackjackDraw(), ws)
-                await self.queries.update_user_money(money=users_money + p_data.current_bet, id_=ws.user_id)
-                await self.send_event(events.UpdateMoney(money=users_money + p_data.current_bet), ws)
+                payouts[ws.user_id] = p_data.current_bet
             elif total > total_dealer or total_dealer > 21:
                 await self.send_event(events.BlackjackWin(), ws)
-                await self.queries.update_user_money(money=users_money + p_data.current_bet * 2, id_=ws.user_id)
-                await self.send_event(events.UpdateMoney(money=users_money + p_data.current_bet * 2), ws)
+                payouts[ws.user_id] = p_data.current_bet * 2
             else:
                 await self.send_event(events.BlackjackDefeat(), ws)
-        await self.queries.conn.commit()
-        task = asyncio.create_task(self.wait_for_end_game())
-        self.background_tasks.add(task)
-        task.add_done_callback(self.background_tasks.discard)
+        balances = await database.settle_balances(self.queries, payouts)
+        for ws in list(self.active_players):
+            if (balance := balances.get(ws.user_id)) is not None:
+                await self.send_event(events.UpdateMoney(money=balance), ws)
+        self.round_task = self.call_later(5, self.reset_game)
 
     async def wait_for_bets(self) -> None:
-        """Task that waits for incoming bets. If at the end of the waiting some players didnt bet, they will get an
-        automatic bet of 10$.
+        """Function that starts waiting for incoming bets. If at the end of the waiting some players didnt bet, they
+        will get an automatic bet, see `place_missing_bets`.
         """
         wait_time = 10
+        self.waiting_for_bets = True
         await self.broadcast_event(events.BlackjackWaitingForBet(wait_time=wait_time))
-        await asyncio.sleep(wait_time)
+        self.round_task = self.call_later(wait_time, self.place_missing_bets)
+
+    async def place_missing_bets(self) -> None:
+        """Called after waiting for bets, players that didn't bet get an automatic bet of 10$."""
         if not self.waiting_for_bets:
             return
         self.waiting_for_bets = False
         for ws, p_data in self.active_players.items():
             if p_data.current_bet != 0:
                 continue
+            balance = await self.queries.debit_user_money(amount=10, id_=ws.user_id)
+            await database.commit(self.queries)
+            if balance is None:
+                logger.debug("player can't afford the automatic bet! %s", ws)
+                continue
             p_data.current_bet = 10
-            user_money = (await self.get_user_by_client(ws)).money
-            await self.queries.update_user_money(money=user_money - p_data.current_bet, id_=ws.user_id)
-            await self.queries.conn.commit()
-            await self.send_event(events.UpdateMoney(money=user_money - p_data.current_bet), ws)
-        await self.broadcast_update()
-        task = asyncio.create_task(self.start_giving_cards())
-        self.background_tasks.add(task)
-        task.add_done_callback(self.background_tasks.discard)
+            await self.broadcast_bet(p_data)
+            await self.send_event(events.UpdateMoney(money=balance), ws)
+        self.round_task = self.create_task(self.start_giving_cards())
 
     @property
     @typing.override
@@ -3,6 +3,7 @@ from __future__ import annotations
 import random
 import typing
 
+from backend.internal import database
 from backend.internal.ws import GameLobbyBase
 from backend.internal.ws import WebsocketClient
 from backend.internal.ws import add_event_listener
@@ -64,13 +65,14 @@ class Chickengame(GameLobbyBase):
         return round((1.03 * 1.02 ** (step - 1)), 3)
 
     @add_event_listener(events.ReadyEvent)
-    async def ready_callback(self, event: events.ReadyEvent, _: WebsocketClient) -> None:
-        self.money = event.user.money
+    async def ready_callback(self, _: events.ReadyEvent, ws: WebsocketClient) -> None:
+        self.money = await self.get_money_by_client(ws)
         await self.broadcast_event(events.UpdateMoney(money=self.money))
 
     @add_event_listener(events.UpdateTotal)
     async def update_total_callback(self, event: events.UpdateTotal, _: WebsocketClient) -> None:
         await self.queries.update_user_money(money=event.total, id_=_.user_id)
+        await database.commit(self.queries)
 
     @property
     @typing.override
@@ -18,9 +18,30 @@ if typing.TYPE_CHECKING:
 from backend.db import models
 
 
+ADD_USER_MONEY: typing.Final[str] = """-- name: AddUserMoney :one
+UPDATE users
+SET money = money + ?
+WHERE id = ?
+RETURNING money
+"""
+
 CREATE_USER: typing.Final[str] = """-- name: CreateUser :execrows
 INSERT INTO users(id, username, password, money)
 VALUES (?, ?, ?, ?)
+ON CONFLICT (username) DO NOTHING
+"""
+
+CREDIT_USER_MONEY: typing.Final[str] = """-- name: CreditUserMoney :exec
+UPDATE users
+SET money = money + ?
+WHERE id = ?
+"""
+
+DEBIT_USER_MONEY: typing.Final[str] = """-- name: DebitUserMoney :one
+UPDATE users
+SET money = money - ?
+WHERE id = ? AND ? > 0 AND money >= ?
+RETURNING money
 """
 
 GET_USER_BY_ID: typing.Final[str] = """-- name: GetUserById :one
@@ -35,6 +56,12 @@ FROM users
 WHERE users.username = ?
 """
 
+GET_USER_MONEY: typing.Final[str] = """-- name: GetUserMoney :one
+SELECT money
+FROM users
+WHERE users.id = ?
+"""
+
 UPDATE_USER_MONEY: typing.Final[str] = """-- name: UpdateUserMoney :exec
 UPDATE users
 SET money = ?
@@ -65,12 +92,35 @@ class Queries:
         """
         return self._conn
 
+    async def add_user_money(self, *, amount: int, id_: Snowflake) -> int | None:
+        """Fetch one from the db using the SQL query with `name: AddUserMoney :one`.
+
+        ```sql
+        UPDATE users
+        SET money = money + ?
+        WHERE id = ?
+        RETURNING money
+        ```
+
+        Args:
+            amount: int.
+            id_: Snowflake.
+
+        Returns:
+            Result of type `int` fetched from the db. Will be `None` if not found.
+        """
+        row = await (await self._conn.execute(ADD_USER_MONEY, (amount, int(id_)))).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
     async def create_user(self, *, id_: Snowflake, username: str, password: str, money: int) -> int:
         """Execute SQL query with `name: CreateUser :execrows` and return the number of affected rows.
 
         ```sql
         INSERT INTO users(id, username, password, money)
         VALUES (?, ?, ?, ?)
+        ON CONFLICT (username) DO NOTHING
         ```
 
         Args:
@@ -84,6 +134,43 @@ class Queries:
         """
         return (await self._conn.execute(CREATE_USER, (int(id_), username, password, money))).rowcount
 
+    async def credit_user_money(self, *, amount: int, id_: Snowflake) -> None:
+        """Execute SQL query with `name: CreditUserMoney :exec`.
+
+        ```sql
+        UPDATE users
+        SET money = money + ?
+        WHERE id = ?
+        ```
+
+        Args:
+            amount: int.
+            id_: Snowflake.
+        """
+        await self._conn.execute(CREDIT_USER_MONEY, (amount, int(id_)))
+
+    async def debit_user_money(self, *, amount: int, id_: Snowflake) -> int | None:
+        """Fetch one from the db using the SQL query with `name: DebitUserMoney :one`.
+
+        ```sql
+        UPDATE users
+        SET money = money - ?
+        WHERE id = ? AND ? > 0 AND money >= ?
+        RETURNING money
+        ```
+
+        Args:
+            amount: int.
+            id_: Snowflake.
+
+        Returns:
+            Result of type `int` fetched from the db. Will be `None` if not found.
+        """
+        row = await (await self._conn.execute(DEBIT_USER_MONEY, (amount, int(id_), amount, amount))).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
     async def get_user_by_id(self, *, id_: Snowflake) -> models.User | None:
         """Fetch one from the db using the SQL query with `name: GetUserById :one`.
 
@@ -124,6 +211,26 @@ class Queries:
             return None
         return models.User(id=Snowflake(row[0]), username=row[1], password=row[2], money=row[3])
 
+    async def get_user_money(self, *, id_: Snowflake) -> int | None:
+        """Fetch one from the db using the SQL query with `name: GetUserMoney :one`.
+
+        ```sql
+        SELECT money
+        FROM users
+        WHERE users.id = ?
+        ```
+
+        Args:
+            id_: Snowflake.
+
+        Returns:
+            Result of type `int` fetched from the db. Will be `None` if not found.
+        """
+        row = await (await self._conn.execute(GET_USER_MONEY, (int(id_),))).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
     async def update_user_money(self, *, money: int, id_: Snowflake) -> None:
         """Execute SQL query with `name: UpdateUserMoney :exec`.
 
@@ -7,16 +7,18 @@ import http
 import jwt
 import sanic
 
-from backend import utils
-from backend.db import models  # noqa: TC001
 from backend.db.queries import Queries  # noqa: TC001
+from backend.internal import identity
 
 INVALID_TOKEN_ERROR = sanic.SanicException(message="Invalid token.", status_code=http.HTTPStatus.UNAUTHORIZED)
 
 
-async def get_current_user(request: sanic.Request, queries: Queries) -> models.User:
+async def get_current_user(request: sanic.Request, queries: Queries) -> identity.Identity:
     """Dependency that checks if the request is authenticated and if so it returns the user that requested the endpoint.
 
+    Verified tokens and identities are cached, see `backend.internal.identity`. The identity doesn't contain the
+    balance, read it using `Queries.get_user_money`.
+
     Authors: Christopher, Quirin
     """
     auth_header = request.headers.get("Authorization")
@@ -26,13 +28,12 @@ async def get_current_user(request: sanic.Request, queries: Queries) -> models.U
     match toke_type:
         case "Bearer":
             try:
-                user_id = utils.decode_token(token)
+                user_id = identity.identities.verify_token(token)
             except jwt.exceptions.PyJWTError:
                 raise INVALID_TOKEN_ERROR from None
             else:
-                db_user = await queries.get_user_by_id(id_=user_id)
-                if not db_user:
+                if (user := await identity.identities.get_identity(user_id, queries)) is None:
                     raise INVALID_TOKEN_ERROR
-                return db_user
+                return user
         case _:
             raise INVALID_TOKEN_ERROR
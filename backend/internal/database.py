@@ -0,0 +1,284 @@
+"""Pool of SQLite connections, with a single writer and multiple readers.
+
+The database runs in WAL mode, so readers never block the writer and the writer never blocks readers. Every
+`aiosqlite` connection runs its queries in a thread of its own, which lets reads run in parallel to each other and to
+writes, e.g. authenticating a user doesn't wait for balance updates.
+
+Reads that have to see uncommitted writes of the writer connection have to go through `Queries.conn`, readers only
+see committed data. Balances are changed by atomic queries on the writer, `settle_balances` credits many users at
+once.
+
+Writes are committed in groups, see `GroupCommitter`: after writing, callers await `commit`, which returns once a
+commit containing their writes finished. Every lobby and request shares these commits.
+
+The database file and the amount of readers can be changed by setting `CASINO_DATABASE` and `CASINO_DB_READERS`,
+group commits by setting `CASINO_DB_COMMIT_DELAY` in seconds and `CASINO_DB_COMMIT_BATCH`.
+"""
+
+from __future__ import annotations
+
+__all__ = (
+    "COMMIT_BATCH",
+    "COMMIT_DELAY",
+    "DATABASE_PATH",
+    "READERS",
+    "ConnectionPool",
+    "GroupCommitter",
+    "PooledQueries",
+    "commit",
+    "settle_balances",
+)
+
+import asyncio
+import contextlib
+import os
+import time
+import typing
+
+import aiosqlite
+
+from backend.db.queries import ADD_USER_MONEY
+from backend.db.queries import CREDIT_USER_MONEY
+from backend.db.queries import DEBIT_USER_MONEY
+from backend.db.queries import Queries
+from backend.internal import metrics
+from shared.internal import Snowflake
+
+if typing.TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+    from collections.abc import Mapping
+
+    from backend.db import models
+
+DATABASE_PATH: typing.Final[str] = os.getenv("CASINO_DATABASE", "sqlite.db")
+"""Path of the SQLite database file."""
+
+READERS: typing.Final[int] = int(os.getenv("CASINO_DB_READERS", "4"))
+"""Amount of reader connections of the pool."""
+
+COMMIT_DELAY: typing.Final[float] = float(os.getenv("CASINO_DB_COMMIT_DELAY", "0.002"))
+"""Time in seconds the first commit request of a group waits for more requests, before the group gets committed."""
+
+COMMIT_BATCH: typing.Final[int] = int(os.getenv("CASINO_DB_COMMIT_BATCH", "256"))
+"""Amount of commit requests after which a group gets committed right away."""
+
+_PRAGMAS: typing.Final[tuple[str, ...]] = (
+    # with WAL, NORMAL only syncs on checkpoints, a crash can lose the last commits but never corrupts the database
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+)
+"""Pragmas set on every connection, the cache size is in KiB and the mmap size in bytes."""
+
+
+class GroupCommitter:
+    """Coalesces the commits of every lobby and request into one commit of the writer connection.
+
+    Writes are executed right away and join the open transaction of the writer connection. The first commit request
+    starts a timer of `max_delay` seconds, when it runs out or once `max_batch` requests are waiting, the transaction
+    is committed and every waiting request returns. Requests coming in while a commit is running wait for the next
+    one, so returning always means the writes made before requesting the commit are committed.
+
+    Authors: Christopher
+    """
+
+    __slots__ = ("_committing", "_conn", "_flush_handle", "_flush_requested", "_max_batch", "_max_delay", "_pending")
+
+    def __init__(
+        self, conn: aiosqlite.Connection, *, max_delay: float = COMMIT_DELAY, max_batch: int = COMMIT_BATCH
+    ) -> None:
+        self._conn = conn
+        self._max_delay = max_delay
+        self._max_batch = max_batch
+        self._pending: list[asyncio.Future[None]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._committing: asyncio.Task[None] | None = None
+        self._flush_requested = False
+
+    async def commit(self) -> None:
+        """Waits until the writes made so far got committed. Raises the exception of the commit, if it failed."""
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[None] = loop.create_future()
+        self._pending.append(future)
+        if len(self._pending) >= self._max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._max_delay, self._flush)
+        # the commit goes on even if the caller gets cancelled, other requests of the group depend on it
+        await asyncio.shield(future)
+        metrics.DB_COMMIT_LATENCY.observe(time.perf_counter() - start)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._committing is not None:
+            self._flush_requested = True
+            return
+        if not self._pending:
+            return
+        group, self._pending = self._pending, []
+        self._committing = asyncio.create_task(self._commit_group(group), name="group_commit")
+
+    async def _commit_group(self, group: list[asyncio.Future[None]]) -> None:
+        try:
+            await self._conn.commit()
+        except Exception as exc:  # noqa: BLE001
+            for future in group:
+                if not future.done():
+                    future.set_exception(exc)
+        else:
+            for future in group:
+                if not future.done():
+                    future.set_result(None)
+        finally:
+            metrics.DB_COMMIT_BATCH_SIZE.observe(len(group))
+            self._committing = None
+            if self._flush_requested:
+                self._flush_requested = False
+                self._flush()
+
+    async def close(self) -> None:
+        """Commits every waiting request right away and waits for the running commit."""
+        self._flush()
+        while (committing := self._committing) is not None:
+            await committing
+
+
+class ConnectionPool:
+    """A writer connection and a fixed amount of reader connections to the same database.
+
+    Authors: Christopher
+    """
+
+    def __init__(self, writer: aiosqlite.Connection, readers: list[aiosqlite.Connection]) -> None:
+        self.writer = writer
+        """Connection every write goes through."""
+        self.committer = GroupCommitter(writer)
+        """Commits the writes of the writer connection."""
+        self._readers = readers
+        self._idle: asyncio.Queue[Queries] = asyncio.Queue()
+        for reader in readers:
+            self._idle.put_nowait(Queries(reader))
+        metrics.DB_READERS.inc(len(readers))
+
+    @classmethod
+    async def open(cls, path: str, *, readers: int = READERS) -> ConnectionPool:
+        """Opens the connections, switching the database to WAL mode first.
+
+        The schema isn't touched, the database has to be migrated before using `backend.internal.migrations`.
+        """
+        writer = await aiosqlite.connect(path)
+        await writer.execute("PRAGMA journal_mode = WAL")
+        for pragma in _PRAGMAS:
+            await writer.execute(pragma)
+
+        reader_conns: list[aiosqlite.Connection] = []
+        for _ in range(readers):
+            reader = await aiosqlite.connect(path)
+            for pragma in (*_PRAGMAS, "PRAGMA query_only = ON"):
+                await reader.execute(pragma)
+            reader_conns.append(reader)
+        return cls(writer, reader_conns)
+
+    def __len__(self) -> int:
+        return len(self._readers)
+
+    @contextlib.asynccontextmanager
+    async def reader(self) -> AsyncIterator[Queries]:
+        """Borrows the queries of an idle reader connection, waiting for one if every reader is in use."""
+        start = time.perf_counter()
+        queries = await self._idle.get()
+        metrics.DB_READER_WAIT.observe(time.perf_counter() - start)
+        metrics.DB_READERS_IN_USE.inc()
+        try:
+            yield queries
+        finally:
+            metrics.DB_READERS_IN_USE.dec()
+            self._idle.put_nowait(queries)
+
+    async def close(self) -> None:
+        await self.committer.close()
+        for reader in self._readers:
+            await reader.close()
+        metrics.DB_READERS.dec(len(self._readers))
+        self._readers = []
+        await self.writer.close()
+
+
+class PooledQueries(Queries):
+    """`Queries` running read queries on the readers of a pool, everything else uses the writer connection.
+
+    Updates returning rows are run and fetched in one call, because an `UPDATE ... RETURNING` is only finished once its
+    rows were fetched and until then every commit on the writer connection fails.
+
+    Authors: Christopher
+    """
+
+    __slots__ = ("_pool",)
+
+    def __init__(self, pool: ConnectionPool) -> None:
+        super().__init__(pool.writer)
+        self._pool = pool
+
+    @property
+    def pool(self) -> ConnectionPool:
+        return self._pool
+
+    @typing.override
+    async def get_user_by_id(self, *, id_: Snowflake) -> models.User | None:
+        if not len(self._pool):
+            return await super().get_user_by_id(id_=id_)
+        async with self._pool.reader() as reader:
+            return await reader.get_user_by_id(id_=id_)
+
+    @typing.override
+    async def get_user_by_username(self, *, username: str) -> models.User | None:
+        if not len(self._pool):
+            return await super().get_user_by_username(username=username)
+        async with self._pool.reader() as reader:
+            return await reader.get_user_by_username(username=username)
+
+    @typing.override
+    async def add_user_money(self, *, amount: int, id_: Snowflake) -> int | None:
+        rows = list(await self.conn.execute_fetchall(ADD_USER_MONEY, (amount, int(id_))))
+        return rows[0][0] if rows else None
+
+    @typing.override
+    async def debit_user_money(self, *, amount: int, id_: Snowflake) -> int | None:
+        rows = list(await self.conn.execute_fetchall(DEBIT_USER_MONEY, (amount, int(id_), amount, amount)))
+        return rows[0][0] if rows else None
+
+
+async def settle_balances(queries: Queries, payouts: Mapping[Snowflake, int]) -> dict[Snowflake, int]:
+    """Credits the payout of every user with a single `executemany` and returns the new balances of the users.
+
+    The balances are read back in one query in the same transaction, before waiting for the commit.
+
+    Authors: Christopher
+    """
+    if not payouts:
+        return {}
+    conn = queries.conn
+    await conn.executemany(CREDIT_USER_MONEY, [(amount, int(user_id)) for user_id, amount in payouts.items()])
+    placeholders = ", ".join("?" * len(payouts))
+    rows = await conn.execute_fetchall(
+        f"SELECT id, money FROM users WHERE id IN ({placeholders})",  # noqa: S608
+        [int(user_id) for user_id in payouts],
+    )
+    await commit(queries)
+    return {Snowflake(row[0]): row[1] for row in rows}
+
+
+async def commit(queries: Queries) -> None:
+    """Commits the writes made using `queries`, as part of a group commit if `queries` belong to a pool.
+
+    Authors: Christopher
+    """
+    if isinstance(queries, PooledQueries):
+        await queries.pool.committer.commit()
+    else:
+        await queries.conn.commit()
@@ -46,6 +46,7 @@ class WebsocketConnectionError(WebsocketError):
 
 class WebsocketCloseCode(enum.IntEnum):
     PROTOCOL_ERROR = 1_002
+    TRY_AGAIN_LATER = 1_013
 
     UNKNOWN_OPCODE = 4001
     DECODE_ERROR = 4002
@@ -53,6 +54,12 @@ class WebsocketCloseCode(enum.IntEnum):
     AUTHENTICATION_FAILED = 4004
     LOBBY_FULL = 4005
     INVALID_LOBBY = 4006
+    SLOW_CONSUMER = 4007
+    UNSUPPORTED_CODEC = 4008
+    HANDSHAKE_TIMEOUT = 4009
+    HEARTBEAT_TIMEOUT = 4010
+    SESSION_INVALID = 4011
+    RATE_LIMITED = 4012
 
 
 class WebsocketClientClosedConnectionError(WebsocketError):
@@ -0,0 +1,132 @@
+"""Process-wide cache of who a token belongs to and of the identities of users.
+
+Every REST request, websocket handshake and lots of lobby events look up the same few users over and over again. The
+`IdentityCache` keeps verified tokens mapped to their user id until the token expires, and the `Identity` of users
+mapped by their id for `USER_CACHE_TTL` seconds. Both are bounded and evict the least recently used entry once full.
+
+An `Identity` only holds what never changes after a user was created, so writes never have to touch the cache and
+every worker can keep its own. Balances change all the time and are always read from the database, using
+`Queries.get_user_money`.
+
+The sizes and the TTL can be changed by setting `CASINO_TOKEN_CACHE_SIZE`, `CASINO_USER_CACHE_SIZE` and
+`CASINO_USER_CACHE_TTL` in seconds.
+"""
+
+from __future__ import annotations
+
+__all__ = ("TOKEN_CACHE_SIZE", "USER_CACHE_SIZE", "USER_CACHE_TTL", "Identity", "IdentityCache", "identities")
+
+import collections
+import os
+import time
+import typing
+
+import msgspec
+
+from backend.internal import metrics
+from backend.utils import tokens
+from shared.internal import Snowflake  # noqa: TC001
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from backend.db.queries import Queries
+
+TOKEN_CACHE_SIZE: typing.Final[int] = int(os.getenv("CASINO_TOKEN_CACHE_SIZE", "10000"))
+"""Amount of verified tokens that are kept."""
+
+USER_CACHE_SIZE: typing.Final[int] = int(os.getenv("CASINO_USER_CACHE_SIZE", "10000"))
+"""Amount of user identities that are kept."""
+
+USER_CACHE_TTL: typing.Final[float] = float(os.getenv("CASINO_USER_CACHE_TTL", "60"))
+"""Time in seconds an identity is kept after loading it."""
+
+KeyT = typing.TypeVar("KeyT")
+ValueT = typing.TypeVar("ValueT")
+
+
+class Identity(msgspec.Struct, frozen=True):
+    """The parts of a user that never change. This is what the current user dependency of endpoints returns."""
+
+    id: Snowflake
+    username: str
+
+
+class _LRUCache(typing.Generic[KeyT, ValueT]):
+    """Bounded mapping whose entries expire, evicting the least recently used entry once full."""
+
+    __slots__ = ("_clock", "_entries", "_hits", "_max_size", "_misses")
+
+    def __init__(self, name: str, max_size: int, clock: Callable[[], float]) -> None:
+        self._max_size = max_size
+        self._clock = clock
+        self._entries: collections.OrderedDict[KeyT, tuple[float, ValueT]] = collections.OrderedDict()
+        self._hits = metrics.IDENTITY_CACHE_HITS.labels(name)
+        self._misses = metrics.IDENTITY_CACHE_MISSES.labels(name)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: KeyT) -> ValueT | None:
+        if (entry := self._entries.get(key)) is None or entry[0] <= self._clock():
+            if entry is not None:
+                del self._entries[key]
+            self._misses.inc()
+            return None
+        self._entries.move_to_end(key)
+        self._hits.inc()
+        return entry[1]
+
+    def put(self, key: KeyT, value: ValueT, expires_at: float) -> None:
+        """Stores `value` until `expires_at`, in the time of the clock of the cache."""
+        if self._max_size <= 0:
+            return
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+
+class IdentityCache:
+    """Caches verified tokens and identities of users of the worker, only used from the event loop so nothing is
+    locked.
+
+    Authors: Christopher
+    """
+
+    __slots__ = ("_identities", "_tokens", "_user_ttl")
+
+    def __init__(
+        self, *, token_size: int = TOKEN_CACHE_SIZE, user_size: int = USER_CACHE_SIZE, user_ttl: float = USER_CACHE_TTL
+    ) -> None:
+        self._tokens: _LRUCache[str, Snowflake] = _LRUCache("token", token_size, time.time)
+        self._identities: _LRUCache[Snowflake, Identity] = _LRUCache("identity", user_size, time.monotonic)
+        self._user_ttl = user_ttl
+
+    def verify_token(self, token: str) -> Snowflake:
+        """Returns the user id stored in the jwt token, only decoding tokens that weren't verified before.
+
+        Raises `jwt.exceptions.PyJWTError` if the token is invalid or expired.
+        """
+        if (user_id := self._tokens.get(token)) is not None:
+            return user_id
+        user_id, expires_at = tokens.decode_token_with_expiry(token)
+        self._tokens.put(token, user_id, expires_at)
+        return user_id
+
+    async def get_identity(self, user_id: Snowflake, queries: Queries) -> Identity | None:
+        """Returns the identity of a user, loading the user using `queries` if it isn't cached.
+
+        Returns `None` if there is no user with the id, which isn't cached.
+        """
+        if (identity := self._identities.get(user_id)) is not None:
+            return identity
+        if (user := await queries.get_user_by_id(id_=user_id)) is None:
+            return None
+        identity = Identity(id=user.id, username=user.username)
+        self._identities.put(user_id, identity, time.monotonic() + self._user_ttl)
+        return identity
+
+
+identities: typing.Final[IdentityCache] = IdentityCache()
+"""Identity cache of the worker process."""
@@ -0,0 +1,152 @@
+"""Monitoring of the event loop, which runs every lobby and request of a worker.
+
+A sampler task sleeps for `SAMPLE_INTERVAL` seconds and records how much later than expected it woke up as the lag of
+the loop. A watchdog thread notices when the sampler stopped ticking for longer than `STALL_THRESHOLD` seconds, which
+means a callback is blocking the loop, and looks at the stack of the loop thread to find out what is running. The stall
+is attributed to the lobby class and event that are being handled, otherwise to the route of the request that is being
+handled and otherwise to the name of the running task, or the name of its coroutine if the task isn't named. Once the
+loop runs again, the sampler logs and counts the stall.
+
+Only the sampler touches metrics, the watchdog thread merely hands over what it found, so nothing on the event loop
+has to take a lock. The defaults can be overridden by setting `CASINO_LOOP_SAMPLE_INTERVAL` and
+`CASINO_LOOP_STALL_THRESHOLD` in seconds.
+"""
+
+from __future__ import annotations
+
+__all__ = ("SAMPLE_INTERVAL", "STALL_THRESHOLD", "LoopMonitor")
+
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+import typing
+
+import sanic
+from sanic.log import logger
+
+from backend.internal import metrics
+from shared.models import events
+
+if typing.TYPE_CHECKING:
+    import types
+
+SAMPLE_INTERVAL: typing.Final[float] = float(os.getenv("CASINO_LOOP_SAMPLE_INTERVAL", "0.05"))
+"""Interval in seconds in which the lag of the event loop is sampled."""
+
+STALL_THRESHOLD: typing.Final[float] = float(os.getenv("CASINO_LOOP_STALL_THRESHOLD", "0.1"))
+"""Lag in seconds from which on the event loop counts as blocked."""
+
+
+_DEFAULT_TASK_NAME: typing.Final[re.Pattern[str]] = re.compile(r"Task-\d+")
+"""Name asyncio gives tasks that weren't named."""
+
+
+class _Stall(typing.NamedTuple):
+    tick: int
+    """Tick of the sampler the loop was stuck at."""
+    source: str
+    """Lobby and event, route or task that blocked the loop."""
+    location: str
+    """Innermost python frame of the loop thread while it was blocked."""
+
+
+def _attribute(frame: types.FrameType, loop: asyncio.AbstractEventLoop) -> tuple[str, str]:
+    """Finds out what the stack of the loop thread belongs to, returns the source and location of the stall."""
+    code = frame.f_code
+    location = f"{code.co_filename}:{frame.f_lineno} in {code.co_qualname}"
+    current: types.FrameType | None = frame
+    while current is not None:
+        local_vars = current.f_locals
+        if isinstance(event := local_vars.get("event"), events.BaseEvent) and "self" in local_vars:
+            return f"{type(local_vars['self']).__name__}.{event.event_name()}", location
+        if isinstance(request := local_vars.get("request"), sanic.Request) and request.route is not None:
+            return f"{request.method} /{request.route.path}", location
+        current = current.f_back
+    if (task := asyncio.current_task(loop)) is None:
+        return "unknown", location
+    if _DEFAULT_TASK_NAME.fullmatch(name := task.get_name()) is None:
+        return name, location
+    # default names are numbered, every task would get a series of its own
+    return getattr(task.get_coro(), "__qualname__", "unknown"), location
+
+
+class LoopMonitor:
+    """Samples the lag of the event loop and attributes stalls to whatever blocked the loop.
+
+    Authors: Christopher
+    """
+
+    def __init__(self, *, interval: float = SAMPLE_INTERVAL, threshold: float = STALL_THRESHOLD) -> None:
+        self._interval = interval
+        self._threshold = threshold
+        self._tick = 0
+        self._last_tick_at = time.monotonic()
+        self._stall: _Stall | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread = 0
+        self._sampler: asyncio.Task[None] | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    async def start(self, _: sanic.Sanic, loop: asyncio.AbstractEventLoop) -> None:
+        """Starts the sampler and the watchdog, this is registered as a server listener."""
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        self._last_tick_at = time.monotonic()
+        self._stopped.clear()
+        self._sampler = loop.create_task(self._sample(), name="loop_monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop_watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self, _: sanic.Sanic, __: asyncio.AbstractEventLoop) -> None:
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.cancel()
+            await asyncio.gather(self._sampler, return_exceptions=True)
+            self._sampler = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def _sample(self) -> None:
+        while True:
+            expected = time.monotonic() + self._interval
+            await asyncio.sleep(self._interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._tick += 1
+            self._last_tick_at = now
+            metrics.LOOP_LAG.observe(lag)
+            if lag >= self._threshold:
+                self._report(lag)
+
+    def _report(self, lag: float) -> None:
+        """Logs and counts a stall that just ended, using what the watchdog found while it was going on."""
+        stall, self._stall = self._stall, None
+        if stall is None or stall.tick != self._tick - 1:
+            # the stall was shorter than the watchdog interval, so nobody saw what blocked the loop
+            source, location = "unknown", "unknown location"
+        else:
+            source, location = stall.source, stall.location
+        metrics.LOOP_STALLS.labels(source).inc()
+        logger.warning("Event loop was blocked for %.3fs by %s, at %s", lag, source, location)
+
+    def _watch(self) -> None:
+        """Runs in the watchdog thread, looking at the stack of the loop thread whenever the sampler is late."""
+        while not self._stopped.wait(self._threshold / 2):
+            tick = self._tick
+            if time.monotonic() - self._last_tick_at < self._interval + self._threshold:
+                continue
+            if (stall := self._stall) is not None and stall.tick == tick:
+                continue
+            if self._loop is None or (frame := sys._current_frames().get(self._loop_thread)) is None:  # noqa: SLF001
+                continue
+            try:
+                self._stall = _Stall(tick, *_attribute(frame, self._loop))
+            except Exception as exc:  # noqa: BLE001
+                logger.debug("failed attributing a stall of the event loop: %r", exc)
+            finally:
+                del frame
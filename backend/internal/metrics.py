@@ -0,0 +1,354 @@
+"""Lightweight in-process metrics used on the hot paths of the server.
+
+Everything in here is designed to be updated from the event loop without any locking, so an observation is
+nothing more than a few integer increments. Metrics are only formatted when they are scraped, see `render`, which
+returns every metric in the Prometheus text exposition format.
+"""
+
+from __future__ import annotations
+
+__all__ = (
+    "BROADCAST_FANOUT",
+    "BROADCAST_LATENCY",
+    "CLIENTS_CONNECTED",
+    "DB_COMMIT_BATCH_SIZE",
+    "DB_COMMIT_LATENCY",
+    "DB_READERS",
+    "DB_READERS_IN_USE",
+    "DB_READER_WAIT",
+    "HANDLER_LATENCY",
+    "HANDSHAKES",
+    "IDENTITY_CACHE_HITS",
+    "IDENTITY_CACHE_MISSES",
+    "LATENCY_BUCKETS",
+    "LOBBYS_ACTIVE",
+    "LOBBYS_CREATED",
+    "LOBBYS_REAPED",
+    "LOBBYS_REJECTED",
+    "LOOP_LAG",
+    "LOOP_STALLS",
+    "MAILBOX_DEPTH",
+    "MAILBOX_LATENCY",
+    "OUTBOUND_FRAMES_DROPPED",
+    "OUTBOUND_QUEUE_DEPTH",
+    "RATE_LIMITED",
+    "REPLAYED_FRAMES",
+    "REQUEST_LATENCY",
+    "SESSIONS_RESUMED",
+    "SIZE_BUCKETS",
+    "SLOW_CONSUMERS_EVICTED",
+    "Counter",
+    "Family",
+    "Gauge",
+    "Histogram",
+    "render",
+)
+
+import bisect
+import math
+import typing
+
+if typing.TYPE_CHECKING:
+    import collections.abc
+
+MetricT = typing.TypeVar("MetricT", bound="Counter | Gauge | Histogram")
+
+LATENCY_BUCKETS: typing.Final[tuple[float, ...]] = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+"""Default bucket bounds (in seconds) used for latency histograms."""
+
+SIZE_BUCKETS: typing.Final[tuple[float, ...]] = (1, 2, 3, 4, 5, 10, 25, 50, 100, 250)
+"""Default bucket bounds used for histograms counting things, like the amount of clients of a broadcast."""
+
+
+class Counter:
+    """Monotonically increasing counter.
+
+    Authors: Christopher
+    """
+
+    __slots__ = ("_value",)
+
+    def __init__(self) -> None:
+        self._value: int = 0
+
+    def inc(self, amount: int = 1) -> None:
+        """Increase the counter by `amount`."""
+        self._value += amount
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+
+class Gauge:
+    """Value that can go up and down, like the amount of currently open lobbys.
+
+    Authors: Christopher
+    """
+
+    __slots__ = ("_value",)
+
+    def __init__(self) -> None:
+        self._value: int = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self._value += amount
+
+    def dec(self, amount: int = 1) -> None:
+        self._value -= amount
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+
+class Histogram:
+    """Histogram with a fixed set of buckets.
+
+    The buckets are allocated once when the histogram is created, so observing a value never allocates.
+
+    Authors: Christopher
+    """
+
+    __slots__ = ("_bounds", "_count", "_counts", "_sum")
+
+    def __init__(self, bounds: collections.abc.Sequence[float] = LATENCY_BUCKETS) -> None:
+        self._bounds: tuple[float, ...] = tuple(sorted(bounds))
+        self._counts: list[int] = [0] * (len(self._bounds) + 1)
+        self._count: int = 0
+        self._sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        """Record a single value."""
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self._count += 1
+        self._sum += value
+
+    @property
+    def count(self) -> int:
+        """Amount of values that were observed."""
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        """Sum of every observed value."""
+        return self._sum
+
+    def buckets(self) -> list[tuple[float, int]]:
+        """Returns the cumulative count for each bucket upper bound, the last bound is always `inf`."""
+        result: list[tuple[float, int]] = []
+        total = 0
+        for bound, count in zip((*self._bounds, float("inf")), self._counts, strict=True):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Family(typing.Generic[MetricT]):
+    """A metric that is tracked separately for every value of a label, e.g. per game mode.
+
+    Authors: Christopher
+    """
+
+    __slots__ = ("_factory", "_metrics", "label")
+
+    def __init__(self, label: str, factory: collections.abc.Callable[[], MetricT]) -> None:
+        self.label = label
+        """Name of the label the metrics are separated by."""
+        self._factory = factory
+        self._metrics: dict[str, MetricT] = {}
+
+    def labels(self, value: str) -> MetricT:
+        """Returns the metric for a label value, creating it if needed. Keep the returned metric around."""
+        if (metric := self._metrics.get(value)) is None:
+            metric = self._metrics[value] = self._factory()
+        return metric
+
+    def items(self) -> list[tuple[str, MetricT]]:
+        return list(self._metrics.items())
+
+
+BROADCAST_LATENCY: typing.Final[Histogram] = Histogram()
+"""Time it took to encode an event and hand it to every client of a lobby."""
+
+BROADCAST_FANOUT: typing.Final[Histogram] = Histogram(SIZE_BUCKETS)
+"""Amount of clients each broadcast was sent to."""
+
+OUTBOUND_QUEUE_DEPTH: typing.Final[Histogram] = Histogram(SIZE_BUCKETS)
+"""Depth of a client outbound queue right after a frame got queued."""
+
+OUTBOUND_FRAMES_DROPPED: typing.Final[Counter] = Counter()
+"""Amount of superseded frames that were dropped from full outbound queues."""
+
+SLOW_CONSUMERS_EVICTED: typing.Final[Counter] = Counter()
+"""Amount of clients that got disconnected, because they could not keep up with their outbound queue."""
+
+SESSIONS_RESUMED: typing.Final[Counter] = Counter()
+"""Amount of sessions that were resumed after their connection dropped."""
+
+REPLAYED_FRAMES: typing.Final[Counter] = Counter()
+"""Amount of frames that were replayed to resumed sessions."""
+
+MAILBOX_DEPTH: typing.Final[Family[Histogram]] = Family("game", lambda: Histogram(SIZE_BUCKETS))
+"""Depth of a lobby mailbox right after an event got posted, per game mode."""
+
+MAILBOX_LATENCY: typing.Final[Family[Histogram]] = Family("game", Histogram)
+"""Time between posting an event into a lobby mailbox and handling it, per game mode."""
+
+LOBBYS_CREATED: typing.Final[Family[Counter]] = Family("game", Counter)
+"""Amount of lobbys that were created, per game mode."""
+
+LOBBYS_REAPED: typing.Final[Family[Counter]] = Family("game", Counter)
+"""Amount of lobbys that were removed after being empty for too long, per game mode."""
+
+LOBBYS_ACTIVE: typing.Final[Family[Gauge]] = Family("game", Gauge)
+"""Amount of lobbys currently open, per game mode."""
+
+LOBBYS_REJECTED: typing.Final[Counter] = Counter()
+"""Amount of lobby creations that were rejected, because the worker reached its lobby limit."""
+
+RATE_LIMITED: typing.Final[Family[Counter]] = Family("limit", Counter)
+"""Amount of requests, handshakes and events that were rejected by a rate limit, per limit."""
+
+HANDLER_LATENCY: typing.Final[Family[Histogram]] = Family("event", Histogram)
+"""Time it took to run every listener of an event, per event type."""
+
+CLIENTS_CONNECTED: typing.Final[Family[Gauge]] = Family("game", Gauge)
+"""Amount of clients currently in a lobby, including the ones waiting to resume their session, per game mode."""
+
+HANDSHAKES: typing.Final[Family[Counter]] = Family("result", Counter)
+"""Amount of websocket handshakes, per result. The result is `OK`, the name of the `WebsocketCloseCode` the server
+closed the connection with, or `CLOSED` if the connection ended without the server closing it.
+"""
+
+REQUEST_LATENCY: typing.Final[Family[Histogram]] = Family("route", Histogram)
+"""Time it took to respond to a REST request, per method and route."""
+
+LOOP_LAG: typing.Final[Histogram] = Histogram()
+"""How much later than expected the event loop monitor woke up, see `backend.internal.loop_monitor`."""
+
+LOOP_STALLS: typing.Final[Family[Counter]] = Family("source", Counter)
+"""Amount of times the event loop was blocked for longer than the stall threshold, per lobby and event, route or task
+that blocked it.
+"""
+
+IDENTITY_CACHE_HITS: typing.Final[Family[Counter]] = Family("cache", Counter)
+"""Amount of lookups answered by the identity cache, per cache, see `backend.internal.identity`."""
+
+IDENTITY_CACHE_MISSES: typing.Final[Family[Counter]] = Family("cache", Counter)
+"""Amount of lookups the identity cache couldn't answer, per cache."""
+
+DB_READERS: typing.Final[Gauge] = Gauge()
+"""Amount of reader connections of the database pool."""
+
+DB_READERS_IN_USE: typing.Final[Gauge] = Gauge()
+"""Amount of reader connections of the database pool that are currently running a query."""
+
+DB_READER_WAIT: typing.Final[Histogram] = Histogram()
+"""Time spent waiting for an idle reader connection of the database pool."""
+
+DB_COMMIT_BATCH_SIZE: typing.Final[Histogram] = Histogram(SIZE_BUCKETS)
+"""Amount of commit requests that were committed together by the group committer."""
+
+DB_COMMIT_LATENCY: typing.Final[Histogram] = Histogram()
+"""Time between requesting a commit and the group it was part of being committed."""
+
+_EXPORTED: typing.Final[tuple[tuple[str, str, Counter | Gauge | Histogram | Family[typing.Any]], ...]] = (
+    ("casino_broadcast_latency_seconds", "Time it took to encode and queue a broadcast.", BROADCAST_LATENCY),
+    ("casino_broadcast_fanout_clients", "Amount of clients each broadcast was sent to.", BROADCAST_FANOUT),
+    ("casino_outbound_queue_depth", "Depth of client outbound queues after queueing a frame.", OUTBOUND_QUEUE_DEPTH),
+    ("casino_outbound_frames_dropped_total", "Superseded frames dropped from full queues.", OUTBOUND_FRAMES_DROPPED),
+    ("casino_slow_consumers_evicted_total", "Clients disconnected for not keeping up.", SLOW_CONSUMERS_EVICTED),
+    ("casino_sessions_resumed_total", "Sessions resumed after their connection dropped.", SESSIONS_RESUMED),
+    ("casino_replayed_frames_total", "Frames replayed to resumed sessions.", REPLAYED_FRAMES),
+    ("casino_mailbox_depth", "Depth of lobby mailboxes after posting an event.", MAILBOX_DEPTH),
+    ("casino_mailbox_latency_seconds", "Time events waited in lobby mailboxes.", MAILBOX_LATENCY),
+    ("casino_event_handler_latency_seconds", "Time it took to run the listeners of an event.", HANDLER_LATENCY),
+    ("casino_lobbys_created_total", "Lobbys created.", LOBBYS_CREATED),
+    ("casino_lobbys_reaped_total", "Lobbys removed after being empty for too long.", LOBBYS_REAPED),
+    ("casino_lobbys_active", "Lobbys currently open.", LOBBYS_ACTIVE),
+    ("casino_lobbys_rejected_total", "Lobby creations rejected because of the lobby limit.", LOBBYS_REJECTED),
+    ("casino_clients_connected", "Clients currently in a lobby.", CLIENTS_CONNECTED),
+    ("casino_websocket_handshakes_total", "Websocket handshakes by result.", HANDSHAKES),
+    ("casino_rate_limited_total", "Requests, handshakes and events rejected by a rate limit.", RATE_LIMITED),
+    ("casino_http_request_latency_seconds", "Time it took to respond to REST requests.", REQUEST_LATENCY),
+    ("casino_event_loop_lag_seconds", "How much later than expected the event loop ran a timer.", LOOP_LAG),
+    ("casino_db_readers", "Reader connections of the database pool.", DB_READERS),
+    ("casino_db_readers_in_use", "Reader connections currently running a query.", DB_READERS_IN_USE),
+    ("casino_db_reader_wait_seconds", "Time spent waiting for an idle reader connection.", DB_READER_WAIT),
+    ("casino_db_commit_batch_size", "Commit requests committed together.", DB_COMMIT_BATCH_SIZE),
+    ("casino_db_commit_latency_seconds", "Time until a requested commit finished.", DB_COMMIT_LATENCY),
+    ("casino_identity_cache_hits_total", "Lookups answered by the identity cache.", IDENTITY_CACHE_HITS),
+    ("casino_identity_cache_misses_total", "Lookups the identity cache couldn't answer.", IDENTITY_CACHE_MISSES),
+    ("casino_event_loop_stalls_total", "Times the event loop was blocked, by what blocked it.", LOOP_STALLS),
+)
+"""Every metric exported by `render`, as (name, help, metric)."""
+
+_LABEL_ESCAPES: typing.Final[dict[int, str]] = {ord("\\"): "\\\\", ord("\n"): "\\n", ord('"'): '\\"'}
+
+
+def _format_labels(labels: collections.abc.Mapping[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value.translate(_LABEL_ESCAPES)}"' for name, value in labels.items()) + "}"
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if math.isinf(bound) else repr(float(bound))
+
+
+def _render_metric(
+    lines: list[str], name: str, metric: Counter | Gauge | Histogram, labels: collections.abc.Mapping[str, str]
+) -> None:
+    if isinstance(metric, Histogram):
+        for bound, count in metric.buckets():
+            lines.append(f"{name}_bucket{_format_labels({**labels, 'le': _format_bound(bound)})} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {metric.sum!r}")
+        lines.append(f"{name}_count{_format_labels(labels)} {metric.count}")
+    else:
+        lines.append(f"{name}{_format_labels(labels)} {metric.value}")
+
+
+def _kind(metric: Counter | Gauge | Histogram) -> str:
+    if isinstance(metric, Histogram):
+        return "histogram"
+    return "gauge" if isinstance(metric, Gauge) else "counter"
+
+
+def render(labels: collections.abc.Mapping[str, str] | None = None) -> str:
+    """Returns every metric in the Prometheus text exposition format, with `labels` added to every sample.
+
+    Families without any labelled metric yet are left out, because their type can't be told without one.
+
+    Authors: Christopher
+    """
+    labels = labels or {}
+    lines: list[str] = []
+    for name, description, metric in _EXPORTED:
+        children = (
+            [({**labels, metric.label: value}, child) for value, child in metric.items()]
+            if isinstance(metric, Family)
+            else [(labels, metric)]
+        )
+        if not children:
+            continue
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {_kind(children[0][1])}")
+        for child_labels, child in children:
+            _render_metric(lines, name, child, child_labels)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,161 @@
+"""Versioned migrations of the database schema.
+
+Migrations are the SQL scripts in `db/migrations`, named `<version>_<name>.sql`. The version of the database is stored
+in `PRAGMA user_version` and is the version of the last migration applied, so starting the server only runs the
+migrations that are newer than the database. Every migration runs in a transaction of its own together with bumping
+the version, a migration that fails leaves the database at the version before it.
+
+How long every migration took is stored in the `schema_migrations` table. The server migrates the database once in
+its main process before starting the workers, migrations that take long, e.g. creating an index on a large table, can
+be applied beforehand while the server is still running the previous version, using
+`uv run -m backend.internal.migrations`.
+
+Authors: Christopher
+"""
+
+from __future__ import annotations
+
+__all__ = ("MIGRATIONS_DIR", "AppliedMigration", "Migration", "load", "migrate", "pending", "schema_version")
+
+import argparse
+import datetime
+import pathlib
+import re
+import sqlite3
+import time
+import typing
+
+import msgspec
+from sanic.log import logger
+
+from backend.internal import database
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Sequence
+
+MIGRATIONS_DIR: typing.Final[pathlib.Path] = pathlib.Path(__file__).parent.parent.parent / "db" / "migrations"
+
+_FILE_NAME: typing.Final[re.Pattern[str]] = re.compile(r"(?P<version>\d+)_(?P<name>\w+)\.sql")
+
+_CREATE_HISTORY: typing.Final[str] = """
+CREATE TABLE IF NOT EXISTS schema_migrations
+(
+    version     INTEGER PRIMARY KEY NOT NULL,
+    name        TEXT NOT NULL,
+    applied_at  TEXT NOT NULL,
+    duration_ms REAL NOT NULL
+)
+"""
+
+_INSERT_HISTORY: typing.Final[str] = (
+    "INSERT OR REPLACE INTO schema_migrations(version, name, applied_at, duration_ms) VALUES (?, ?, ?, ?)"
+)
+
+
+class Migration(msgspec.Struct, frozen=True):
+    version: int
+    name: str
+    sql: str
+
+
+class AppliedMigration(msgspec.Struct, frozen=True):
+    version: int
+    name: str
+    duration_ms: float
+
+
+def load(directory: pathlib.Path = MIGRATIONS_DIR) -> list[Migration]:
+    """Reads every migration of `directory`, sorted by version.
+
+    Raises `ValueError` if a file name doesn't follow `<version>_<name>.sql` or two migrations share a version.
+    """
+    migrations: dict[int, Migration] = {}
+    for path in directory.glob("*.sql"):
+        if (match := _FILE_NAME.fullmatch(path.name)) is None:
+            msg = f"Migration {path.name} isn't named <version>_<name>.sql"
+            raise ValueError(msg)
+        version = int(match["version"])
+        if (other := migrations.get(version)) is not None:
+            msg = f"Migrations {other.name} and {match['name']} both have version {version}"
+            raise ValueError(msg)
+        migrations[version] = Migration(version=version, name=match["name"], sql=path.read_text())
+    return [migrations[version] for version in sorted(migrations)]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """Returns the version of the last migration applied to the database, 0 for a new database."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def pending(conn: sqlite3.Connection, migrations: Sequence[Migration]) -> list[Migration]:
+    """Returns the migrations that are newer than the database."""
+    version = schema_version(conn)
+    return [migration for migration in migrations if migration.version > version]
+
+
+def _apply(conn: sqlite3.Connection, migration: Migration) -> AppliedMigration:
+    start = time.perf_counter()
+    try:
+        # the script opens the transaction, `executescript` would commit one opened before
+        conn.executescript(f"BEGIN IMMEDIATE;\n{migration.sql}")
+        duration_ms = (time.perf_counter() - start) * 1_000
+        conn.execute(
+            _INSERT_HISTORY,
+            (migration.version, migration.name, datetime.datetime.now(datetime.UTC).isoformat(), duration_ms),
+        )
+        conn.execute(f"PRAGMA user_version = {migration.version:d}")
+        conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    return AppliedMigration(version=migration.version, name=migration.name, duration_ms=duration_ms)
+
+
+def migrate(path: str, migrations: Sequence[Migration]) -> list[AppliedMigration]:
+    """Applies every pending migration to the database at `path` in order and returns how long each of them took."""
+    applied: list[AppliedMigration] = []
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA busy_timeout = 5000")
+        conn.execute(_CREATE_HISTORY)
+        conn.commit()
+        version = schema_version(conn)
+        if migrations and version > migrations[-1].version:
+            logger.warning(
+                "Database is at version %d, newer than the latest migration %d", version, migrations[-1].version
+            )
+        for migration in pending(conn, migrations):
+            applied.append(result := _apply(conn, migration))
+            logger.info("Applied migration %04d_%s in %.1fms", result.version, result.name, result.duration_ms)
+    finally:
+        conn.close()
+    return applied
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-d", "--database", default=database.DATABASE_PATH, help="path of the database file")
+    parser.add_argument("--status", action="store_true", help="only list the pending migrations")
+    args = parser.parse_args()
+
+    migrations = load()
+    if args.status:
+        conn = sqlite3.connect(args.database)
+        try:
+            print(f"database is at version {schema_version(conn)}")  # noqa: T201
+            for migration in pending(conn, migrations):
+                print(f"pending: {migration.version:04d}_{migration.name}")  # noqa: T201
+        finally:
+            conn.close()
+        return
+
+    applied = migrate(args.database, migrations)
+    for result in applied:
+        print(f"applied {result.version:04d}_{result.name} in {result.duration_ms:.1f}ms")  # noqa: T201
+    if not applied:
+        print("database is up to date")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
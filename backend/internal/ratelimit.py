@@ -0,0 +1,171 @@
+"""Token bucket rate limiting of REST endpoints, websocket handshakes and events.
+
+Every key (a remote address, a user id, ...) has a bucket that holds up to `RateLimit.burst` tokens and is refilled
+with `RateLimit.rate` tokens per second. Each request takes one token, requests arriving at an empty bucket are
+rejected. Buckets are only stored while they are not full, the ones that refilled completely are dropped by a sweep,
+so idle keys don't take any memory.
+
+Limits are per worker process. The default limit of every named limiter can be overridden by setting the
+environment variable `CASINO_RATE_LIMIT_<NAME>` to `<rate>/<burst>`, e.g. `CASINO_RATE_LIMIT_LOGIN=0.5/10`.
+"""
+
+from __future__ import annotations
+
+__all__ = ("RateLimit", "RateLimiter", "limiter", "rate_limit", "remote_address", "too_many_requests")
+
+import functools
+import http
+import math
+import os
+import time
+import typing
+
+import msgspec
+import sanic
+
+from backend.internal import identity
+from backend.internal import metrics
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Awaitable
+    from collections.abc import Callable
+    from collections.abc import Hashable
+
+P = typing.ParamSpec("P")
+R = typing.TypeVar("R")
+
+_ENV_PREFIX: typing.Final[str] = "CASINO_RATE_LIMIT_"
+
+
+class RateLimit(msgspec.Struct, frozen=True):
+    """Allows `burst` requests at once and `rate` requests per second after that."""
+
+    rate: float
+    burst: int
+
+    def __post_init__(self) -> None:
+        if not self.rate > 0:
+            msg = f"Rate of a rate limit has to be greater than 0, got {self.rate}"
+            raise ValueError(msg)
+        if self.burst < 1:
+            msg = f"Burst of a rate limit has to be at least 1, got {self.burst}"
+            raise ValueError(msg)
+
+    @classmethod
+    def parse(cls, value: str) -> RateLimit:
+        """Parses a limit in the form `<rate>/<burst>`. Raises `ValueError` if `value` isn't a valid limit."""
+        rate, _, burst = value.partition("/")
+        try:
+            return cls(rate=float(rate), burst=int(burst))
+        except ValueError as exc:
+            msg = f"Invalid rate limit {value!r}, expected <rate>/<burst> with a rate above 0 and a burst of at least 1"
+            raise ValueError(msg) from exc
+
+
+class RateLimiter:
+    """Token buckets of every key limited by the same `RateLimit`.
+
+    Authors: Christopher
+    """
+
+    __slots__ = ("_buckets", "_last_sweep", "_rejected", "_sweep_interval", "limit")
+
+    def __init__(self, limit: RateLimit, *, name: str) -> None:
+        self.limit = limit
+        # (tokens, monotonic timestamp of the last update) of every bucket that is not full
+        self._buckets: dict[Hashable, tuple[float, float]] = {}
+        self._last_sweep = time.monotonic()
+        # after this time every bucket refilled, so a sweep drops every bucket that wasn't used since the last one
+        self._sweep_interval = limit.burst / limit.rate
+        self._rejected = metrics.RATE_LIMITED.labels(name)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def acquire(self, key: Hashable) -> float:
+        """Takes a token from the bucket of `key`.
+
+        Returns 0 if the request is allowed, otherwise the time in seconds until the next token is available.
+        """
+        now = time.monotonic()
+        if now - self._last_sweep >= self._sweep_interval:
+            self._sweep(now)
+
+        tokens = float(self.limit.burst)
+        if (bucket := self._buckets.get(key)) is not None:
+            tokens = min(tokens, bucket[0] + (now - bucket[1]) * self.limit.rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            self._rejected.inc()
+            return (1 - tokens) / self.limit.rate
+        self._buckets[key] = (tokens - 1, now)
+        return 0.0
+
+    def _sweep(self, now: float) -> None:
+        """Drops every bucket that refilled completely."""
+        rate, burst = self.limit.rate, self.limit.burst
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items() if bucket[0] + (now - bucket[1]) * rate < burst
+        }
+        self._last_sweep = now
+
+
+_limiters: dict[str, RateLimiter] = {}
+
+
+def limiter(name: str, default: RateLimit) -> RateLimiter:
+    """Returns the limiter called `name`, creating it with `default` or the limit from the environment on first use.
+
+    Raises `ValueError` if the limit from the environment is invalid, so create limiters at startup.
+
+    Authors: Christopher
+    """
+    if (rate_limiter := _limiters.get(name)) is None:
+        env_var = _ENV_PREFIX + name.upper()
+        try:
+            limit = RateLimit.parse(override) if (override := os.getenv(env_var)) else default
+        except ValueError as exc:
+            msg = f"{env_var}: {exc}"
+            raise ValueError(msg) from exc
+        rate_limiter = _limiters[name] = RateLimiter(limit, name=name)
+    return rate_limiter
+
+
+def remote_address(request: sanic.Request) -> str:
+    """Address of the client, taking the forwarded address into account if proxies are configured."""
+    return request.remote_addr or request.ip
+
+
+def too_many_requests(retry_after: float) -> sanic.SanicException:
+    return sanic.SanicException(
+        message="Too many requests, try again later.",
+        status_code=http.HTTPStatus.TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(math.ceil(retry_after))},
+    )
+
+
+def rate_limit(name: str, default: RateLimit) -> Callable[[Callable[P, Awaitable[R]]], Callable[P, Awaitable[R]]]:
+    """Decorator limiting how often a client can call an endpoint, rejecting further requests with 429.
+
+    Requests are limited by remote address and, if the endpoint is injected the current user, by user as well.
+
+    Authors: Christopher
+    """
+
+    def decorator(func: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+        # created when the endpoint is defined, so an invalid limit in the environment fails the startup
+        rate_limiter = limiter(name, default)
+
+        @functools.wraps(func)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            request = next(arg for arg in args if isinstance(arg, sanic.Request))
+            retry_after = rate_limiter.acquire(remote_address(request))
+            if not retry_after and isinstance(user := kwargs.get("user"), identity.Identity):
+                retry_after = rate_limiter.acquire(user.id)
+            if retry_after:
+                raise too_many_requests(retry_after)
+            return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,199 @@
+"""Unix socket broker connecting the worker processes of the server.
+
+Every worker listens on its own unix socket. Other workers use it to list the lobbys owned by the worker, to relay
+websocket connections to lobbys owned by the worker and to pass on changes of their lobbys to the subscribers of the
+lobby directory connected to the worker. Changes carry the version of the listing of the sending worker, so workers
+know whether the listings they cached from each other are still up to date.
+
+Everything sent over a broker connection is a frame, which is a single byte for the kind of the frame followed by the
+length of the data and the data itself. A connection starts with a MESSAGE frame containing a request. For relays
+the connection then carries TEXT, BINARY and CLOSE frames of the relayed websocket connection.
+"""
+
+from __future__ import annotations
+
+__all__ = (
+    "Broker",
+    "DirectoryChanges",
+    "FrameKind",
+    "ListLobbysRequest",
+    "ListLobbysResponse",
+    "RelayRequest",
+    "decode_close",
+    "encode_close",
+    "read_frame",
+    "write_frame",
+)
+
+import asyncio
+import contextlib
+import enum
+import struct
+import typing
+
+import msgspec
+from sanic.log import logger
+
+from shared.models import events  # noqa: TC001
+from shared.models import responses  # noqa: TC001
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Awaitable
+    from collections.abc import Callable
+
+    ListHandlerT = Callable[[str], "ListLobbysResponse"]
+    RelayHandlerT = Callable[[str, str, asyncio.StreamReader, asyncio.StreamWriter], Awaitable[None]]
+    ChangesHandlerT = Callable[["DirectoryChanges"], Awaitable[None]]
+
+_FRAME_HEADER: typing.Final[struct.Struct] = struct.Struct("!BI")
+_CLOSE_CODE: typing.Final[struct.Struct] = struct.Struct("!H")
+
+
+class FrameKind(enum.IntEnum):
+    TEXT = 0
+    BINARY = 1
+    CLOSE = 2
+    """Data is the close code followed by the utf-8 encoded reason."""
+    MESSAGE = 3
+    """Data is a msgpack encoded broker message."""
+
+
+class ListLobbysRequest(msgspec.Struct, tag="list_lobbys"):
+    game: str
+
+
+class ListLobbysResponse(msgspec.Struct, tag="lobbys"):
+    version: int
+    """Version of the listing, changes whenever the lobbys change."""
+    lobbys: list[responses.PublicGameLobby]
+    """Lobbys sorted by id."""
+
+
+class RelayRequest(msgspec.Struct, tag="relay"):
+    game: str
+    lobby_id: str
+
+
+class DirectoryChanges(msgspec.Struct, tag="directory_changes"):
+    game: str
+    shard: int
+    """Index of the shard the changed lobbys belong to."""
+    version: int
+    """Version of the listing of the shard after the changes."""
+    changes: list[events.LobbyCreated | events.LobbyUpdated | events.LobbyRemoved]
+
+
+_BrokerMessage = ListLobbysRequest | ListLobbysResponse | RelayRequest | DirectoryChanges
+_encoder = msgspec.msgpack.Encoder()
+_decoder = msgspec.msgpack.Decoder(_BrokerMessage)
+
+
+async def write_frame(writer: asyncio.StreamWriter, kind: FrameKind, data: bytes) -> None:
+    writer.write(_FRAME_HEADER.pack(kind, len(data)) + data)
+    await writer.drain()
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[FrameKind, bytes]:
+    """Reads the next frame, raises `asyncio.IncompleteReadError` if the connection was closed."""
+    kind, size = _FRAME_HEADER.unpack(await reader.readexactly(_FRAME_HEADER.size))
+    return FrameKind(kind), await reader.readexactly(size)
+
+
+def encode_close(code: int, reason: str) -> bytes:
+    return _CLOSE_CODE.pack(code) + reason.encode()
+
+
+def decode_close(data: bytes) -> tuple[int, str]:
+    (code,) = _CLOSE_CODE.unpack_from(data)
+    return code, data[_CLOSE_CODE.size :].decode()
+
+
+class Broker:
+    """Serves the unix socket of the current worker and connects to the sockets of other workers.
+
+    Authors: Christopher
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        *,
+        list_handler: ListHandlerT,
+        relay_handler: RelayHandlerT,
+        changes_handler: ChangesHandlerT,
+    ) -> None:
+        self._socket_path = socket_path
+        self._list_handler = list_handler
+        self._relay_handler = relay_handler
+        self._changes_handler = changes_handler
+        self._server: asyncio.Server | None = None
+        self._connections: set[asyncio.StreamWriter] = set()
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_unix_server(self._handle_connection, path=self._socket_path)
+        logger.debug("broker listening on %s", self._socket_path)
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # relays stay open as long as their websocket connection, which would block waiting for the server
+            for writer in self._connections:
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(writer)
+        try:
+            kind, data = await read_frame(reader)
+            if kind is not FrameKind.MESSAGE:
+                logger.warning("broker connection started with a %s frame, closing it", kind.name)
+                return
+            request = _decoder.decode(data)
+            if isinstance(request, ListLobbysRequest):
+                response = self._list_handler(request.game)
+                await write_frame(writer, FrameKind.MESSAGE, _encoder.encode(response))
+            elif isinstance(request, RelayRequest):
+                await self._relay_handler(request.game, request.lobby_id, reader, writer)
+            elif isinstance(request, DirectoryChanges):
+                await self._changes_handler(request)
+        except (asyncio.IncompleteReadError, ConnectionError, msgspec.DecodeError) as exc:
+            logger.debug("broker connection failed: %r", exc)
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    @staticmethod
+    async def list_lobbys(socket_path: str, game: str) -> ListLobbysResponse:
+        """Asks the worker listening on `socket_path` for its lobbys of a game mode."""
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        try:
+            await write_frame(writer, FrameKind.MESSAGE, _encoder.encode(ListLobbysRequest(game=game)))
+            _, data = await read_frame(reader)
+        finally:
+            writer.close()
+        response = _decoder.decode(data)
+        if not isinstance(response, ListLobbysResponse):
+            msg = f"expected a list of lobbys, received {type(response).__name__}"
+            raise TypeError(msg)
+        return response
+
+    @staticmethod
+    async def send_changes(socket_path: str, message: DirectoryChanges) -> None:
+        """Sends changes of lobbys to the worker listening on `socket_path`."""
+        _, writer = await asyncio.open_unix_connection(socket_path)
+        try:
+            await write_frame(writer, FrameKind.MESSAGE, _encoder.encode(message))
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def open_relay(
+        socket_path: str, game: str, lobby_id: str
+    ) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Opens a connection to the worker listening on `socket_path`, which relays frames to one of its lobbys."""
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        await write_frame(writer, FrameKind.MESSAGE, _encoder.encode(RelayRequest(game=game, lobby_id=lobby_id)))
+        return reader, writer
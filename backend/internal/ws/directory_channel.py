@@ -0,0 +1,135 @@
+"""Websocket channel pushing the changes of the lobbys of a game mode to subscribed clients.
+
+Clients connect to `/<game>/directory` using the usual handshake. After READY they receive a `LobbyList` with every
+lobby, followed by `LobbyCreated`, `LobbyUpdated` and `LobbyRemoved` events whenever the lobbys change.
+
+Changes are collected for `LobbyChangeBuffer.coalesce_window` seconds and sent at once, multiple changes of a lobby
+within the window result in a single event. With multiple workers the coalesced changes are also sent to the other
+workers, which pass them on to their own subscribers.
+"""
+
+from __future__ import annotations
+
+__all__ = ("DIRECTORY_LOBBY_ID", "LobbyChangeBuffer", "LobbyChangeT", "LobbyDirectoryChannel")
+
+import asyncio
+import typing
+
+from sanic.log import logger
+
+from backend.internal.ws.decorator import add_event_listener
+from backend.internal.ws.game_lobby import GameLobbyBase
+from shared.models import events
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Awaitable
+    from collections.abc import Callable
+    from collections.abc import Coroutine
+
+    from backend.db.queries import Queries
+    from backend.internal.ws.websocket_client import WebsocketClient
+    from shared.models import responses
+
+type LobbyChangeT = events.LobbyCreated | events.LobbyUpdated | events.LobbyRemoved
+
+DIRECTORY_LOBBY_ID: typing.Final[str] = "00000"
+"""Id of every directory channel, it is only used in logs because channels are not looked up by id."""
+
+
+def _lobby_id_of(change: LobbyChangeT) -> str:
+    if isinstance(change, events.LobbyRemoved):
+        return change.lobby_id
+    return change.lobby.id
+
+
+def _coalesce(previous: LobbyChangeT, change: LobbyChangeT) -> LobbyChangeT | None:
+    """Combines two changes of the same lobby into one, None if they cancel each other out."""
+    if isinstance(previous, events.LobbyCreated):
+        if isinstance(change, events.LobbyRemoved):
+            return None
+        return events.LobbyCreated(lobby=change.lobby)
+    if isinstance(previous, events.LobbyRemoved) and isinstance(change, events.LobbyCreated):
+        # subscribers still know the lobby, so for them it was only updated
+        return events.LobbyUpdated(lobby=change.lobby)
+    return change
+
+
+class LobbyChangeBuffer:
+    """Collects the changes of the lobbys of a game mode and passes them on coalesced.
+
+    Authors: Christopher
+    """
+
+    coalesce_window: typing.ClassVar[float] = 0.25
+    """Time in seconds changes are collected for, before they are sent."""
+
+    def __init__(self, flush: Callable[[list[LobbyChangeT]], Coroutine[typing.Any, typing.Any, None]]) -> None:
+        self._flush_callback = flush
+        self._pending: dict[str, LobbyChangeT] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._flush_tasks: set[asyncio.Task[None]] = set()
+
+    def publish(self, change: LobbyChangeT) -> None:
+        lobby_id = _lobby_id_of(change)
+        coalesced: LobbyChangeT | None = change
+        if (previous := self._pending.pop(lobby_id, None)) is not None:
+            coalesced = _coalesce(previous, change)
+        if coalesced is not None:
+            self._pending[lobby_id] = coalesced
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.coalesce_window, self._flush)
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        if not self._pending:
+            return
+        changes = list(self._pending.values())
+        self._pending.clear()
+        task = asyncio.create_task(self._flush_callback(changes), name="lobby_directory_flush")
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: asyncio.Task[None]) -> None:
+        self._flush_tasks.discard(task)
+        if not task.cancelled() and (exc := task.exception()) is not None:
+            logger.exception("Exception occurred when sending lobby changes", exc_info=exc)
+
+
+class LobbyDirectoryChannel(GameLobbyBase):
+    """Lobby whose clients are subscribers of the lobby directory of a game mode.
+
+    Subscribers don't take a place in any game, so the channel has a much higher client limit than a game lobby.
+
+    Authors: Christopher
+    """
+
+    max_subscribers: typing.ClassVar[int] = 10_000
+
+    def __init__(self, *, lobby_id: str, queries: Queries) -> None:
+        super().__init__(lobby_id=lobby_id, queries=queries)
+        self._snapshot: Callable[[], Awaitable[list[responses.PublicGameLobby]]] | None = None
+
+    def set_snapshot(self, snapshot: Callable[[], Awaitable[list[responses.PublicGameLobby]]]) -> None:
+        """Sets the function returning every lobby, which is sent to new subscribers."""
+        self._snapshot = snapshot
+
+    @add_event_listener(events.ReadyEvent)
+    async def on_subscribe(self, _: events.ReadyEvent, client: WebsocketClient) -> None:
+        lobbys = await self._snapshot() if self._snapshot is not None else []
+        await self.send_event(events.LobbyList(lobbys=lobbys), client)
+
+    async def broadcast_changes(self, changes: list[LobbyChangeT]) -> None:
+        if not self._clients:
+            return
+        for change in changes:
+            await self.broadcast_event(change)
+
+    @staticmethod
+    @typing.override
+    def endpoint() -> str:
+        return "directory"
+
+    @property
+    @typing.override
+    def max_num_clients(self) -> int:
+        return self.max_subscribers
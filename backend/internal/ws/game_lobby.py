@@ -3,40 +3,75 @@ from __future__ import annotations
 __all__ = ("EventT", "GameLobbyBase")
 
 import abc
+import asyncio
+import collections
 import inspect
+import time
 import typing
 
-import msgspec
 from sanic.log import logger
 
+from backend.internal import identity
+from backend.internal import metrics
+from backend.internal.errors import WebsocketCloseCode
+from backend.internal.ratelimit import RateLimit
+from backend.internal.ratelimit import RateLimiter
+from backend.internal.ws.scheduler import SCHEDULER
+from backend.internal.ws.scheduler import Mailbox
+from backend.internal.ws.websocket_client import OverflowPolicy
 from shared.internal import Snowflake
-from shared.internal.hooks import decode_hook
-from shared.internal.hooks import encode_hook
+from shared.internal import codecs
+from shared.internal import listeners
 from shared.models import events
+from shared.models.internal import DispatchPayload
+from shared.models.internal import ResumedData
+from shared.models.internal import ResumedPayload
 
 EventT = typing.TypeVar("EventT", bound=events.BaseEvent)
+ResultT = typing.TypeVar("ResultT")
+ArgsT = typing.TypeVarTuple("ArgsT")
 
 if typing.TYPE_CHECKING:
     from collections.abc import Callable
     from collections.abc import Coroutine
+    from collections.abc import Mapping
 
-    from backend.db.models import User
     from backend.db.queries import Queries
     from backend.internal.ws import WebsocketClient
-    from shared.models.internal import WebSocketPayload
+    from backend.internal.ws.scheduler import LobbyScheduler
+    from backend.internal.ws.websocket_manager import _WebsocketTransport
+    from shared.models.responses import PublicUser
 
     CallbackT = Callable[[EventT, WebsocketClient], Coroutine[typing.Any, typing.Any, None]]
     ListenerMapT = dict[str, tuple[type[EventT], list[CallbackT[EventT]]]]
 
 
+class _ReplayEntry(typing.NamedTuple):
+    seq: int
+    """Sequence number of the DISPATCH payload."""
+    user_id: Snowflake | None
+    """The user the payload was sent to, None if it was broadcast."""
+    supersede_key: str | None
+    frames: dict[codecs.Codec, bytes]
+    """The payload encoded with every codec it was sent with."""
+
+
 class _GameLobbyMeta(type(abc.ABC)):
     """Metaclass allowing for calling `__post__init__` function after an instance got created.
 
-    Also checks if the provided lobby id is valid.
+    Also checks if the provided lobby id is valid and collects the event listeners of a lobby class once, when the
+    class gets created.
 
     Author: Christopher
     """
 
+    __event_listeners__: listeners.ListenerTableT
+
+    def __init__(cls, name: str, bases: tuple[type, ...], namespace: dict[str, typing.Any], /) -> None:
+        super().__init__(name, bases, namespace)
+        cls.__event_listeners__ = listeners.collect_listeners(cls)
+        logger.debug("collected listeners for %s events of lobby %s", len(cls.__event_listeners__), name)
+
     @typing.override
     def __call__(cls, *, lobby_id: str, queries: Queries) -> object:
         if not (len(lobby_id) == 5 and lobby_id.isalnum() and lobby_id.upper() == lobby_id):  # noqa: PLR2004
@@ -50,61 +85,162 @@ class GameLobbyBase(abc.ABC, metaclass=_GameLobbyMeta):
     """Base class for every game lobby, handling all the websocket logic.
 
     To handle all the websocket logic this base class stores all the different connected clients, and every
-    registered event callback.
+    registered event callback. Callbacks registered with the `add_event_listener` decorator are stored once per class,
+    only callbacks added using `add_event_callback` are stored per instance.
+
+    Received events are not handled by the receive loop of a client. They are posted into the mailbox of the lobby,
+    which is run by `scheduler`. This way the events of a lobby are handled one after another, so callbacks never
+    interleave, and a slow callback doesn't keep the receive loop from reading the socket. Background tasks change the
+    state of the lobby through the mailbox as well, using `run_in_mailbox` or `call_later`.
 
     Authors: Christopher
     """
 
+    outbound_queue_size: typing.ClassVar[int] = 256
+    """Maximum amount of frames that can be queued for a single client before `outbound_overflow_policy` applies."""
+    outbound_overflow_policy: typing.ClassVar[OverflowPolicy] = OverflowPolicy.DROP_SUPERSEDED
+    """What happens when a client can't keep up with the frames sent to it."""
+    heartbeat_interval: typing.ClassVar[float] = 15.0
+    """Interval in seconds in which clients have to send a HEARTBEAT. Clients that miss two are disconnected."""
+    replay_buffer_size: typing.ClassVar[int] = 512
+    """Amount of sent DISPATCH payloads kept, so that clients resuming their session can receive what they missed."""
+    resume_timeout: typing.ClassVar[float] = 30.0
+    """Time in seconds a client, whose connection dropped, keeps its place in the lobby and can resume its session."""
+    scheduler: typing.ClassVar[LobbyScheduler] = SCHEDULER
+    """Scheduler running the mailbox of the lobby."""
+    empty_lobby_ttl: typing.ClassVar[float] = 60.0
+    """Time in seconds a lobby without clients is kept, before it gets removed."""
+    event_rate_limits: typing.ClassVar[Mapping[type[events.BaseEvent], RateLimit]] = {}
+    """Limits of how often a client can send an event of a specific type."""
+    default_event_rate_limit: typing.ClassVar[RateLimit] = RateLimit(rate=20, burst=50)
+    """Limit of every event type without an entry in `event_rate_limits`. Clients exceeding a limit get disconnected."""
+
     def __init__(self, *, lobby_id: str, queries: Queries) -> None:
         self._lobby_id: str = lobby_id
         self._queries: Queries = queries
         self._clients: dict[Snowflake, WebsocketClient] = {}
         self._events: ListenerMapT[events.BaseEvent] = {}
+        self._membership_callbacks: list[Callable[[GameLobbyBase], None]] = []
+        self._tasks: set[asyncio.Task[typing.Any]] = set()
+        self._empty_since: float | None = time.monotonic()
+        self._closed = False
+        self._event_limiters: dict[type[events.BaseEvent], RateLimiter] = {}
+        self._dispatch_seq = 0
+        self._replay: collections.deque[_ReplayEntry] = collections.deque(maxlen=self.replay_buffer_size)
+        self._mailbox = Mailbox(self._dispatch, scheduler=self.scheduler, game=self.endpoint())
+        self._connected = metrics.CLIENTS_CONNECTED.labels(self.endpoint())
+
+    async def get_user_by_client(self, client: Snowflake | WebsocketClient) -> identity.Identity:
+        """Gets the identity of a user by their websocket client, from the identity cache or otherwise from the db.
 
-    async def get_user_by_client(self, client: Snowflake | WebsocketClient) -> User:
-        """Gets a user from the db by their websocket client.
+        The balance isn't part of it, use `get_money_by_client` for that.
 
         Authors: Christopher
         """
-        if isinstance(client, Snowflake):
-            user = await self.queries.get_user_by_id(id_=self._clients[client].user_id)
-        else:
-            user = await self.queries.get_user_by_id(id_=client.user_id)
-        if user is None:
+        user_id = self._clients[client].user_id if isinstance(client, Snowflake) else client.user_id
+        if (user := await identity.identities.get_identity(user_id, self.queries)) is None:
             raise ValueError("User not found")
         return user
 
+    async def get_money_by_client(self, client: Snowflake | WebsocketClient) -> int:
+        """Reads only the balance of a user from the db by their websocket client.
+
+        Authors: Christopher
+        """
+        user_id = self._clients[client].user_id if isinstance(client, Snowflake) else client.user_id
+        if (money := await self.queries.get_user_money(id_=user_id)) is None:
+            raise ValueError("User not found")
+        return money
+
     def __post__init__(self) -> None:
-        """Function called after an instance of this object was created.
+        """Function called after an instance of this object was created, lobbies can override it.
 
-        This is used to scan for event callbacks that are registered with the `add_event_callback` decorator.
+        Authors: Christopher
+        """
+
+    async def _dispatch(self, event: events.BaseEvent, client: WebsocketClient) -> None:
+        """Calls every callback registered for the type of `event`, recording how long handling it took.
+
+        Authors: Christopher
+        """
+        start = time.perf_counter()
+        event_name = event.event_name()
+        if listener_entry := type(self).__event_listeners__.get(event_name):
+            for listener in listener_entry[1]:
+                try:
+                    await listener(self, event, client)
+                except Exception as exc:  # noqa: BLE001
+                    logger.exception(f"Exception occurred when handling event {event_name}", exc_info=exc)
+        if callback_entry := self._events.get(event_name):
+            for callback in callback_entry[1]:
+                try:
+                    await callback(event, client)
+                except Exception as exc:  # noqa: BLE001
+                    logger.exception(f"Exception occurred when handling event {event_name}", exc_info=exc)
+        metrics.HANDLER_LATENCY.labels(event_name).observe(time.perf_counter() - start)
+
+    @staticmethod
+    def _encode_dispatch(event: events.BaseEvent, codec: codecs.Codec, seq: int) -> bytes:
+        """Encodes an event into a complete DISPATCH frame that can be sent to clients as is.
 
         Authors: Christopher
         """
-        for attr_name in dir(self):
-            maybe_listener = getattr(self, attr_name)
+        return codec.encode(DispatchPayload(d=event, s=seq))
 
-            if callable(maybe_listener) and hasattr(maybe_listener, "__event_type__"):
-                self.add_event_callback(maybe_listener.__event_type__, maybe_listener)  # type: ignore[reportArgumentType]
+    def _record_dispatch(
+        self, seq: int, user_id: Snowflake | None, event: events.BaseEvent, frames: dict[codecs.Codec, bytes]
+    ) -> None:
+        """Stores a sent DISPATCH payload in the replay buffer.
+
+        Authors: Christopher
+        """
+        if not frames:
+            frames[codecs.JSON] = self._encode_dispatch(event, codecs.JSON, seq)
+        supersede_key = event.event_name() if event.supersedable else None
+        self._replay.append(_ReplayEntry(seq, user_id, supersede_key, frames))
 
     async def broadcast_event(self, event: events.BaseEvent) -> None:
         """Function that sends an event to every connected client.
 
+        The event is encoded only once per codec used by the clients and the same frame is then put into the outbound
+        queue of every client, so a slow client never delays the lobby or the other clients.
+
         Authors: Christopher
         """
-        event_name = event.event_name()
-        data = msgspec.to_builtins(event, enc_hook=encode_hook)
-        for client in self._clients.values():
-            await client.dispatch_event(data, event_name)
+        start = time.perf_counter()
+        self._dispatch_seq += 1
+        frames: dict[codecs.Codec, bytes] = {}
+        supersede_key = event.event_name() if event.supersedable else None
+        clients = [client for client in self._clients.values() if client.detached_until is None]
+        for client in clients:
+            if (frame := frames.get(client.codec)) is None:
+                frame = frames[client.codec] = self._encode_dispatch(event, client.codec, self._dispatch_seq)
+            if not client.send_frame(frame, supersede_key):
+                logger.debug("Failed queueing %s for client %s", event.event_name(), client.client_id)
+        self._record_dispatch(self._dispatch_seq, None, event, frames)
+
+        elapsed = time.perf_counter() - start
+        metrics.BROADCAST_LATENCY.observe(elapsed)
+        metrics.BROADCAST_FANOUT.observe(len(clients))
+        logger.debug(
+            "broadcast %s to %s clients in lobby %s took %.3fms",
+            event.event_name(),
+            len(clients),
+            self._lobby_id,
+            elapsed * 1_000,
+        )
 
     async def send_event(self, event: events.BaseEvent, ws: WebsocketClient) -> None:
         """Function that sends an event to one specified client.
 
         Authors: Christopher
         """
-        event_name = event.event_name()
-        data = msgspec.to_builtins(event, enc_hook=encode_hook)
-        await ws.dispatch_event(data, event_name)
+        self._dispatch_seq += 1
+        frames: dict[codecs.Codec, bytes] = {}
+        if ws.detached_until is None:
+            frames[ws.codec] = frame = self._encode_dispatch(event, ws.codec, self._dispatch_seq)
+            ws.send_frame(frame, event.event_name() if event.supersedable else None)
+        self._record_dispatch(self._dispatch_seq, ws.user_id, event, frames)
 
     def add_event_callback(self, event_type: type[typing.Any], callback: CallbackT[typing.Any]) -> None:
         """Function that adds a function as a callback for a specific event.
@@ -138,22 +274,40 @@ class GameLobbyBase(abc.ABC, metaclass=_GameLobbyMeta):
         else:
             self._events[event_type.event_name()] = (event_type, [callback])
 
+    def add_membership_callback(self, callback: Callable[[GameLobbyBase], None]) -> None:
+        """Adds a callback that is called with the lobby whenever a client joins or leaves it.
+
+        Authors: Christopher
+        """
+        self._membership_callbacks.append(callback)
+
+    def _membership_changed(self) -> None:
+        for callback in self._membership_callbacks:
+            callback(self)
+
     def set_client(self, user_id: Snowflake, client: WebsocketClient) -> WebsocketClient:
-        """Adds a client to the lobby and if the lobby is full it errors.
+        """Adds a client to the lobby and if the lobby is full or was closed it errors.
 
         Authors: Christopher
         """
-        if not self._clients.get(user_id) and self.is_full:
+        if self._closed:
+            raise LookupError("Lobby was closed!")
+        joined = user_id not in self._clients
+        if joined and self.is_full:
             raise OverflowError("Lobby is full!")
         logger.debug(f"Added client with user id {user_id} and client_id {client.client_id} to lobby {self._lobby_id}")
         self._clients[user_id] = client
+        self._empty_since = None
+        if joined:
+            self._connected.inc()
+            self._membership_changed()
         return client
 
     def get_client(self, user_id: Snowflake) -> WebsocketClient | None:
         return self._clients.get(user_id)
 
     async def _remove_client(self, user_id: Snowflake) -> None:
-        """Removes a client from the lobby and dispatches a LeaveEvent for the client.
+        """Removes a client from the lobby and posts a LeaveEvent for the client.
 
         Authors: Christopher
         """
@@ -162,20 +316,185 @@ class GameLobbyBase(abc.ABC, metaclass=_GameLobbyMeta):
             logger.debug(
                 f"Removed client with user id {user_id} and client_id {client.client_id} from lobby {self._lobby_id}"
             )
-            if not (event := self._events.get(events.LeaveEvent.event_name())):
-                return
-            for callback in event[1]:
-                try:
-                    await callback(events.LeaveEvent(), client)
-                except Exception as exc:  # noqa: BLE001
-                    logger.exception("Exception occurred when handling LEAVE event", exc_info=exc)
+            self._mailbox.post(events.LeaveEvent(), client)
+            self._connected.dec()
+            if not self._clients:
+                self._empty_since = time.monotonic()
+            self._membership_changed()
         else:
             logger.debug("Tried removing client with user id %s but was not found!", user_id)
 
+    async def _handle_disconnect(self, client: WebsocketClient, resumable: bool) -> None:
+        """Called when the connection of a client ended.
+
+        If the session can be resumed, the client keeps its place in the lobby for `resume_timeout` seconds,
+        otherwise it is removed right away.
+
+        Authors: Christopher
+        """
+        if not resumable or self._clients.get(client.user_id) is not client:
+            await self._remove_client(client.user_id)
+            return
+        logger.debug(
+            "Client %s in lobby %s lost its connection, keeping it for resuming", client.client_id, self._lobby_id
+        )
+        client.detach(time.monotonic() + self.resume_timeout)
+
+    def resume_client(self, ws: _WebsocketTransport, user_id: Snowflake, session_id: Snowflake, seq: int) -> bool:
+        """Continues the session of a client on a new connection and replays every DISPATCH payload it missed.
+
+        Returns False if the session can't be resumed, because it doesn't exist anymore or because the missed
+        payloads are no longer in the replay buffer.
+
+        Authors: Christopher
+        """
+        client = self._clients.get(user_id)
+        if client is None or client.client_id != session_id or seq > self._dispatch_seq:
+            return False
+        missed = [entry for entry in self._replay if entry.seq > seq]
+        if seq < self._dispatch_seq and (not missed or missed[0].seq != seq + 1):
+            return False
+        missed = [entry for entry in missed if entry.user_id in {None, user_id}]
+
+        client.attach(ws)
+        client.send_frame(ws.encode_payload(ResumedPayload(d=ResumedData(replayed=len(missed)))))
+        for entry in missed:
+            if (frame := entry.frames.get(ws.codec)) is None:
+                any_codec, any_frame = next(iter(entry.frames.items()))
+                payload = any_codec.decode(any_frame, DispatchPayload)
+                frame = entry.frames[ws.codec] = ws.codec.encode(payload)
+            client.send_frame(frame, entry.supersede_key)
+
+        metrics.SESSIONS_RESUMED.inc()
+        metrics.REPLAYED_FRAMES.inc(len(missed))
+        logger.debug(
+            "Client %s resumed in lobby %s, replaying %s payloads", client.client_id, self._lobby_id, len(missed)
+        )
+        return True
+
+    async def reap_idle_clients(self, now: float) -> int:
+        """Disconnects every client that has not sent anything for two heartbeat intervals.
+
+        Clients whose connection dropped and which did not resume within `resume_timeout` are removed as well.
+        This is called periodically by a single reaper task for every lobby, instead of each client having its own
+        timeout task. Returns the amount of disconnected clients.
+
+        Authors: Christopher
+        """
+        expired = [
+            client
+            for client in self._clients.values()
+            if client.detached_until is not None and client.detached_until < now
+        ]
+        for client in expired:
+            logger.debug("Client %s in lobby %s did not resume in time, removing it", client.client_id, self._lobby_id)
+            await self._remove_client(client.user_id)
+
+        deadline = now - 2 * self.heartbeat_interval
+        idle = [
+            client for client in self._clients.values() if client.detached_until is None and client.last_seen < deadline
+        ]
+        for client in idle:
+            logger.debug(
+                "Client %s in lobby %s missed its heartbeats, disconnecting it", client.client_id, self._lobby_id
+            )
+            await self._remove_client(client.user_id)
+        await asyncio.gather(
+            *(client.close(code=WebsocketCloseCode.HEARTBEAT_TIMEOUT, reason="Heartbeat timed out") for client in idle),
+            return_exceptions=True,
+        )
+        return len(idle) + len(expired)
+
+    def create_task(
+        self, coro: Coroutine[typing.Any, typing.Any, ResultT], *, name: str | None = None
+    ) -> asyncio.Task[ResultT]:
+        """Runs a coroutine in the background. The task is cancelled when the lobby gets closed.
+
+        The task is named after the coroutine function unless `name` is given, e.g. `Blackjack.wait_for_bets`.
+
+        Authors: Christopher
+        """
+        task = asyncio.create_task(coro, name=name or coro.__qualname__)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def run_in_mailbox(
+        self, callback: Callable[[*ArgsT], Coroutine[typing.Any, typing.Any, ResultT]], *args: *ArgsT
+    ) -> ResultT:
+        """Runs `callback(*args)` as a job of the mailbox of the lobby and returns its result.
+
+        Background tasks use this to change the state of the lobby, so they never interleave with event callbacks.
+        If the awaiting task gets cancelled before the mailbox got to the job, the callback is skipped. This must not
+        be awaited from an event callback, the mailbox would wait for itself.
+
+        Authors: Christopher
+        """
+        result: asyncio.Future[ResultT] = asyncio.get_running_loop().create_future()
+
+        async def job() -> None:
+            if result.cancelled():
+                return
+            try:
+                value = await callback(*args)
+            except Exception as exc:
+                if result.cancelled():
+                    raise
+                result.set_exception(exc)
+            else:
+                if not result.cancelled():
+                    result.set_result(value)
+
+        self._mailbox.post_job(job)
+        return await result
+
+    def call_later(
+        self, delay: float, callback: Callable[[*ArgsT], Coroutine[typing.Any, typing.Any, ResultT]], *args: *ArgsT
+    ) -> asyncio.Task[ResultT]:
+        """Calls `callback(*args)` after `delay` seconds as a job of the mailbox of the lobby, see `run_in_mailbox`.
+
+        Cancelling the returned task before the callback started skips it.
+
+        Authors: Christopher
+        """
+
+        async def run_later() -> ResultT:
+            await asyncio.sleep(delay)
+            return await self.run_in_mailbox(callback, *args)
+
+        return self.create_task(run_later(), name=getattr(callback, "__qualname__", None))
+
+    def is_expired(self, now: float) -> bool:
+        """Whether the lobby has been without clients for longer than `empty_lobby_ttl` seconds.
+
+        Clients whose connection dropped still count, as long as they can resume their session.
+        """
+        return self._empty_since is not None and now - self._empty_since >= self.empty_lobby_ttl
+
+    async def close(self) -> None:
+        """Called after the lobby got removed. No client can join anymore and every background task is cancelled.
+
+        Authors: Christopher
+        """
+        self._closed = True
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        logger.debug("Closed lobby %s and cancelled %s tasks", self._lobby_id, len(tasks))
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
     @property
     def queries(self) -> Queries:
         return self._queries
 
+    @property
+    def lobby_id(self) -> str:
+        return self._lobby_id
+
     @staticmethod
     @abc.abstractmethod
     def endpoint() -> str:
@@ -194,36 +513,34 @@ class GameLobbyBase(abc.ABC, metaclass=_GameLobbyMeta):
     def is_full(self) -> bool:
         return self.num_clients >= self.max_num_clients
 
-    async def __handle_dispatch(self, payload: WebSocketPayload, client: WebsocketClient) -> None:
-        """Internal function that handles event dispatches.
+    async def __handle_dispatch(self, payload: DispatchPayload, client: WebsocketClient) -> None:
+        """Internal function that handles event dispatches by posting them into the mailbox of the lobby.
+
+        The event was already decoded into its concrete type by the transport. Clients sending an event type more
+        often than its rate limit allows are disconnected with RATE_LIMITED.
 
         Authors: Christopher
         """
-        if not payload.t or not (event := self._events.get(payload.t)):
+        event_type = type(payload.d)
+        if (limiter := self._event_limiters.get(event_type)) is None:
+            limit = self.event_rate_limits.get(event_type, self.default_event_rate_limit)
+            limiter = self._event_limiters[event_type] = RateLimiter(limit, name=event_type.event_name().lower())
+        if limiter.acquire(client.user_id):
+            logger.debug("Client %s exceeded the rate limit of %s, disconnecting it", client.client_id, event_type)
+            await client.close(code=WebsocketCloseCode.RATE_LIMITED, reason="Too many events")
             return
-        event_obj = msgspec.convert(payload.d, type=event[0], dec_hook=decode_hook)
-        for callback in event[1]:
-            try:
-                await callback(event_obj, client)
-            except Exception as exc:  # noqa: BLE001
-                logger.exception(f"Exception occurred when handling event {payload.t}", exc_info=exc)
+        self._mailbox.post(payload.d, client)
 
-    async def send_ready(self, user: User) -> None:
+    async def send_ready(self, user: PublicUser) -> None:
         """Function that sends the ready event for a specific user."""
         client = self.get_client(user.id)
         if client is None:
             return
         event_obj = await client.send_ready(user=user, num_clients=self.num_clients)
-        if not (event := self._events.get(events.ReadyEvent.event_name())):
-            return
-        for callback in event[1]:
-            try:
-                await callback(event_obj, client)
-            except Exception as exc:  # noqa: BLE001
-                logger.exception("Exception occurred when handling READY event", exc_info=exc)
+        self._mailbox.post(event_obj, client)
 
     async def handle_ws(self, user_id: Snowflake) -> None:
         client = self.get_client(user_id)
         if client is None:
             return
-        await client.handle_ws(self.__handle_dispatch, self._remove_client)
+        await client.handle_ws(self.__handle_dispatch, self._handle_disconnect)
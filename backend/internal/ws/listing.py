@@ -0,0 +1,177 @@
+"""Cached lobby listings served by `GET /<game>/`.
+
+The lobbys of a game mode are kept as a list sorted by id, which is only rebuilt after a client joined or left a lobby
+or a lobby was created. Every change bumps the version of the listing, the ETag of a response is made of the versions
+of every shard, so clients polling an unchanged listing receive a 304 without anything being built or encoded. The
+versions of the other shards are cached, see `backend.internal.ws.sharding`, so this doesn't ask the other shards
+either.
+
+Responses can be filtered and paginated using the query string:
+
+- `hide_full`: leave out lobbys without a free place.
+- `hide_single_player`: leave out lobbys that only fit a single player.
+- `limit`: maximum amount of lobbys in the response, without it every lobby is returned.
+- `cursor`: id of the last lobby of the previous page, the `X-Next-Cursor` header of a response holds the cursor of
+  the next page if there is one.
+"""
+
+from __future__ import annotations
+
+__all__ = ("MAX_PAGE_SIZE", "NEXT_CURSOR_HEADER", "ListingQuery", "LobbyListing")
+
+import bisect
+import heapq
+import time
+import typing
+
+import msgspec
+import sanic
+from sanic.exceptions import BadRequest
+
+from backend.internal import serialization
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Callable
+    from collections.abc import Iterable
+    from collections.abc import Mapping
+    from collections.abc import Sequence
+
+    from shared.models import responses
+
+MAX_PAGE_SIZE: typing.Final[int] = 100
+NEXT_CURSOR_HEADER: typing.Final[str] = "X-Next-Cursor"
+_MAX_CACHED_PAGES: typing.Final[int] = 256
+_TRUE_VALUES: typing.Final[frozenset[str]] = frozenset({"1", "true", "yes"})
+
+
+class ListingQuery(msgspec.Struct, frozen=True):
+    """Filters and pagination requested for a listing."""
+
+    hide_full: bool = False
+    hide_single_player: bool = False
+    cursor: str | None = None
+    limit: int | None = None
+
+    @classmethod
+    def from_request(cls, request: sanic.Request) -> ListingQuery:
+        """Parses the query string of a request, raises `BadRequest` if `limit` is not a valid page size."""
+        limit = request.args.get("limit")
+        if limit is not None:
+            if not limit.isdigit() or not 0 < int(limit) <= MAX_PAGE_SIZE:
+                msg = f"limit has to be a number between 1 and {MAX_PAGE_SIZE}"
+                raise BadRequest(msg)
+            limit = int(limit)
+        return cls(
+            hide_full=request.args.get("hide_full", "").lower() in _TRUE_VALUES,
+            hide_single_player=request.args.get("hide_single_player", "").lower() in _TRUE_VALUES,
+            cursor=request.args.get("cursor") or None,
+            limit=limit,
+        )
+
+    def matches(self, lobby: responses.PublicGameLobby) -> bool:
+        if self.hide_full and lobby.full:
+            return False
+        return not (self.hide_single_player and lobby.max_clients <= 1)
+
+
+class _Page(typing.NamedTuple):
+    etag: str
+    body: bytes
+    next_cursor: str | None
+
+
+class LobbyListing:
+    """Listing of the lobbys of a single game mode owned by the current worker.
+
+    Authors: Christopher
+    """
+
+    def __init__(self, build: Callable[[], Iterable[responses.PublicGameLobby]]) -> None:
+        self._build = build
+        # starting at the current time keeps ETags from colliding with the ones handed out before a restart
+        self._version = time.time_ns()
+        self._lobbys: list[responses.PublicGameLobby] | None = None
+        self._pages: dict[ListingQuery, _Page] = {}
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self) -> None:
+        """Called whenever the lobbys of the game mode or their members changed."""
+        self._version += 1
+        self._lobbys = None
+
+    def lobbys(self) -> list[responses.PublicGameLobby]:
+        """Every lobby owned by the current worker, sorted by id."""
+        if self._lobbys is None:
+            self._lobbys = sorted(self._build(), key=lambda lobby: lobby.id)
+        return self._lobbys
+
+    @staticmethod
+    def etag(versions: Mapping[int, int]) -> str:
+        """ETag of a listing made of the listings of multiple shards, mapped from shard index to version."""
+        return '"' + "-".join(f"{index}.{version:x}" for index, version in sorted(versions.items())) + '"'
+
+    def respond_cached(self, request: sanic.Request, query: ListingQuery, etag: str) -> sanic.HTTPResponse | None:
+        """Responds with 304 if the client already has the listing, otherwise with the cached page.
+
+        Returns None if the page isn't cached, it has to be built using `respond` then.
+        """
+        if _etag_matches(request.headers.get("If-None-Match"), etag):
+            return sanic.empty(status=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+        if (page := self._pages.get(query)) is None or page.etag != etag:
+            return None
+        return self._page_response(page)
+
+    def respond(
+        self,
+        request: sanic.Request,
+        query: ListingQuery,
+        etag: str,
+        merged: Callable[[], Sequence[responses.PublicGameLobby]],
+    ) -> sanic.HTTPResponse:
+        """Responds like `respond_cached`, building the page if it isn't cached.
+
+        `merged` is only called if the page has to be built, it returns every lobby sorted by id.
+        """
+        if (response := self.respond_cached(request, query, etag)) is not None:
+            return response
+        return self._page_response(self._build_page(query, etag, merged()))
+
+    @staticmethod
+    def _page_response(page: _Page) -> sanic.HTTPResponse:
+        headers = {"ETag": page.etag, "Cache-Control": "no-cache"}
+        if page.next_cursor is not None:
+            headers[NEXT_CURSOR_HEADER] = page.next_cursor
+        return sanic.raw(body=page.body, status=200, content_type="application/json", headers=headers)
+
+    def _build_page(self, query: ListingQuery, etag: str, lobbys: Sequence[responses.PublicGameLobby]) -> _Page:
+        start = 0 if query.cursor is None else bisect.bisect_right(lobbys, query.cursor, key=lambda lobby: lobby.id)
+        selected: list[responses.PublicGameLobby] = []
+        next_cursor: str | None = None
+        for lobby in lobbys[start:]:
+            if not query.matches(lobby):
+                continue
+            if query.limit is not None and len(selected) == query.limit:
+                next_cursor = selected[-1].id
+                break
+            selected.append(lobby)
+
+        if len(self._pages) >= _MAX_CACHED_PAGES:
+            self._pages.clear()
+        page = _Page(etag=etag, body=serialization.encoder.encode(selected), next_cursor=next_cursor)
+        self._pages[query] = page
+        return page
+
+    @staticmethod
+    def merge(*listings: Iterable[responses.PublicGameLobby]) -> list[responses.PublicGameLobby]:
+        """Merges listings that are each sorted by id into a single one."""
+        return list(heapq.merge(*listings, key=lambda lobby: lobby.id))
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
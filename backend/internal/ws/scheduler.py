@@ -0,0 +1,118 @@
+"""Mailboxes and the scheduler running them.
+
+Every lobby owns a mailbox, receive loops only post events into it. Background tasks of a lobby post jobs into it, to
+change the state of the lobby without interleaving with event callbacks. The scheduler runs a fixed amount of workers
+which take mailboxes with pending events from a shared FIFO queue. A mailbox is in the queue at most once and is
+handled by only one worker at a time, so the events and jobs of a lobby are handled one after another in the order
+they were posted. After handling a single event the mailbox goes back to the end of the queue, which keeps busy
+lobbies from starving the others.
+"""
+
+from __future__ import annotations
+
+__all__ = ("SCHEDULER", "LobbyScheduler", "Mailbox")
+
+import asyncio
+import collections
+import functools
+import time
+import typing
+
+from sanic.log import logger
+
+from backend.internal import metrics
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Callable
+    from collections.abc import Coroutine
+
+    from backend.internal.ws import WebsocketClient
+    from shared.models import events
+
+    HandlerT = Callable[[events.BaseEvent, WebsocketClient], Coroutine[typing.Any, typing.Any, None]]
+    JobT = Callable[[], Coroutine[typing.Any, typing.Any, None]]
+
+
+class Mailbox:
+    """Queue of events of a single lobby that were received but not handled yet, and of jobs that were not run yet.
+
+    Authors: Christopher
+    """
+
+    __slots__ = ("_depth", "_handler", "_latency", "_messages", "_scheduled", "_scheduler")
+
+    def __init__(self, handler: HandlerT, *, scheduler: LobbyScheduler, game: str) -> None:
+        self._handler = handler
+        self._scheduler = scheduler
+        self._messages: collections.deque[tuple[float, JobT]] = collections.deque()
+        self._scheduled = False
+        self._depth = metrics.MAILBOX_DEPTH.labels(game)
+        self._latency = metrics.MAILBOX_LATENCY.labels(game)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def post(self, event: events.BaseEvent, client: WebsocketClient) -> None:
+        """Queues an event, it gets handled once the scheduler gets to this mailbox."""
+        self.post_job(functools.partial(self._handler, event, client))
+
+    def post_job(self, job: JobT) -> None:
+        """Queues a job, it is run like an event once the scheduler gets to this mailbox."""
+        self._messages.append((time.perf_counter(), job))
+        self._depth.observe(len(self._messages))
+        if not self._scheduled:
+            self._scheduled = True
+            self._scheduler.schedule(self)
+
+    async def handle_one(self) -> bool:
+        """Handles the oldest event or job in the mailbox. Returns whether there are events left."""
+        posted_at, job = self._messages.popleft()
+        self._latency.observe(time.perf_counter() - posted_at)
+        try:
+            await job()
+        finally:
+            self._scheduled = bool(self._messages)
+        return self._scheduled
+
+
+class LobbyScheduler:
+    """Runs the mailboxes of every lobby with a fixed amount of workers.
+
+    The workers are started when the first mailbox gets scheduled, because they need a running event loop.
+
+    Authors: Christopher
+    """
+
+    def __init__(self, *, workers: int = 32) -> None:
+        self._num_workers = workers
+        self._ready: asyncio.Queue[Mailbox] = asyncio.Queue()
+        self._workers: list[asyncio.Task[None]] = []
+
+    def schedule(self, mailbox: Mailbox) -> None:
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._work(), name=f"lobby_scheduler_worker_{i}") for i in range(self._num_workers)
+            ]
+        self._ready.put_nowait(mailbox)
+
+    async def _work(self) -> None:
+        while True:
+            mailbox = await self._ready.get()
+            try:
+                pending = await mailbox.handle_one()
+            except Exception as exc:  # noqa: BLE001
+                logger.exception("Exception occurred when handling a mailbox", exc_info=exc)
+                pending = bool(len(mailbox))
+            if pending:
+                self._ready.put_nowait(mailbox)
+
+    async def close(self) -> None:
+        """Stops every worker, events that were not handled yet are dropped."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+SCHEDULER: typing.Final[LobbyScheduler] = LobbyScheduler()
+"""Scheduler used by every lobby of the server."""
@@ -0,0 +1,228 @@
+"""Sharding lobbys across the worker processes of the server.
+
+Every worker is a shard and owns the lobbys it created. The first character of a lobby id encodes the owning shard,
+so every worker can tell where a lobby lives without asking the others. Websocket connections to a lobby of another
+shard are relayed to the owner using the broker and changes of lobbys are sent to every shard for the subscribers of
+the lobby directory.
+
+Every shard caches the lobby listings of the other shards. The changes sent between the shards carry the version of
+the listing of their shard, so a cached listing is only fetched again once it is outdated, or after
+`REMOTE_LISTING_TTL` seconds passed without hearing from its shard.
+
+The main process stores the amount of workers and the directory of the broker sockets in environment variables,
+which are inherited by the workers.
+"""
+
+from __future__ import annotations
+
+__all__ = ("LOBBY_ID_CHARS", "REMOTE_LISTING_TTL", "LobbyDirectory")
+
+import asyncio
+import os
+import pathlib
+import random
+import re
+import string
+import time
+import typing
+
+from sanic.log import logger
+
+from backend.internal.ws.broker import Broker
+from backend.internal.ws.broker import DirectoryChanges
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Awaitable
+    from collections.abc import Callable
+
+    from backend.internal.ws.broker import ListHandlerT
+    from backend.internal.ws.broker import ListLobbysResponse
+    from backend.internal.ws.broker import RelayHandlerT
+    from backend.internal.ws.directory_channel import LobbyChangeT
+
+    ChangesHandlerT = Callable[[str, list[LobbyChangeT]], Awaitable[None]]
+
+LOBBY_ID_CHARS: typing.Final[str] = string.ascii_uppercase + string.digits
+"""Characters lobby ids are made of."""
+
+SHARDS_ENV: typing.Final[str] = "CASINO_SHARDS"
+SHARD_DIR_ENV: typing.Final[str] = "CASINO_SHARD_DIR"
+REMOTE_LISTING_TTL: typing.Final[float] = float(os.getenv("CASINO_REMOTE_LISTING_TTL", "30"))
+"""Time in seconds the version of another shard is trusted without hearing from the shard."""
+
+_WORKER_NAME = re.compile(r"^Sanic-Server-(\d+)-")
+
+
+class _RemoteListing:
+    """What the current shard knows about the listing of a game mode of another shard."""
+
+    __slots__ = ("confirmed_at", "listing", "version")
+
+    def __init__(self, version: int, confirmed_at: float) -> None:
+        self.version = version
+        """Latest version of the listing the shard told us about."""
+        self.confirmed_at = confirmed_at
+        """When the shard last told us about the version of its listing."""
+        self.listing: ListLobbysResponse | None = None
+        """The listing last fetched from the shard, outdated if its version is older than `version`."""
+
+    def confirm(self, version: int, now: float) -> None:
+        self.version = max(self.version, version)
+        self.confirmed_at = now
+
+    def expired(self, now: float) -> bool:
+        return now - self.confirmed_at > REMOTE_LISTING_TTL
+
+    def fresh_listing(self, now: float) -> ListLobbysResponse | None:
+        if self.listing is None or self.listing.version < self.version or self.expired(now):
+            return None
+        return self.listing
+
+
+class LobbyDirectory:
+    """Knows which shard owns a lobby and how to reach the other shards.
+
+    Without multiple workers there is a single shard and every lobby is local.
+
+    Authors: Christopher
+    """
+
+    def __init__(self, *, index: int = 0, count: int = 1, socket_dir: str | None = None) -> None:
+        self.index = index
+        """Index of the shard of the current worker."""
+        self.count = count
+        """Amount of shards."""
+        self._socket_dir = socket_dir
+        self._broker: Broker | None = None
+        self._changes_handler: ChangesHandlerT | None = None
+        self._remote: dict[str, dict[int, _RemoteListing]] = {}
+
+    @classmethod
+    def from_env(cls) -> LobbyDirectory:
+        """Creates the directory of the current worker, using the environment set up by the main process."""
+        count = int(os.getenv(SHARDS_ENV, "1"))
+        socket_dir = os.getenv(SHARD_DIR_ENV)
+        match = _WORKER_NAME.match(os.getenv("SANIC_WORKER_NAME", ""))
+        if count <= 1 or socket_dir is None or match is None:
+            return cls()
+        return cls(index=int(match.group(1)), count=count, socket_dir=socket_dir)
+
+    @property
+    def sharded(self) -> bool:
+        return self.count > 1
+
+    def shard_of(self, lobby_id: str) -> int:
+        return LOBBY_ID_CHARS.index(lobby_id[0]) % self.count
+
+    def is_local(self, lobby_id: str) -> bool:
+        """Whether the current shard owns `lobby_id`. Ids no shard could own are local, so they get rejected here."""
+        if not self.sharded or not lobby_id or lobby_id[0] not in LOBBY_ID_CHARS:
+            return True
+        return self.shard_of(lobby_id) == self.index
+
+    def new_lobby_id(self, exists: Callable[[str], bool]) -> str:
+        """Generates a new 5 character long lobby id, which belongs to the current shard."""
+        first_chars = [char for i, char in enumerate(LOBBY_ID_CHARS) if i % self.count == self.index]
+        while True:
+            lobby_id = random.choice(first_chars) + "".join(random.choices(LOBBY_ID_CHARS, k=4))
+            if not exists(lobby_id):
+                return lobby_id
+
+    def _socket_path(self, index: int) -> str:
+        return str(pathlib.Path(typing.cast("str", self._socket_dir)) / f"shard-{index}.sock")
+
+    async def start(
+        self, *, list_handler: ListHandlerT, relay_handler: RelayHandlerT, changes_handler: ChangesHandlerT
+    ) -> None:
+        """Starts serving the broker socket of the current shard."""
+        if not self.sharded:
+            return
+        self._changes_handler = changes_handler
+        self._broker = Broker(
+            self._socket_path(self.index),
+            list_handler=list_handler,
+            relay_handler=relay_handler,
+            changes_handler=self._handle_changes,
+        )
+        await self._broker.start()
+
+    async def _handle_changes(self, message: DirectoryChanges) -> None:
+        self._remote_listing(message.game, message.shard).confirm(message.version, time.monotonic())
+        if self._changes_handler is not None:
+            await self._changes_handler(message.game, message.changes)
+
+    def _remote_listing(self, game: str, index: int) -> _RemoteListing:
+        listings = self._remote.setdefault(game, {})
+        if (remote := listings.get(index)) is None:
+            remote = listings[index] = _RemoteListing(version=0, confirmed_at=time.monotonic())
+        return remote
+
+    def _other_shards(self) -> list[int]:
+        return [index for index in range(self.count) if index != self.index]
+
+    def remote_versions(self, game: str) -> dict[int, int] | None:
+        """The versions of the listings of every other shard known to the current shard, mapped from shard index.
+
+        Returns None if the version of a shard isn't known or wasn't confirmed for `REMOTE_LISTING_TTL` seconds, the
+        listings have to be fetched using `list_remote_lobbys` then.
+        """
+        now = time.monotonic()
+        listings = self._remote.get(game, {})
+        versions: dict[int, int] = {}
+        for index in self._other_shards():
+            if (remote := listings.get(index)) is None or remote.listing is None or remote.expired(now):
+                return None
+            versions[index] = remote.version
+        return versions
+
+    async def close(self) -> None:
+        if self._broker is not None:
+            await self._broker.close()
+
+    async def list_remote_lobbys(self, game: str) -> dict[int, ListLobbysResponse]:
+        """The lobbys of every other shard, mapped from shard index to listing.
+
+        Only the shards whose cached listing is outdated are asked for their lobbys, shards that can't be reached are
+        skipped.
+        """
+        now = time.monotonic()
+        listings: dict[int, ListLobbysResponse] = {}
+        outdated: list[int] = []
+        for index in self._other_shards():
+            if (listing := self._remote_listing(game, index).fresh_listing(now)) is not None:
+                listings[index] = listing
+            else:
+                outdated.append(index)
+        if not outdated:
+            return listings
+
+        results = await asyncio.gather(
+            *(Broker.list_lobbys(self._socket_path(index), game) for index in outdated), return_exceptions=True
+        )
+        now = time.monotonic()
+        for index, result in zip(outdated, results, strict=True):
+            if isinstance(result, BaseException):
+                logger.warning("failed listing lobbys of shard %s: %r", index, result)
+                continue
+            remote = self._remote_listing(game, index)
+            remote.confirm(result.version, now)
+            remote.listing = result
+            listings[index] = result
+        return listings
+
+    async def publish_changes(self, message: DirectoryChanges) -> None:
+        """Sends changes of lobbys of the current shard to every other shard.
+
+        Shards that can't be reached are skipped.
+        """
+        others = self._other_shards()
+        results = await asyncio.gather(
+            *(Broker.send_changes(self._socket_path(index), message) for index in others), return_exceptions=True
+        )
+        for index, result in zip(others, results, strict=True):
+            if isinstance(result, BaseException):
+                logger.warning("failed sending lobby changes to shard %s: %r", index, result)
+
+    async def open_relay(self, game: str, lobby_id: str) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Opens a relay to the shard owning `lobby_id`."""
+        return await Broker.open_relay(self._socket_path(self.shard_of(lobby_id)), game, lobby_id)
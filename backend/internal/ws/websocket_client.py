@@ -1,20 +1,24 @@
 from __future__ import annotations
 
+import asyncio
+import collections
+import enum
+import time
 import typing
 
 import msgspec
 from sanic.log import logger
 
 from backend.internal import errors
-from backend.utils import convert_struct
+from backend.internal import metrics
 from shared.internal import Snowflake
+from shared.internal import codecs
 from shared.internal import generate_snowflake
-from shared.internal.hooks import encode_hook
-from shared.internal.opcodes import DISPATCH
-from shared.internal.opcodes import READY
 from shared.models import events
-from shared.models.internal import WebSocketPayload
-from shared.models.responses import PublicUser
+from shared.models.internal import DispatchPayload
+from shared.models.internal import HeartbeatAckPayload
+from shared.models.internal import HeartbeatPayload
+from shared.models.internal import ReadyPayload
 
 if typing.TYPE_CHECKING:
     from collections.abc import Callable
@@ -22,10 +26,25 @@ if typing.TYPE_CHECKING:
 
     import sanic
 
-    from backend.db.models import User
     from backend.internal.ws.websocket_manager import _WebsocketTransport
+    from shared.models.responses import PublicUser
 
-__all__ = ("WebsocketClient",)
+__all__ = ("OverflowPolicy", "WebsocketClient")
+
+_FINAL_CLOSE_CODES: typing.Final[frozenset[int]] = frozenset({1000, 1001})
+"""Close codes sent by clients that left on purpose, their sessions are not kept for resuming."""
+
+
+class OverflowPolicy(enum.Enum):
+    """What a client does when its outbound queue is full.
+
+    Authors: Christopher
+    """
+
+    DROP_SUPERSEDED = enum.auto()
+    """Drop a queued state update that is superseded by a newer one. If there is none, the client is disconnected."""
+    DISCONNECT = enum.auto()
+    """Disconnect the client right away."""
 
 
 class WebsocketClient:
@@ -34,16 +53,40 @@ class WebsocketClient:
     The main purpose is storing the user_id associated with the client and handling the connecting by using the
     `handle_ws` function.
 
+    Frames sent to the client are not written to the socket directly. They are put into a bounded outbound queue
+    which is drained by a writer task owned by the client, so a slow client can never stall the lobby.
+
+    If the connection drops, the client can be detached instead of removed. It then keeps its place in the lobby until
+    it either gets attached to a new connection using RESUME or its resume deadline passes.
+
     Authors: Christopher
     """
 
     def __init__(
-        self, ws: _WebsocketTransport, request: sanic.Request, user_id: Snowflake, client_id: Snowflake
+        self,
+        ws: _WebsocketTransport,
+        request: sanic.Request | None,
+        user_id: Snowflake,
+        client_id: Snowflake,
+        *,
+        queue_size: int = 256,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_SUPERSEDED,
     ) -> None:
         self._ws = ws
         self._request = request
         self._user_id = user_id
         self._client_id = client_id
+        self._last_seen = time.monotonic()
+        self._detached_until: float | None = None
+
+        self._queue_size = queue_size
+        self._overflow_policy = overflow_policy
+        self._queue: collections.deque[tuple[str | None, bytes]] = collections.deque()
+        self._queue_not_empty = asyncio.Event()
+        self._dropped_frames = 0
+        self._evicted = False
+        self._close_task: asyncio.Task[None] | None = None
+        self._writer_task = asyncio.create_task(self._write_frames())
 
     @property
     def ws(self) -> _WebsocketTransport:
@@ -57,46 +100,199 @@ class WebsocketClient:
     def user_id(self) -> Snowflake:
         return self._user_id
 
+    @property
+    def last_seen(self) -> float:
+        """Monotonic timestamp of the last payload received from the client."""
+        return self._last_seen
+
+    @property
+    def detached_until(self) -> float | None:
+        """Monotonic deadline until the client can be resumed, None if the client is connected."""
+        return self._detached_until
+
+    @property
+    def codec(self) -> codecs.Codec:
+        return self._ws.codec
+
+    @property
+    def queue_depth(self) -> int:
+        """Amount of frames waiting to be written to the socket."""
+        return len(self._queue)
+
+    @property
+    def dropped_frames(self) -> int:
+        """Amount of frames that were dropped, because the outbound queue was full."""
+        return self._dropped_frames
+
+    @property
+    def evicted(self) -> bool:
+        """Whether the client got disconnected for not keeping up with the frames sent to it."""
+        return self._evicted
+
     @classmethod
-    def new_client(cls, ws: _WebsocketTransport, request: sanic.Request, user_id: Snowflake) -> WebsocketClient:
-        return cls(ws=ws, request=request, user_id=user_id, client_id=generate_snowflake())
+    def new_client(
+        cls,
+        ws: _WebsocketTransport,
+        request: sanic.Request | None,
+        user_id: Snowflake,
+        *,
+        queue_size: int = 256,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_SUPERSEDED,
+    ) -> WebsocketClient:
+        return cls(
+            ws=ws,
+            request=request,
+            user_id=user_id,
+            client_id=generate_snowflake(),
+            queue_size=queue_size,
+            overflow_policy=overflow_policy,
+        )
+
+    def send_frame(self, frame: bytes, supersede_key: str | None = None) -> bool:
+        """Puts an already encoded payload into the outbound queue of the client.
 
-    async def dispatch_event(self, data: dict[str, typing.Any], event_name: str) -> None:
-        await self._ws.send_payload(WebSocketPayload(op=DISPATCH, d=data, t=event_name))
+        Frames with a `supersede_key` are state updates, older queued frames with the same key may be dropped in favor
+        of newer ones when the queue is full. This never blocks, it returns False if the frame could not be queued.
+
+        Authors: Christopher
+        """
+        if self._evicted or self._detached_until is not None:
+            return False
+        if len(self._queue) >= self._queue_size and not self._make_room(supersede_key):
+            self._evict()
+            return False
+        self._queue.append((supersede_key, frame))
+        self._queue_not_empty.set()
+        metrics.OUTBOUND_QUEUE_DEPTH.observe(len(self._queue))
+        return True
 
-    async def send_ready(self, user: User, num_clients: int) -> events.ReadyEvent:
-        ready_event = events.ReadyEvent(
-            user=convert_struct(user, PublicUser), client_id=self._client_id, num_clients=num_clients
+    def _make_room(self, supersede_key: str | None) -> bool:
+        """Tries dropping a superseded state update from the full queue.
+
+        A queued frame is superseded if a newer frame with the same key is either queued as well or is about to be
+        queued.
+        """
+        if self._overflow_policy is not OverflowPolicy.DROP_SUPERSEDED:
+            return False
+        newest_index: dict[str, int] = {}
+        for i, (key, _) in enumerate(self._queue):
+            if key is not None:
+                newest_index[key] = i
+        for i, (key, _) in enumerate(self._queue):
+            if key is not None and (key == supersede_key or newest_index[key] != i):
+                del self._queue[i]
+                self._dropped_frames += 1
+                metrics.OUTBOUND_FRAMES_DROPPED.inc()
+                return True
+        return False
+
+    def _evict(self) -> None:
+        """Disconnects the client because it does not keep up with the frames sent to it."""
+        logger.warning(
+            "Client %s with user id %s can't keep up (%s queued frames), disconnecting it",
+            self._client_id,
+            self._user_id,
+            len(self._queue),
         )
-        await self._ws.send_payload(
-            WebSocketPayload(op=READY, d=msgspec.to_builtins(ready_event, enc_hook=encode_hook))
+        self._evicted = True
+        self._queue.clear()
+        self._writer_task.cancel()
+        metrics.SLOW_CONSUMERS_EVICTED.inc()
+        self._close_task = asyncio.create_task(
+            self._ws.send_close(code=errors.WebsocketCloseCode.SLOW_CONSUMER, reason="Client too slow")
         )
+
+    async def _write_frames(self) -> None:
+        """Task writing queued frames to the socket until the client disconnects."""
+        while True:
+            while not self._queue:
+                self._queue_not_empty.clear()
+                await self._queue_not_empty.wait()
+            _, frame = self._queue.popleft()
+            try:
+                await self._ws.send_frame(frame)
+            except Exception as exc:  # noqa: BLE001
+                logger.debug("Stopped writing to client %s: %r", self._client_id, exc)
+                return
+
+    def stop_writing(self) -> None:
+        """Stops the writer task and discards every frame that was not written yet."""
+        self._queue.clear()
+        self._writer_task.cancel()
+
+    async def close(self, *, code: int, reason: str) -> None:
+        """Discards every queued frame and closes the connection."""
+        self.stop_writing()
+        await self._ws.send_close(code=code, reason=reason)
+
+    def detach(self, deadline: float) -> None:
+        """Keeps the client around without a connection until `deadline`, so it can be resumed.
+
+        Frames sent to a detached client are discarded, the lobby replays them when the client resumes.
+        """
+        self.stop_writing()
+        self._detached_until = deadline
+
+    def attach(self, ws: _WebsocketTransport) -> None:
+        """Continues the session of this client on a new connection."""
+        self.stop_writing()
+        if self._detached_until is None:
+            # The old connection is still open, the client most likely didn't notice it was closed.
+            self._close_task = asyncio.create_task(
+                self._ws.send_close(code=errors.WebsocketCloseCode.SESSION_INVALID, reason="Session was resumed")
+            )
+        self._ws = ws
+        self._detached_until = None
+        self._evicted = False
+        self._last_seen = time.monotonic()
+        self._writer_task = asyncio.create_task(self._write_frames())
+
+    async def send_ready(self, user: PublicUser, num_clients: int) -> events.ReadyEvent:
+        ready_event = events.ReadyEvent(user=user, client_id=self._client_id, num_clients=num_clients)
+        self.send_frame(self._ws.encode_payload(ReadyPayload(d=ready_event)))
         return ready_event
 
     async def handle_ws(
         self,
-        dispatch_handler: Callable[[WebSocketPayload, WebsocketClient], Coroutine[typing.Any, typing.Any, None]],
-        remove_client: Callable[[Snowflake], Coroutine[typing.Any, typing.Any, None]],
+        dispatch_handler: Callable[[DispatchPayload, WebsocketClient], Coroutine[typing.Any, typing.Any, None]],
+        disconnect_handler: Callable[[WebsocketClient, bool], Coroutine[typing.Any, typing.Any, None]],
     ) -> None:
         """Function that listens for new messages from the client.
 
-        It then dispatches the received payloads by using the provided `dispatch_handler` function.
+        It then dispatches the received payloads by using the provided `dispatch_handler` function. When the connection
+        ends, `disconnect_handler` is called with whether the session can be resumed. That is the case if the connection
+        dropped, but not if the client closed it on purpose or the server closed it.
 
         Authors: Christopher
         """
+        ws = self._ws
         while True:
             try:
-                payload = await self._ws.recieve_payload()
+                payload = await ws.recieve_payload()
             except errors.WebsocketConnectionError as exc:
                 logger.debug(f"Client {self.client_id} closed the connection with reason {exc.reason}")
-                await remove_client(self._user_id)
+                resumable = not ws.closed
                 break
             except errors.WebsocketClientClosedConnectionError as exc:
                 logger.debug(
                     f"Client {self.client_id} closed the connection with code {exc.code} and reason {exc.reason}"
                 )
-                await remove_client(self._user_id)
+                resumable = not ws.closed and exc.code not in _FINAL_CLOSE_CODES
+                break
+            except msgspec.DecodeError as exc:
+                logger.debug(f"Client {self.client_id} sent a malformed payload, closing with DECODE_ERROR: {exc}")
+                await ws.send_close(code=errors.WebsocketCloseCode.DECODE_ERROR, reason="Malformed payload sent")
+                resumable = False
                 break
             else:
-                if payload.op == DISPATCH:
+                self._last_seen = time.monotonic()
+                if isinstance(payload, DispatchPayload):
                     await dispatch_handler(payload, self)
+                elif isinstance(payload, HeartbeatPayload):
+                    self.send_frame(ws.encode_payload(HeartbeatAckPayload()))
+
+        if ws is not self._ws:
+            logger.debug(f"Old connection of client {self.client_id} ended after the session was resumed")
+            return
+        self.stop_writing()
+        await disconnect_handler(self, resumable)
@@ -1,16 +1,31 @@
 from __future__ import annotations
 
+import asyncio
+import os
+import shutil
+import signal
+import tempfile
+import time
 import typing
 
+from sanic.log import logger
+
+from backend.internal.ws import sharding
+from backend.internal.ws.scheduler import SCHEDULER
 from backend.internal.ws.websocket_manager import WebsocketManager
+from shared.internal import tracing
 
 if typing.TYPE_CHECKING:
     import sanic
     from sanic.models.handler_types import RouteHandler
 
     from backend.internal.ws import GameLobbyBase
+    from backend.internal.ws.directory_channel import LobbyChangeT
+
+__all__ = ("REAPER_INTERVAL", "WebsocketEndpointsManager")
 
-__all__ = ("WebsocketEndpointsManager",)
+REAPER_INTERVAL: typing.Final[float] = 5.0
+"""Interval in seconds in which idle clients are looked for."""
 
 
 class WebsocketEndpointsManager:
@@ -18,16 +33,105 @@ class WebsocketEndpointsManager:
 
     Each lobby has a websocket endpoint (used to connect to the websocket),
     and 2 rest endpoints that can be used to create new lobbys and to get a list of existing lobbys.
+    Each game mode also has a websocket endpoint for subscribing to changes of its lobbys.
+
+    It also runs a single background task that disconnects idle clients of every lobby and removes lobbys that have
+    been empty for too long. If wire tracing is enabled, the trace of a worker is logged when it receives SIGUSR1.
+
+    With multiple workers every worker owns the lobbys it created, see `backend.internal.ws.sharding`.
 
     Authors: Christopher
     """
 
     def __init__(self, app: sanic.Sanic) -> None:
         self._app = app
-        self._endpoints = []
+        self._endpoints: dict[str, WebsocketManager[typing.Any]] = {}
+        self._directory = sharding.LobbyDirectory.from_env()
+        self._app.main_process_start(self._setup_shards)
+        self._app.main_process_stop(self._cleanup_shards)
+        self._app.after_server_start(self._start_reaper)
+        self._app.after_server_start(self._install_trace_dump)
+        self._app.after_server_start(self._start_broker)
+        self._app.before_server_stop(self._stop_broker)
+        self._app.before_server_stop(self._stop_scheduler)
+
+    @staticmethod
+    async def _setup_shards(app: sanic.Sanic, _: asyncio.AbstractEventLoop) -> None:
+        """Tells the workers, which are started after this, how many shards there are and where their sockets live."""
+        os.environ[sharding.SHARDS_ENV] = str(app.state.workers)
+        os.environ[sharding.SHARD_DIR_ENV] = tempfile.mkdtemp(prefix="casino-")
+
+    @staticmethod
+    async def _cleanup_shards(_: sanic.Sanic, __: asyncio.AbstractEventLoop) -> None:
+        if socket_dir := os.environ.pop(sharding.SHARD_DIR_ENV, None):
+            shutil.rmtree(socket_dir, ignore_errors=True)
+
+    async def _start_broker(self, _: sanic.Sanic, __: asyncio.AbstractEventLoop) -> None:
+        await self._directory.start(
+            list_handler=lambda game: self._endpoints[game].local_listing(),
+            relay_handler=self._handle_relay,
+            changes_handler=self._handle_directory_changes,
+        )
+
+    async def _stop_broker(self, _: sanic.Sanic, __: asyncio.AbstractEventLoop) -> None:
+        await self._directory.close()
+
+    async def _handle_relay(
+        self, game: str, lobby_id: str, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        if (endpoint := self._endpoints.get(game)) is None:
+            logger.warning("received relay for unknown game mode %s", game)
+            return
+        await endpoint.handle_relay(reader, writer, lobby_id)
+
+    async def _handle_directory_changes(self, game: str, changes: list[LobbyChangeT]) -> None:
+        if (endpoint := self._endpoints.get(game)) is not None:
+            await endpoint.handle_directory_changes(changes)
+
+    async def _start_reaper(self, app: sanic.Sanic, _: asyncio.AbstractEventLoop) -> None:
+        app.add_task(self._reap_idle_clients(), name="websocket_reaper")
+
+    async def _stop_scheduler(self, _: sanic.Sanic, __: asyncio.AbstractEventLoop) -> None:
+        await SCHEDULER.close()
+
+    async def _install_trace_dump(self, _: sanic.Sanic, loop: asyncio.AbstractEventLoop) -> None:
+        if tracing.tracer is not None and hasattr(signal, "SIGUSR1"):
+            loop.add_signal_handler(signal.SIGUSR1, self._dump_wire_trace)
+
+    @staticmethod
+    def _dump_wire_trace() -> None:
+        if (tracer := tracing.tracer) is not None:
+            tracer.log_dump(logger)
+
+    async def _reap_idle_clients(self) -> None:
+        """Task that periodically disconnects clients which stopped sending heartbeats and removes empty lobbys.
+
+        Authors: Christopher
+        """
+        while True:
+            await asyncio.sleep(REAPER_INTERVAL)
+            now = time.monotonic()
+            reaped = 0
+            removed = 0
+            for endpoint in self._endpoints.values():
+                try:
+                    reaped += await endpoint.reap_idle_clients(now)
+                    removed += await endpoint.reap_empty_lobbys(now)
+                except Exception as exc:  # noqa: BLE001
+                    logger.exception("Exception occurred when reaping idle clients", exc_info=exc)
+            if reaped:
+                logger.info("Disconnected %s idle clients", reaped)
+            if removed:
+                logger.info("Removed %s empty lobbys", removed)
 
     def add_lobby(self, game_lobby_type: type[GameLobbyBase]) -> None:
-        endpoint = WebsocketManager[game_lobby_type](game_lobby_type)
+        endpoint = WebsocketManager[game_lobby_type](game_lobby_type, self._directory)
+        self._endpoints[game_lobby_type.endpoint()] = endpoint
+        self._app.add_websocket_route(
+            endpoint.handle_directory,
+            f"/{game_lobby_type.endpoint()}/directory",
+            name=game_lobby_type.endpoint() + "_directory_ws",
+        )
         self._app.add_websocket_route(
             endpoint.handle_websocket,
             f"/{game_lobby_type.endpoint()}/<lobby_id:str>",
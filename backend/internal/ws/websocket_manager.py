@@ -1,36 +1,57 @@
 from __future__ import annotations
 
 import asyncio
-import random
-import string
+import contextlib
+import os
 import typing
 
 import jwt
-import msgspec.json
+import msgspec
 import sanic
 import websockets
+from sanic.exceptions import ServiceUnavailable
 from sanic.log import logger
 
-from backend.db import models as db_models  # noqa: TC001
 from backend.db.queries import Queries  # noqa: TC001
 from backend.internal import errors
+from backend.internal import identity
+from backend.internal import metrics
+from backend.internal import ratelimit
 from backend.internal import serialization
 from backend.internal.ws import GameLobbyBase
+from backend.internal.ws import broker
+from backend.internal.ws import listing
+from backend.internal.ws.directory_channel import DIRECTORY_LOBBY_ID
+from backend.internal.ws.directory_channel import LobbyChangeBuffer
+from backend.internal.ws.directory_channel import LobbyDirectoryChannel
 from backend.internal.ws.websocket_client import WebsocketClient
-from backend.utils import tokens
+from shared.internal import codecs
 from shared.internal import opcodes
+from shared.internal import tracing
+from shared.models import events
 from shared.models import internal as internal_models
 from shared.models import responses
 
 if typing.TYPE_CHECKING:
+    from backend.internal.ws.directory_channel import LobbyChangeT
+    from backend.internal.ws.sharding import LobbyDirectory
     from shared.internal import Snowflake
 
-__all__ = ("WebsocketManager", "_WebsocketTransport")
+__all__ = ("HANDSHAKE_TIMEOUT", "MAX_LOBBYS", "WebsocketManager", "_RelayTransport", "_WebsocketTransport")
+
+HANDSHAKE_TIMEOUT: typing.Final[float] = 10.0
+"""Time in seconds a client has to finish the handshake, before the connection gets closed."""
+
+MAX_LOBBYS: typing.Final[int] = int(os.getenv("CASINO_MAX_LOBBYS", "1000"))
+"""Maximum amount of lobbys of every game mode a single worker keeps open, further lobbys are rejected."""
+
+_HANDSHAKE_RATE_LIMIT: typing.Final[ratelimit.RateLimit] = ratelimit.RateLimit(rate=2, burst=10)
+_CREATE_LOBBY_RATE_LIMIT: typing.Final[ratelimit.RateLimit] = ratelimit.RateLimit(rate=0.5, burst=5)
 
 
 class _WebsocketTransport:
     """Class used for low level message transport used with websockets. The main purpose of this class is en/decoding
-    messages from json to objects or from objects to json.
+    messages from the negotiated wire codec to objects or from objects to the wire codec.
 
     It also handles closing the connection.
 
@@ -39,49 +60,83 @@ class _WebsocketTransport:
 
     def __init__(self, *, ws: sanic.Websocket) -> None:
         self._ws = ws
-        self._decoder = msgspec.json.Decoder(type=internal_models.WebSocketPayload)
-        self._encoder = msgspec.json.Encoder()
+        self._init_connection_state()
+
+    def _init_connection_state(self) -> None:
+        """Sets up the state every transport has, independent of what the connection is sent over."""
+        self._codec: codecs.Codec = codecs.JSON
         self._sent_close = False
+        self._close_code: int | None = None
+
+    @property
+    def closed(self) -> bool:
+        """Whether the server closed the connection."""
+        return self._sent_close
+
+    @property
+    def close_code(self) -> int | None:
+        """Code the server closed the connection with, None if it didn't close it."""
+        return self._close_code
+
+    @property
+    def codec(self) -> codecs.Codec:
+        """Codec used for en/decoding payloads, this is always JSON until the handshake is done."""
+        return self._codec
+
+    def set_codec(self, codec: codecs.Codec) -> None:
+        self._codec = codec
 
     async def send_close(self, *, code: int, reason: str) -> None:
         if self._sent_close:
             return
 
         self._sent_close = True
+        self._close_code = code
         logger.debug("sending close frame with code %s and message %s", code, reason)
-        await self._ws.close(code=code, reason=reason)
+        await self._close(code, reason)
 
-    async def recieve_payload(self) -> internal_models.WebSocketPayload:
-        json = await self._recieve_data()
+    async def recieve_payload(self) -> internal_models.AnyPayload:
+        data = await self.recieve_data()
+        if (tracer := tracing.tracer) is not None:
+            tracer.record(tracing.Direction.RECEIVED, self._codec, data)
+        return self._codec.decode(data, internal_models.AnyPayload)
 
-        logger.debug("received payload with size %s\n    %s", len(json), json)
+    async def send_payload(self, payload: internal_models.WebSocketPayload) -> None:
+        await self.send_frame(self.encode_payload(payload))
 
-        return self._decoder.decode(json)
+    def encode_payload(self, payload: internal_models.WebSocketPayload) -> bytes:
+        return self._codec.encode(payload)
 
-    async def send_payload(self, payload: internal_models.WebSocketPayload) -> None:
-        json = self._encoder.encode(payload)
-        logger.debug("sending payload with size %s\n    %s", len(json), json)
+    async def send_frame(self, frame: bytes) -> None:
+        """Sends an already encoded payload. This is used to send the same frame to multiple clients."""
+        if (tracer := tracing.tracer) is not None:
+            tracer.record(tracing.Direction.SENT, self._codec, frame)
+        await self._send(frame)
 
-        await self._ws.send(json)
+    async def _send(self, frame: bytes) -> None:
+        await self._ws.send(frame)
 
-    async def _recieve_data(self) -> bytes:
+    async def _close(self, code: int, reason: str) -> None:
+        await self._ws.close(code=code, reason=reason)
+
+    async def recieve_data(self) -> bytes | str:
+        """Receives the next TEXT or BINARY message as is."""
         try:
             data = await self._ws.recv()
         except websockets.ConnectionClosed as e:
             self._handle_close(e)
         except asyncio.CancelledError:
+            # sanic cancels receiving when a close frame arrives, so check whether the client closed the connection
+            if (rcvd := self._ws.ws_proto.close_rcvd) is not None:
+                raise errors.WebsocketClientClosedConnectionError(reason=rcvd.reason, code=rcvd.code) from None
             msg = "Client cancelled"
             raise errors.WebsocketConnectionError(reason=msg) from None
         except sanic.ServerError as exc:
             msg = "Internal Server Error"
             raise errors.WebsocketConnectionError(reason=msg) from exc
         else:
-            if isinstance(data, str):
-                return data.encode()
-                # msg = "Unexpected message type received TEXT, expected BINARY"
-                # raise errors.WebsocketTransportError(reason=msg)
             if data is None:
-                msg = "Unexpected message received None, expected BINARY"
+                msg = "Unexpected message received None, expected TEXT or BINARY"
                 raise errors.WebsocketTransportError(reason=msg)
             return data
 
@@ -92,47 +147,228 @@ class _WebsocketTransport:
         raise errors.WebsocketConnectionError(reason=msg)
 
 
+class _RelayTransport(_WebsocketTransport):
+    """Transport for a websocket connection that another worker relays to this worker using the broker.
+
+    Authors: Christopher
+    """
+
+    def __init__(self, *, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._reader = reader
+        self._writer = writer
+        self._init_connection_state()
+
+    @typing.override
+    async def _send(self, frame: bytes) -> None:
+        try:
+            await broker.write_frame(self._writer, broker.FrameKind.BINARY, frame)
+        except ConnectionError as exc:
+            msg = "Relay closed"
+            raise errors.WebsocketConnectionError(reason=msg) from exc
+
+    @typing.override
+    async def _close(self, code: int, reason: str) -> None:
+        try:
+            await broker.write_frame(self._writer, broker.FrameKind.CLOSE, broker.encode_close(code, reason))
+        except ConnectionError:
+            logger.debug("relay closed before the close frame could be sent")
+        self._writer.close()
+
+    @typing.override
+    async def recieve_data(self) -> bytes | str:
+        try:
+            kind, data = await broker.read_frame(self._reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            msg = "Relay closed"
+            raise errors.WebsocketConnectionError(reason=msg) from None
+        if kind is broker.FrameKind.CLOSE:
+            code, reason = broker.decode_close(data)
+            raise errors.WebsocketClientClosedConnectionError(reason=reason, code=code)
+        if kind is broker.FrameKind.TEXT:
+            return data.decode()
+        return data
+
+
 T = typing.TypeVar("T", bound=GameLobbyBase)
 
 
+def _count_handshake(ws: _WebsocketTransport, *, ok: bool = False) -> None:
+    """Counts a finished handshake by its result, which is the close code the server closed the connection with."""
+    if ok:
+        result = "OK"
+    elif ws.close_code is None:
+        result = "CLOSED"
+    else:
+        result = errors.WebsocketCloseCode(ws.close_code).name
+    metrics.HANDSHAKES.labels(result).inc()
+
+
 class WebsocketManager(typing.Generic[T]):
     """Class managing the endpoints for a specific GameLobby `T`.
 
     The main purpose is to store all lobbys for each game mode and to manage them.
     Each WebsocketManager instance manages one game mode.
 
+    It also runs the lobby directory of the game mode, a websocket channel pushing every change of the lobbys to the
+    clients subscribed to it, see `backend.internal.ws.directory_channel`.
+
     Authors: Christopher
     """
 
-    def __init__(self, lobby_class: type[T]) -> None:
+    def __init__(self, lobby_class: type[T], directory: LobbyDirectory) -> None:
         self._lobby_class = lobby_class
+        self._directory = directory
         self._lobbys: dict[str, T] = {}
-        self._identify_decoder = msgspec.json.Decoder(type=internal_models.IdentifyPayload)
-
-    async def handle_websocket(
-        self, request: sanic.Request, ws: sanic.Websocket, lobby_id: str, queries: Queries
-    ) -> None:
+        self._listing = listing.LobbyListing(self._public_lobbys)
+        self._changes = LobbyChangeBuffer(self._flush_changes)
+        self._channel: LobbyDirectoryChannel | None = None
+        self._background_tasks: set[asyncio.Task[None]] = set()
+        self._created = metrics.LOBBYS_CREATED.labels(lobby_class.endpoint())
+        self._reaped = metrics.LOBBYS_REAPED.labels(lobby_class.endpoint())
+        self._active = metrics.LOBBYS_ACTIVE.labels(lobby_class.endpoint())
+        # creating the limiter right away makes an invalid limit in the environment fail the startup
+        ratelimit.limiter("websocket_handshake", _HANDSHAKE_RATE_LIMIT)
+
+    async def handle_websocket(self, request: sanic.Request, ws: sanic.Websocket, lobby_id: str) -> None:
         """Function called when a new client connects to the websocket endpoint for this game mode.
 
         This function then handles authentication and if everything goes well it passes the ws connection down to
-        the lobby instance the user wanted to connect to.
+        the lobby instance the user wanted to connect to. Connections to lobbys owned by another worker are relayed
+        to that worker.
+
+        Authors: Christopher
+        """
+        if not await self._admit(request, ws):
+            return
+        if not self._directory.is_local(lobby_id):
+            await self._relay_to_owner(ws, lobby_id)
+            return
+        await self._serve(_WebsocketTransport(ws=ws), request, lobby_id)
+
+    async def handle_directory(self, request: sanic.Request, ws: sanic.Websocket, queries: Queries) -> None:
+        """Function called when a new client subscribes to the lobby directory of this game mode.
+
+        Subscribers use the same handshake as game lobbys. Every worker has its own directory channel, so these
+        connections are never relayed.
+
+        Authors: Christopher
+        """
+        if not await self._admit(request, ws):
+            return
+        if (channel := self._channel) is None:
+            channel = typing.cast(
+                "LobbyDirectoryChannel", LobbyDirectoryChannel(lobby_id=DIRECTORY_LOBBY_ID, queries=queries)
+            )
+            channel.set_snapshot(self._directory_snapshot)
+            self._channel = channel
+        await self._serve_lobby(_WebsocketTransport(ws=ws), request, channel)
+
+    @staticmethod
+    async def _admit(request: sanic.Request, ws: sanic.Websocket) -> bool:
+        """Closes the connection with RATE_LIMITED, if the address of the client opened too many connections.
 
         Authors: Christopher
         """
+        rate_limiter = ratelimit.limiter("websocket_handshake", _HANDSHAKE_RATE_LIMIT)
+        if not rate_limiter.acquire(ratelimit.remote_address(request)):
+            return True
+        logger.debug("client %s opened too many websocket connections", ratelimit.remote_address(request))
         _ws = _WebsocketTransport(ws=ws)
+        await _ws.send_close(code=errors.WebsocketCloseCode.RATE_LIMITED, reason="Too many connections")
+        _count_handshake(_ws)
+        return False
+
+    async def handle_directory_changes(self, changes: list[LobbyChangeT]) -> None:
+        """Function called with the changes of lobbys owned by another worker.
+
+        Authors: Christopher
+        """
+        if self._channel is not None:
+            await self._channel.broadcast_changes(changes)
+
+    async def handle_relay(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, lobby_id: str) -> None:
+        """Function called when another worker relays a websocket connection to a lobby of this worker.
+
+        Authors: Christopher
+        """
+        await self._serve(_RelayTransport(reader=reader, writer=writer), None, lobby_id)
+
+    async def _relay_to_owner(self, ws: sanic.Websocket, lobby_id: str) -> None:
+        """Relays every frame between the client and the worker owning the lobby, until either side closes.
+
+        Authors: Christopher
+        """
+        _ws = _WebsocketTransport(ws=ws)
+        try:
+            reader, writer = await self._directory.open_relay(self._lobby_class.endpoint(), lobby_id)
+        except OSError as exc:
+            logger.warning("failed relaying client to the owner of lobby %s: %r", lobby_id, exc)
+            await _ws.send_close(code=errors.WebsocketCloseCode.TRY_AGAIN_LATER, reason="Lobby is unavailable")
+            _count_handshake(_ws)
+            return
+
+        to_owner = asyncio.create_task(self._relay_client_frames(_ws, writer))
+        try:
+            while True:
+                kind, data = await broker.read_frame(reader)
+                if kind is broker.FrameKind.CLOSE:
+                    code, reason = broker.decode_close(data)
+                    await _ws.send_close(code=code, reason=reason)
+                    break
+                await ws.send(data.decode() if kind is broker.FrameKind.TEXT else data)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            await _ws.send_close(code=errors.WebsocketCloseCode.TRY_AGAIN_LATER, reason="Lobby is unavailable")
+        finally:
+            to_owner.cancel()
+            writer.close()
+
+    @staticmethod
+    async def _relay_client_frames(ws: _WebsocketTransport, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                data = await ws.recieve_data()
+                if isinstance(data, str):
+                    await broker.write_frame(writer, broker.FrameKind.TEXT, data.encode())
+                else:
+                    await broker.write_frame(writer, broker.FrameKind.BINARY, data)
+        except errors.WebsocketClientClosedConnectionError as exc:
+            with contextlib.suppress(ConnectionError):
+                await broker.write_frame(writer, broker.FrameKind.CLOSE, broker.encode_close(exc.code, exc.reason))
+        except (errors.WebsocketError, ConnectionError) as exc:
+            logger.debug("stopped relaying frames of client: %r", exc)
+        writer.close()
+
+    async def _serve(self, _ws: _WebsocketTransport, request: sanic.Request | None, lobby_id: str) -> None:
+        """Looks up the lobby a connection wants to join and serves the connection.
+
+        Authors: Christopher
+        """
         if not (lobby := self._lobbys.get(lobby_id)):
             msg = f"client tried joining lobby using invalid lobby id {lobby_id}."
             logger.debug(msg)
             await _ws.send_close(code=errors.WebsocketCloseCode.INVALID_LOBBY, reason="Lobby not found")
+            _count_handshake(_ws)
             return
+        await self._serve_lobby(_ws, request, lobby)
+
+    async def _serve_lobby(self, _ws: _WebsocketTransport, request: sanic.Request | None, lobby: GameLobbyBase) -> None:
+        """Runs the handshake on a connection and then passes it down to the lobby.
+
+        Authors: Christopher
+        """
+        lobby_id = lobby.lobby_id
         try:
-            user_id = await self._connect(ws=_ws, request=request, lobby=lobby, queries=queries)
+            user_id = await self._connect(ws=_ws, request=request, lobby=lobby, queries=lobby.queries)
 
         except OverflowError:
             msg = f"client tried joining lobby {lobby_id} even though the lobby is full."
             logger.debug(msg)
             await _ws.send_close(code=errors.WebsocketCloseCode.LOBBY_FULL, reason="Lobby is full")
 
+        except LookupError:
+            logger.debug("client tried joining lobby %s, which was closed during the handshake.", lobby_id)
+            await _ws.send_close(code=errors.WebsocketCloseCode.INVALID_LOBBY, reason="Lobby not found")
+
         except errors.WebsocketConnectionError as ex:
             logger.warning("failed to communicate with client, reason was: %r.", ex.reason)
 
@@ -149,10 +385,14 @@ class WebsocketManager(typing.Generic[T]):
             logger.exception("encountered some unhandled error", exc_info=exc)
 
         else:
+            _count_handshake(_ws, ok=True)
             await lobby.handle_ws(user_id)
+            return
+
+        _count_handshake(_ws)
 
     async def _connect(
-        self, *, ws: _WebsocketTransport, request: sanic.Request, lobby: T, queries: Queries
+        self, *, ws: _WebsocketTransport, request: sanic.Request | None, lobby: GameLobbyBase, queries: Queries
     ) -> Snowflake:
         """This function handles the "handshake" at the beginning of each websocket connection.
 
@@ -160,16 +400,29 @@ class WebsocketManager(typing.Generic[T]):
         the "handshake" is ready to begin and then waits for a IDENTIFY message which contains the token
         of the user, used for authentication.
 
+        Instead of IDENTIFY the client can also send a RESUME message, to continue a session whose connection
+        dropped. In that case no READY is sent, the client receives RESUMED and every DISPATCH it missed instead.
+
+        The client has to send its IDENTIFY message within `HANDSHAKE_TIMEOUT` seconds, otherwise the connection is
+        closed so that half-open connections can't keep waiting forever.
+
         Authors: Christopher
         """
-        await ws.send_payload(payload=internal_models.WebSocketPayload(op=opcodes.HELLO, d={}))
+        hello = internal_models.HelloData(
+            codecs=list(codecs.CODECS), heartbeat_interval=int(lobby.heartbeat_interval * 1_000)
+        )
+        await ws.send_payload(payload=internal_models.HelloPayload(d=hello))
+        handshake_deadline = asyncio.get_running_loop().call_later(HANDSHAKE_TIMEOUT, self._handshake_timed_out, ws)
         try:
             payload = await ws.recieve_payload()
-            if payload.op == opcodes.IDENTIFY:
-                ident_payload = msgspec.convert(payload.d, type=internal_models.IdentifyPayload)
-                user_id = tokens.decode_token(ident_payload.token)
-                user = await queries.get_user_by_id(id_=user_id)
-                if not user:
+            handshake_deadline.cancel()
+            if isinstance(payload, internal_models.IdentifyPayload):
+                ident_payload = payload.d
+                user_id = identity.identities.verify_token(ident_payload.token)
+                user = await identity.identities.get_identity(user_id, queries)
+                # the balance is read from the writer, it may have changed moments ago
+                money = await queries.get_user_money(id_=user_id) if user is not None else None
+                if user is None or money is None:
                     msg = (
                         f"token used for authentication contained id: {user_id} which does not belong to any user,"
                         "closing with AUTHENTICATION_FAILED"
@@ -177,11 +430,31 @@ class WebsocketManager(typing.Generic[T]):
                     logger.debug(msg)
                     await ws.send_close(code=errors.WebsocketCloseCode.AUTHENTICATION_FAILED, reason="Unknown user")
                     raise errors.WebsocketConnectionError(reason=msg) from None
-                lobby.set_client(user_id, WebsocketClient.new_client(ws=ws, request=request, user_id=user_id))
-                await lobby.send_ready(user)
+                if (codec := codecs.CODECS.get(ident_payload.codec)) is None:
+                    msg = f"client requested unsupported codec {ident_payload.codec!r}, closing with UNSUPPORTED_CODEC"
+                    logger.debug(msg)
+                    await ws.send_close(code=errors.WebsocketCloseCode.UNSUPPORTED_CODEC, reason="Unsupported codec")
+                    raise errors.WebsocketConnectionError(reason=msg) from None
+                ws.set_codec(codec)
+                client = WebsocketClient.new_client(
+                    ws=ws,
+                    request=request,
+                    user_id=user_id,
+                    queue_size=lobby.outbound_queue_size,
+                    overflow_policy=lobby.outbound_overflow_policy,
+                )
+                try:
+                    lobby.set_client(user_id, client)
+                except (OverflowError, LookupError):
+                    client.stop_writing()
+                    raise
+                await lobby.send_ready(responses.PublicUser(id=user.id, username=user.username, money=money))
                 return user_id
+            if isinstance(payload, internal_models.ResumePayload):
+                return await self._resume(ws=ws, lobby=lobby, resume=payload.d)
             msg = (
-                f"expected {opcodes.IDENTIFY} (IDENTIFY) opcode, received {payload.op}, closing with NOT_AUTHENTICATED"
+                f"expected {opcodes.IDENTIFY} (IDENTIFY) or {opcodes.RESUME} (RESUME) opcode, "
+                f"received {payload.__struct_config__.tag}, closing with NOT_AUTHENTICATED"
             )
             logger.debug(msg)
             await ws.send_close(code=errors.WebsocketCloseCode.NOT_AUTHENTICATED, reason="Expected HELLO or RESUME op")
@@ -192,45 +465,163 @@ class WebsocketManager(typing.Generic[T]):
             await ws.send_close(code=errors.WebsocketCloseCode.NOT_AUTHENTICATED, reason="Expected HELLO or RESUME op")
             raise errors.WebsocketConnectionError(reason=msg) from None
         except msgspec.DecodeError as exc:
-            msg = "received malformed json from the client, closing with DECODE_ERROR"
+            msg = "received malformed payload from the client, closing with DECODE_ERROR"
             logger.debug(msg, exc_info=exc)
-            await ws.send_close(code=errors.WebsocketCloseCode.DECODE_ERROR, reason="Malformed json sent")
+            await ws.send_close(code=errors.WebsocketCloseCode.DECODE_ERROR, reason="Malformed payload sent")
             raise errors.WebsocketConnectionError(reason=msg) from None
+        finally:
+            handshake_deadline.cancel()
 
-    @serialization.serialize()
-    async def list_lobbys(self, _: sanic.Request) -> list[responses.PublicGameLobby]:
-        """Endpoint that lists every available lobby for this game mode.
+    async def _resume(
+        self, *, ws: _WebsocketTransport, lobby: GameLobbyBase, resume: internal_models.ResumeData
+    ) -> Snowflake:
+        """Resumes the session of a client, closing with SESSION_INVALID if the session can't be resumed.
 
         Authors: Christopher
         """
-        return [
-            responses.PublicGameLobby(
-                max_clients=lobby.max_num_clients, id=l_id, num_clients=lobby.num_clients, full=lobby.is_full
-            )
-            for l_id, lobby in self._lobbys.items()
-        ]
+        user_id = identity.identities.verify_token(resume.token)
+        if (codec := codecs.CODECS.get(resume.codec)) is None:
+            msg = f"client requested unsupported codec {resume.codec!r}, closing with UNSUPPORTED_CODEC"
+            logger.debug(msg)
+            await ws.send_close(code=errors.WebsocketCloseCode.UNSUPPORTED_CODEC, reason="Unsupported codec")
+            raise errors.WebsocketConnectionError(reason=msg) from None
+        ws.set_codec(codec)
+        if not lobby.resume_client(ws, user_id, resume.session_id, resume.seq):
+            msg = f"client of user {user_id} tried resuming session {resume.session_id}, closing with SESSION_INVALID"
+            logger.debug(msg)
+            await ws.send_close(code=errors.WebsocketCloseCode.SESSION_INVALID, reason="Session can't be resumed")
+            raise errors.WebsocketConnectionError(reason=msg) from None
+        return user_id
+
+    def _handshake_timed_out(self, ws: _WebsocketTransport) -> None:
+        """Closes a connection that didn't finish the handshake in time, which also stops waiting for IDENTIFY."""
+        logger.debug("client did not identify within %ss, closing with HANDSHAKE_TIMEOUT", HANDSHAKE_TIMEOUT)
+        task = asyncio.create_task(
+            ws.send_close(code=errors.WebsocketCloseCode.HANDSHAKE_TIMEOUT, reason="Handshake timed out")
+        )
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def reap_idle_clients(self, now: float) -> int:
+        """Disconnects idle clients of every lobby of this game mode. Returns the amount of disconnected clients.
+
+        Authors: Christopher
+        """
+        reaped = 0
+        for lobby in list(self._lobbys.values()):
+            reaped += await lobby.reap_idle_clients(now)
+        if self._channel is not None:
+            reaped += await self._channel.reap_idle_clients(now)
+        return reaped
 
-    def _gen_new_lobby_id(self) -> str:
-        """Generates a new 5 character long lobby id.
+    async def reap_empty_lobbys(self, now: float) -> int:
+        """Removes and closes every lobby that has been empty for longer than its `empty_lobby_ttl`.
+
+        This is called periodically by the same reaper task as `reap_idle_clients`. Returns the amount of removed
+        lobbys.
 
         Authors: Christopher
         """
-        chars = string.ascii_uppercase + string.digits
-        while True:
-            lobby_id = "".join(random.choices(chars, k=5))
-            if not self._lobbys.get(lobby_id):
-                return lobby_id
+        expired = [lobby for lobby in self._lobbys.values() if lobby.is_expired(now)]
+        for lobby in expired:
+            del self._lobbys[lobby.lobby_id]
+            self._changes.publish(events.LobbyRemoved(lobby_id=lobby.lobby_id))
+            await lobby.close()
+        if expired:
+            self._listing.invalidate()
+            self._reaped.inc(len(expired))
+            self._active.dec(len(expired))
+        return len(expired)
+
+    async def list_lobbys(self, request: sanic.Request) -> sanic.HTTPResponse:
+        """Endpoint that lists every available lobby for this game mode, including the lobbys of other workers.
+
+        The listing is cached until a lobby changes, see `backend.internal.ws.listing` for filters and pagination.
 
+        Authors: Christopher
+        """
+        query = listing.ListingQuery.from_request(request)
+        local = self.local_listing()
+        # a client polling an unchanged listing is answered without asking the other shards
+        if (versions := self._directory.remote_versions(self._lobby_class.endpoint())) is not None:
+            versions[self._directory.index] = local.version
+            if (response := self._listing.respond_cached(request, query, self._listing.etag(versions))) is not None:
+                return response
+
+        remote = await self._directory.list_remote_lobbys(self._lobby_class.endpoint())
+        versions = {index: response.version for index, response in remote.items()}
+        versions[self._directory.index] = local.version
+        return self._listing.respond(
+            request,
+            query,
+            self._listing.etag(versions),
+            lambda: self._listing.merge(local.lobbys, *(response.lobbys for response in remote.values())),
+        )
+
+    def local_listing(self) -> broker.ListLobbysResponse:
+        """Lists the lobbys of this game mode owned by the current worker.
+
+        Authors: Christopher
+        """
+        return broker.ListLobbysResponse(version=self._listing.version, lobbys=self._listing.lobbys())
+
+    async def _directory_snapshot(self) -> list[responses.PublicGameLobby]:
+        """Every lobby of this game mode including the lobbys of other workers, sent to new directory subscribers."""
+        remote = await self._directory.list_remote_lobbys(self._lobby_class.endpoint())
+        return self._listing.merge(self._listing.lobbys(), *(response.lobbys for response in remote.values()))
+
+    def _public_lobbys(self) -> list[responses.PublicGameLobby]:
+        return [self._public_lobby(lobby) for lobby in self._lobbys.values()]
+
+    @staticmethod
+    def _public_lobby(lobby: GameLobbyBase) -> responses.PublicGameLobby:
+        return responses.PublicGameLobby(
+            max_clients=lobby.max_num_clients, id=lobby.lobby_id, num_clients=lobby.num_clients, full=lobby.is_full
+        )
+
+    def _lobby_changed(self, lobby: GameLobbyBase) -> None:
+        self._listing.invalidate()
+        self._changes.publish(events.LobbyUpdated(lobby=self._public_lobby(lobby)))
+
+    async def _flush_changes(self, changes: list[LobbyChangeT]) -> None:
+        """Sends coalesced changes of lobbys of this worker to the directory subscribers of every worker."""
+        if self._channel is not None:
+            await self._channel.broadcast_changes(changes)
+        if self._directory.sharded:
+            await self._directory.publish_changes(
+                broker.DirectoryChanges(
+                    game=self._lobby_class.endpoint(),
+                    shard=self._directory.index,
+                    version=self._listing.version,
+                    changes=changes,
+                )
+            )
+
+    @ratelimit.rate_limit("create_lobby", _CREATE_LOBBY_RATE_LIMIT)
     @serialization.serialize()
-    async def create_lobby(self, _: sanic.Request, queries: Queries, user: db_models.User) -> responses.PublicGameLobby:
+    async def create_lobby(
+        self, _: sanic.Request, queries: Queries, user: identity.Identity
+    ) -> responses.PublicGameLobby:
         """Endpoint that creates a new lobby for this game mode.
 
+        If the worker already has `MAX_LOBBYS` open lobbys, this is rejected with 503 before anything gets created.
+
         Authors: Christopher
         """
-        lobby_id = self._gen_new_lobby_id()
+        if sum(active.value for _, active in metrics.LOBBYS_ACTIVE.items()) >= MAX_LOBBYS:
+            metrics.LOBBYS_REJECTED.inc()
+            raise ServiceUnavailable(
+                "Too many open lobbys, try again later.",
+                headers={"Retry-After": str(int(self._lobby_class.empty_lobby_ttl))},
+            )
+        lobby_id = self._directory.new_lobby_id(self._lobbys.__contains__)
         logger.debug("user %s requested creating lobby %s", user.id, lobby_id)
         lobby = self._lobby_class(lobby_id=lobby_id, queries=queries)
         self._lobbys[lobby_id] = lobby
-        return responses.PublicGameLobby(
-            max_clients=lobby.max_num_clients, id=lobby_id, num_clients=lobby.num_clients, full=lobby.is_full
-        )
+        self._created.inc()
+        self._active.inc()
+        lobby.add_membership_callback(self._lobby_changed)
+        self._listing.invalidate()
+        public_lobby = self._public_lobby(lobby)
+        self._changes.publish(events.LobbyCreated(lobby=public_lobby))
+        return public_lobby
@@ -3,21 +3,23 @@
 from __future__ import annotations
 
 import http
-import pathlib
 import typing
 
-import aiosqlite
 import msgspec.json
 import sanic
 from sanic.log import logger
 
+from backend import monitoring
 from backend.authentication import router as auth_router
 from backend.blackjack import Blackjack
 from backend.chickengame import Chickengame
-from backend.db import models
 from backend.db.queries import Queries
 from backend.dependencys import get_current_user
+from backend.internal import database
+from backend.internal import identity
+from backend.internal import migrations
 from backend.internal.errors import InternalServerError
+from backend.internal.loop_monitor import LoopMonitor
 from backend.internal.ws import WebsocketEndpointsManager
 from backend.mines import Mines
 from backend.slots import Slots
@@ -29,37 +31,49 @@ if typing.TYPE_CHECKING:
     import asyncio
 
 
-PROJECT_DIR = pathlib.Path(__file__).parent.parent
-DB_DIR = PROJECT_DIR / "db"
-
 app = sanic.Sanic("Casino")
+loop_monitor = LoopMonitor()
+app.before_server_start(loop_monitor.start)
+app.after_server_stop(loop_monitor.stop)
 app.blueprint(auth_router)
 app.blueprint(users_router, url_prefix="/users")
-queries_: Queries | None = None
+app.blueprint(monitoring.router)
+app.on_request(monitoring.start_request_timer)
+app.on_response(monitoring.observe_request_latency)
+queries_: database.PooledQueries | None = None
+
+
+@app.main_process_start
+async def migrate_db(_: sanic.Sanic, __: asyncio.AbstractEventLoop) -> None:
+    """Apply the pending migrations once, before any worker opens the database.
+
+    Authors: Christopher
+    """
+    migrations.migrate(database.DATABASE_PATH, migrations.load())
 
 
 @app.before_server_start
 async def add_dependency(app_: sanic.Sanic, _: asyncio.AbstractEventLoop) -> None:
-    """Create database connection.
+    """Create the database connection pool.
 
     Authors: Christopher
     """
-    aiosqlite_conn = await aiosqlite.connect("sqlite.db")
-    await aiosqlite_conn.executescript((DB_DIR / "schema.sql").read_text())
+    pool = await database.ConnectionPool.open(database.DATABASE_PATH)
     global queries_
-    queries_ = Queries(aiosqlite_conn)
-    app_.ext.dependency(queries_)
-    app_.ext.add_dependency(models.User, get_current_user)
+    queries_ = pooled_queries = database.PooledQueries(pool)
+    # registered as `Queries`, because that's the type endpoints and lobbys ask for
+    app_.ext.add_dependency(Queries, lambda *_: pooled_queries)
+    app_.ext.add_dependency(identity.Identity, get_current_user)
 
 
 @app.after_server_stop
 async def teardown_db(__: sanic.Sanic, _: asyncio.AbstractEventLoop) -> None:
-    """Close the database connection when server shutting down.
+    """Close the database connections when server shutting down.
 
     Authors: Christopher
     """
     if queries_ is not None:
-        await queries_.conn.close()
+        await queries_.pool.close()
 
 
 ws_endpoints = WebsocketEndpointsManager(app=app)
@@ -80,7 +94,9 @@ async def error_handler(_: sanic.Request, exception: Exception) -> sanic.HTTPRes
     name: str = ""
     message: str = ""
     detail: str = ""
+    headers: dict[str, str] = {}
     if isinstance(exception, sanic.SanicException):
+        headers = exception.headers
         try:
             code = http.HTTPStatus(exception.status_code)
             name = code.name
@@ -102,6 +118,7 @@ async def error_handler(_: sanic.Request, exception: Exception) -> sanic.HTTPRes
         body=error_encoder.encode(ErrorResponse(message=message, detail=detail, name=name)),
         status=code,
         content_type="application/json",
+        headers=headers,
     )
 
 
@@ -3,12 +3,16 @@ from __future__ import annotations
 import random
 import typing
 
+from backend.internal import database
+from backend.internal.ratelimit import RateLimit
 from backend.internal.ws import GameLobbyBase
 from backend.internal.ws import WebsocketClient
 from backend.internal.ws import add_event_listener
 from shared.models import events
 
 if typing.TYPE_CHECKING:
+    from collections.abc import Mapping
+
     from backend.db.queries import Queries
 
 
@@ -21,6 +25,10 @@ class Mines(GameLobbyBase):
     Author: Quirin
     """
 
+    event_rate_limits: typing.ClassVar[Mapping[type[events.BaseEvent], RateLimit]] = {
+        events.MinesMineClicked: RateLimit(rate=10, burst=25)
+    }
+
     def __init__(self, *, lobby_id: str, queries: Queries) -> None:
         super().__init__(lobby_id=lobby_id, queries=queries)
         self.money = 1000
@@ -42,17 +50,28 @@ class Mines(GameLobbyBase):
         return 1.0 / prob_safe_sequence
 
     @add_event_listener(events.ReadyEvent)
-    async def start_game(self, event: events.ReadyEvent, _: WebsocketClient) -> None:
+    async def start_game(self, _: events.ReadyEvent, ws: WebsocketClient) -> None:
         """
         Loads money from db
         """
-        self.money = event.user.money
-        await self.send_event(events.UpdateMoney(money=self.money), _)
+        self.money = await self.get_money_by_client(ws)
+        await self.send_event(events.UpdateMoney(money=self.money), ws)
 
     @add_event_listener(events.MinesChangeStake)
-    async def change_stake_callback(self, event: events.MinesChangeStake, _: WebsocketClient) -> None:
+    async def change_stake_callback(self, event: events.MinesChangeStake, ws: WebsocketClient) -> None:
+        if not event.amount or self.stake + event.amount < 0:
+            return
+        if event.amount > 0:
+            balance = await self.queries.debit_user_money(amount=event.amount, id_=ws.user_id)
+        else:
+            # lowering the stake pays the difference back
+            balance = await self.queries.add_user_money(amount=-event.amount, id_=ws.user_id)
+        await database.commit(self.queries)
+        if balance is None:
+            await self.send_event(events.UpdateMoney(money=self.money), ws)
+            return
         self.stake += event.amount
-        self.money -= event.amount
+        self.money = balance
 
     @add_event_listener(events.MinesMineClicked)
     async def mine_clicked_callback(self, event: events.MinesMineClicked, _: WebsocketClient) -> None:
@@ -79,8 +98,11 @@ class Mines(GameLobbyBase):
 
     @add_event_listener(events.MinesChashout)
     async def chashout_callback(self, _: events.MinesChashout, ws: WebsocketClient) -> None:
-        self.money += int(self.stake * self.multiplier)
-        await self.queries.update_user_money(money=self.money, id_=ws.user_id)
+        if (
+            balance := await self.queries.add_user_money(amount=int(self.stake * self.multiplier), id_=ws.user_id)
+        ) is not None:
+            self.money = balance
+        await database.commit(self.queries)
         await self.send_event(events.MinesChashoutResponse(balance=self.money), ws)
         self.stake = 0
         self.remaining_mines = 25
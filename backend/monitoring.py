@@ -0,0 +1,49 @@
+"""Endpoint exposing the metrics of the server to Prometheus, and the middleware timing REST requests.
+
+Every worker process has its own metrics, so every sample carries the `pid` of the worker that answered the scrape.
+"""
+
+from __future__ import annotations
+
+__all__ = ("observe_request_latency", "router", "start_request_timer")
+
+import os
+import time
+
+import sanic
+
+from backend.internal import metrics
+
+router = sanic.Blueprint("monitoring")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics")
+async def get_metrics(_: sanic.Request) -> sanic.HTTPResponse:
+    """Returns every metric of the worker in the Prometheus text exposition format.
+
+    Authors: Christopher
+    """
+    return sanic.text(metrics.render({"pid": str(os.getpid())}), content_type=CONTENT_TYPE)
+
+
+async def start_request_timer(request: sanic.Request) -> None:
+    """Request middleware remembering when the request arrived.
+
+    Authors: Christopher
+    """
+    request.ctx.started_at = time.perf_counter()
+
+
+async def observe_request_latency(request: sanic.Request, _: sanic.HTTPResponse) -> None:
+    """Response middleware recording how long responding took, per method and route pattern.
+
+    Websocket handlers never send a response, so only REST requests are recorded.
+
+    Authors: Christopher
+    """
+    if (started_at := getattr(request.ctx, "started_at", None)) is None:
+        return
+    route = f"/{request.route.path}" if request.route is not None else "<unmatched>"
+    metrics.REQUEST_LATENCY.labels(f"{request.method} {route}").observe(time.perf_counter() - started_at)
@@ -6,9 +6,11 @@ import argon2
 import sanic
 
 from backend import utils
-from backend.db import models  # noqa: TC001
 from backend.db.queries import Queries  # noqa: TC001
+from backend.internal import database
 from backend.internal import errors
+from backend.internal import identity
+from backend.internal import ratelimit
 from backend.internal import serialization
 from shared.internal import snowflakes
 from shared.models import requests
@@ -19,33 +21,37 @@ router = sanic.Blueprint("users")
 
 @router.get("/me")
 @serialization.serialize()
-async def get_me(_: sanic.Request, user: models.User) -> responses.PublicUser:
-    """Get the current user's information.
+async def get_me(_: sanic.Request, user: identity.Identity, queries: Queries) -> responses.PublicUser:
+    """Get the current user's information, the balance is always read from the db.
 
     Authors: Christopher
     """
-    return utils.convert_struct(user, responses.PublicUser)
+    if (money := await queries.get_user_money(id_=user.id)) is None:
+        raise sanic.NotFound("User not found")
+    return responses.PublicUser(id=user.id, username=user.username, money=money)
 
 
 @router.post("/")
+@ratelimit.rate_limit("create_user", ratelimit.RateLimit(rate=0.2, burst=10))
 @serialization.deserialize()
 async def create_user(_: sanic.Request, request_body: requests.LoginRequest, queries: Queries) -> sanic.HTTPResponse:
     """Endpoint to create a new user.
 
-    This checks if the username is available and hashes the password and then adds the user to the db.
+    This hashes the password and then adds the user to the db. The insert does nothing if the username is taken, which
+    is answered with 409, so two sign-ups using the same username can't both succeed.
 
-    Authors: Quirin
+    Authors: Quirin, Christopher
     """
-    db_user = await queries.get_user_by_username(username=request_body.username)
-    if db_user is not None:
-        raise sanic.SanicException(message="Username already exists", status_code=http.HTTPStatus.CONFLICT)
-
     user_id = snowflakes.generate_snowflake()
     try:
         hashed_user_pw = utils.password_hasher.hash(request_body.password)
     except argon2.exceptions.HashingError as e:
         raise errors.InternalServerError(custom_code=errors.InternalServerErrorCodes.HASHING_FAILED) from e
 
-    await queries.create_user(id_=user_id, username=request_body.username, password=hashed_user_pw, money=1000)
-    await queries.conn.commit()
+    created = await queries.create_user(
+        id_=user_id, username=request_body.username, password=hashed_user_pw, money=1000
+    )
+    await database.commit(queries)
+    if not created:
+        raise sanic.SanicException(message="Username already exists", status_code=http.HTTPStatus.CONFLICT)
     return sanic.empty()
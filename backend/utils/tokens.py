@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-__all__ = ("DEFAULT_EXPIRY", "decode_token", "generate_token")
+__all__ = ("DEFAULT_EXPIRY", "decode_token", "decode_token_with_expiry", "generate_token")
 
 import datetime
 
@@ -57,7 +57,32 @@ def decode_token(token: str) -> Snowflake:
         Raised when either the decoding fails, or there is no user id stored in the jwt.
 
     """
-    payload = jwt.decode(jwt=token, key=SECRET_KEY, algorithms=("HS256",))
+    user_id, _ = decode_token_with_expiry(token)
+    return user_id
+
+
+def decode_token_with_expiry(token: str) -> tuple[Snowflake, float]:
+    """Decodes a jwt token and returns the stored user id and when the token expires.
+
+    Authors: Christopher
+
+    Parameters
+    ----------
+    token : str
+        The jwt token to decode
+
+    Returns
+    -------
+    tuple[Snowflake, float]
+        The user id stored in the jwt token and the expiry of the token as unix timestamp
+
+    Raises
+    ------
+    jwt.exceptions.PyJWTError
+        Raised when either the decoding fails, or there is no user id stored in the jwt.
+
+    """
+    payload = jwt.decode(jwt=token, key=SECRET_KEY, algorithms=("HS256",), options={"require": ["exp"]})
     if user_id := payload.get("user_id"):
-        return Snowflake(user_id)
+        return Snowflake(user_id), float(payload["exp"])
     raise jwt.exceptions.PyJWTError
@@ -0,0 +1,96 @@
+"""Builds realistic sample instances of the events sent over the websocket protocol.
+
+Authors: Christopher
+"""
+
+from __future__ import annotations
+
+__all__ = ("all_event_types", "all_model_types", "sample_event", "sample_events", "sample_struct")
+
+import datetime
+import typing
+
+import msgspec
+
+from shared.internal import Snowflake
+from shared.internal import generate_snowflake
+from shared.models import events
+from shared.models import requests
+from shared.models import responses
+
+if typing.TYPE_CHECKING:
+    import collections.abc
+
+LIST_LENGTH: typing.Final[int] = 3
+"""Amount of elements sample lists have, this roughly matches a blackjack table with a few players."""
+
+
+def all_event_types() -> list[type[events.BaseEvent]]:
+    """Returns every event type, including indirect subclasses of `BaseEvent`."""
+    result: list[type[events.BaseEvent]] = []
+    pending = list(events.BaseEvent.__subclasses__())
+    while pending:
+        event_type = pending.pop(0)
+        result.append(event_type)
+        pending.extend(event_type.__subclasses__())
+    return result
+
+
+def all_model_types() -> list[type[msgspec.Struct]]:
+    """Returns every struct of `shared.models`: events, requests and responses."""
+    result: list[type[msgspec.Struct]] = list(all_event_types())
+    for module in (requests, responses):
+        result.extend(
+            value
+            for value in vars(module).values()
+            if isinstance(value, type) and issubclass(value, msgspec.Struct) and value.__module__ == module.__name__
+        )
+    return result
+
+
+def _sample_value(info: msgspec.inspect.Type, name: str) -> typing.Any:  # noqa: ANN401, PLR0911, PLR0912
+    """Builds a sample value for a field, the name of the field is used to make strings look realistic."""
+    match info:
+        case msgspec.inspect.BoolType():
+            return True
+        case msgspec.inspect.IntType():
+            return 1_500
+        case msgspec.inspect.FloatType():
+            return 2.75
+        case msgspec.inspect.StrType():
+            return f"{name}-sample"
+        case msgspec.inspect.NoneType():
+            return None
+        case msgspec.inspect.DateTimeType():
+            return datetime.datetime(2025, 5, 1, 12, 30, tzinfo=datetime.UTC)
+        case msgspec.inspect.CustomType(cls=cls) if cls is Snowflake:
+            return generate_snowflake()
+        case msgspec.inspect.ListType(item_type=item) | msgspec.inspect.VarTupleType(item_type=item):
+            return [_sample_value(item, name) for _ in range(LIST_LENGTH)]
+        case msgspec.inspect.DictType(value_type=value):
+            return {f"{name}-{i}": _sample_value(value, name) for i in range(LIST_LENGTH)}
+        case msgspec.inspect.UnionType(types=types):
+            return _sample_value(next(t for t in types if not isinstance(t, msgspec.inspect.NoneType)), name)
+        case msgspec.inspect.LiteralType(values=values):
+            return values[0]
+        case msgspec.inspect.StructType(cls=cls, fields=fields):
+            return cls(**{field.name: _sample_value(field.type, field.name) for field in fields})
+        case _:
+            msg = f"Can't build a sample value for {info!r}"
+            raise NotImplementedError(msg)
+
+
+def sample_struct[StructT: msgspec.Struct](struct_type: type[StructT]) -> StructT:
+    """Builds an instance of `struct_type` with every field set to a sample value."""
+    return _sample_value(msgspec.inspect.type_info(struct_type), struct_type.__name__)
+
+
+def sample_event[EventT: events.BaseEvent](event_type: type[EventT]) -> EventT:
+    """Builds an instance of `event_type` with every field set to a sample value."""
+    return sample_struct(event_type)
+
+
+def sample_events() -> collections.abc.Iterator[events.BaseEvent]:
+    """Yields a sample instance for every event type."""
+    for event_type in all_event_types():
+        yield sample_event(event_type)
@@ -0,0 +1,495 @@
+"""Headless load generator playing real games against a running server.
+
+Every simulated client registers and logs in over REST, creates or joins a lobby, does the HELLO/IDENTIFY handshake
+and then plays a scripted session of its game mode until the run is over:
+
+- blackjack: tables of `--table-size` players, the first player of a table starts every round, everyone bets and
+  draws cards until their hand is worth at least 17.
+- mines: starts a game, clicks tiles and cashes out after three safe tiles.
+- slots: spins.
+- chickengame: asks for the multiplier of the next step and then takes the step.
+
+Clients wait `--think-time` seconds between their actions. The report contains the rate at which the clients
+connected, the events received per second and the p50/p99 latency from sending an action to receiving the event the
+server answered with, per game mode.
+
+The server rate limits sign-ups, logins, lobby creation and handshakes per address, so raise those limits for the
+server under test, e.g. `CASINO_RATE_LIMIT_CREATE_USER=1000/100000` (see `backend.internal.ratelimit`). Thousands of
+clients also need the open file limit of both processes raised, the load generator raises its own soft limit.
+
+Run it using `python -m benchmarks.loadgen --clients 1000 --duration 60` while the server is running.
+
+Authors: Christopher
+"""
+
+from __future__ import annotations
+
+__all__ = ("GameResult", "LoadResult", "main", "run")
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import sys
+import time
+import typing
+import uuid
+
+import httpx
+import msgspec
+import websockets
+from websockets.asyncio.client import connect
+
+from shared.internal import codecs
+from shared.models import events
+from shared.models import requests
+from shared.models import responses
+from shared.models.internal import AnyPayload
+from shared.models.internal import DispatchPayload
+from shared.models.internal import HeartbeatPayload
+from shared.models.internal import HelloPayload
+from shared.models.internal import IdentifyData
+from shared.models.internal import IdentifyPayload
+from shared.models.internal import ReadyPayload
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Callable
+    from collections.abc import Coroutine
+    from collections.abc import Sequence
+
+    from websockets.asyncio.client import ClientConnection
+
+    AnswerT = Callable[[events.BaseEvent], bool]
+
+GAMES: typing.Final[tuple[str, ...]] = ("blackjack", "mines", "slots", "chickengame")
+EVENT_TIMEOUT: typing.Final[float] = 30.0
+"""Time in seconds a client waits for the answer to an action before giving up on it."""
+
+
+class GameResult(msgspec.Struct):
+    game: str
+    clients: int
+    actions: int
+    """Amount of actions the server answered."""
+    p50_ms: float
+    p99_ms: float
+
+
+class LoadResult(msgspec.Struct):
+    clients: int
+    connected: int
+    failed: int
+    connect_per_second: float
+    """Handshakes completed per second while the clients were connecting."""
+    handshake_p50_ms: float
+    handshake_p99_ms: float
+    events_per_second: float
+    """Events received by every client per second while playing."""
+    games: list[GameResult]
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _Stats:
+    """Measurements collected by every client of a run."""
+
+    def __init__(self) -> None:
+        self.handshakes: list[float] = []
+        self.failures: dict[str, int] = {}
+        self.events_received = 0
+        self.latencies: dict[str, list[float]] = {game: [] for game in GAMES}
+
+    def fail(self, reason: str) -> None:
+        self.failures[reason] = self.failures.get(reason, 0) + 1
+
+
+class _Client:
+    """A simulated player connected to a lobby.
+
+    Received events are matched against the answers actions are waiting for. Only clients created with `collect`
+    keep the other events, for scripts that react to events the server sends on its own.
+    """
+
+    def __init__(self, ws: ClientConnection, codec: codecs.Codec, *, game: str, stats: _Stats, collect: bool) -> None:
+        self.username = ""
+        self._ws = ws
+        self._codec = codec
+        self._game = game
+        self._stats = stats
+        self._waiting: list[tuple[AnswerT, float, asyncio.Future[events.BaseEvent] | None]] = []
+        # None is put into the queue once the connection is closed
+        self._events: asyncio.Queue[events.BaseEvent | None] | None = asyncio.Queue() if collect else None
+        self._tasks: list[asyncio.Task[None]] = []
+
+    @classmethod
+    async def connect(
+        cls, base_url: str, game: str, lobby_id: str, token: str, *, codec: codecs.Codec, stats: _Stats, collect: bool
+    ) -> _Client:
+        """Opens a connection to a lobby and does the handshake, the READY event is already handled afterwards."""
+        start = time.perf_counter()
+        ws = await connect(f"{base_url}/{game}/{lobby_id}/", max_size=None, compression=None)
+        hello = codecs.JSON.decode(await ws.recv(), AnyPayload)
+        if not isinstance(hello, HelloPayload):
+            msg = f"expected HELLO, received {type(hello).__name__}"
+            raise TypeError(msg)
+        await ws.send(codecs.JSON.encode(IdentifyPayload(d=IdentifyData(token=token, codec=codec.name))).decode())
+        ready = codec.decode(await ws.recv(), AnyPayload)
+        if not isinstance(ready, ReadyPayload):
+            msg = f"expected READY, received {type(ready).__name__}"
+            raise TypeError(msg)
+        stats.handshakes.append(time.perf_counter() - start)
+
+        client = cls(ws, codec, game=game, stats=stats, collect=collect)
+        client.username = ready.d.user.username
+        client._tasks.append(asyncio.create_task(client._receive()))
+        if hello.d.heartbeat_interval:
+            client._tasks.append(asyncio.create_task(client._heartbeat(hello.d.heartbeat_interval / 1_000)))
+        return client
+
+    async def _send(self, payload: DispatchPayload | HeartbeatPayload) -> None:
+        frame = self._codec.encode(payload)
+        await self._ws.send(frame if self._codec.binary else frame.decode())
+
+    async def _heartbeat(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await self._send(HeartbeatPayload())
+
+    async def _receive(self) -> None:
+        try:
+            await self._receive_events()
+        finally:
+            for _, _, future in self._waiting:
+                if future is not None and not future.done():
+                    future.set_exception(ConnectionError("connection closed"))
+            self._waiting.clear()
+            if self._events is not None:
+                self._events.put_nowait(None)
+
+    async def _receive_events(self) -> None:
+        async for frame in self._ws:
+            payload = self._codec.decode(frame, AnyPayload)
+            if not isinstance(payload, DispatchPayload):
+                continue
+            event = payload.d
+            self._stats.events_received += 1
+            for entry in self._waiting:
+                answer, sent_at, future = entry
+                if answer(event):
+                    self._waiting.remove(entry)
+                    self._stats.latencies[self._game].append(time.perf_counter() - sent_at)
+                    if future is not None and not future.done():
+                        future.set_result(event)
+                    break
+            if self._events is not None:
+                self._events.put_nowait(event)
+
+    async def send(self, event: events.BaseEvent, answer: AnswerT | None = None) -> None:
+        """Sends an action, the latency until an event matching `answer` is received gets recorded."""
+        if answer is not None:
+            self._waiting.append((answer, time.perf_counter(), None))
+        await self._send(DispatchPayload(d=event))
+
+    async def act(self, event: events.BaseEvent, answer: AnswerT) -> events.BaseEvent:
+        """Sends an action and waits for the event matching `answer`."""
+        future: asyncio.Future[events.BaseEvent] = asyncio.get_running_loop().create_future()
+        self._waiting.append((answer, time.perf_counter(), future))
+        await self._send(DispatchPayload(d=event))
+        return await asyncio.wait_for(future, EVENT_TIMEOUT)
+
+    async def next_event(self, deadline: float) -> events.BaseEvent | None:
+        """Waits for the next event the server sent, None if `deadline` passed before one was received."""
+        if self._events is None:
+            msg = "events are only collected by clients created with collect=True"
+            raise RuntimeError(msg)
+        remaining = deadline - time.monotonic()
+        try:
+            event = await asyncio.wait_for(self._events.get(), min(EVENT_TIMEOUT, remaining))
+        except TimeoutError:
+            if remaining < EVENT_TIMEOUT:
+                return None
+            raise
+        if event is None:
+            raise ConnectionError("connection closed")
+        return event
+
+    @property
+    def close_code(self) -> int | None:
+        return self._ws.close_code
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._ws.close()
+
+
+def _is(*event_types: type[events.BaseEvent]) -> AnswerT:
+    return lambda event: isinstance(event, event_types)
+
+
+async def _play_slots(client: _Client, deadline: float, think_time: float) -> None:
+    while time.monotonic() < deadline:
+        await client.act(events.StartSpin(einsatz=5), _is(events.Spin_Animation, events.kein_Geld))
+        await asyncio.sleep(think_time)
+
+
+async def _play_mines(client: _Client, deadline: float, think_time: float) -> None:
+    tiles = itertools.cycle(itertools.product(range(5), range(5)))
+    while time.monotonic() < deadline:
+        await client.act(events.MinesStartGame(), _is(events.UpdateMoney))
+        await client.send(events.MinesChangeStake(amount=10))
+        for _ in range(3):
+            await asyncio.sleep(think_time)
+            x, y = next(tiles)
+            answer = await client.act(
+                events.MinesMineClicked(x=x, y=y), _is(events.MinesMineClickedResponse, events.MinesGameOver)
+            )
+            if isinstance(answer, events.MinesGameOver):
+                break
+        else:
+            await client.act(events.MinesChashout(), _is(events.MinesChashoutResponse))
+        await asyncio.sleep(think_time)
+
+
+async def _play_chickengame(client: _Client, deadline: float, think_time: float) -> None:
+    await client.send(events.UpdateGamemode(gamemode=0))
+    step, take = 1, 0
+    while time.monotonic() < deadline:
+        await client.act(events.UpdateMultiplier(multiplier=0, step_text=step), _is(events.UpdateMultiplierResponse))
+        answer = await client.act(events.DoStep(stake=10, take=take, step=step), _is(events.DoStepResponse))
+        take = typing.cast("events.DoStepResponse", answer).take
+        step = step + 1 if take else 1
+        await asyncio.sleep(think_time)
+
+
+async def _play_blackjack(client: _Client, deadline: float, think_time: float, *, host: bool) -> None:
+    def mine(event_type: type[events.BlackjackBetSet | events.BlackjackCardAdded]) -> AnswerT:
+        return lambda event: isinstance(event, event_type) and event.username == client.username
+
+    if host:
+        await client.send(events.BlackjackStartGame())
+    hand = 0
+    finished = False
+    while (event := await client.next_event(deadline)) is not None:
+        match event:
+            case events.BlackjackWaitingForBet():
+                hand = 0
+                await asyncio.sleep(think_time)
+                await client.send(events.BlackjackSetBet(bet=10), mine(events.BlackjackBetSet))
+            case events.BlackjackCardAdded(username=username, card=card) if username == client.username:
+                hand += card.value
+            case events.BlackjackPlayerAction(username=username) if username == client.username:
+                await asyncio.sleep(think_time)
+                if hand < 17:  # noqa: PLR2004
+                    await client.send(events.BlackjackDrawCard(), mine(events.BlackjackCardAdded))
+                else:
+                    await client.send(events.BlackjackHoldCard(), _is(events.BlackjackPlayerAction))
+            case events.BlackjackWin() | events.BlackjackDraw() | events.BlackjackDefeat():
+                finished = True
+            case events.BlackjackUpdateGame(started=False) if host and finished:
+                # the table was reset after the round, so the next one can be started
+                finished = False
+                await asyncio.sleep(think_time)
+                await client.send(events.BlackjackStartGame())
+            case _:
+                pass
+
+
+class _LoadGenerator:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self._args = args
+        self._http = httpx.AsyncClient(base_url=args.url, timeout=EVENT_TIMEOUT)
+        self._ws_url = "ws" + args.url.removeprefix("http")
+        self._codec = codecs.CODECS[args.codec]
+        self._stats = _Stats()
+        self._setup = asyncio.Semaphore(args.concurrency)
+
+    async def _login(self) -> str:
+        credentials = requests.LoginRequest(username=f"load-{uuid.uuid4().hex[:12]}", password=uuid.uuid4().hex)
+        response = await self._http.post("/users/", content=msgspec.json.encode(credentials))
+        response.raise_for_status()
+        response = await self._http.post("/login", content=msgspec.json.encode(credentials))
+        response.raise_for_status()
+        return msgspec.json.decode(response.content, type=responses.LoginResponse).token
+
+    async def _create_lobby(self, game: str, token: str) -> str:
+        response = await self._http.post(f"/{game}/", headers={"Authorization": f"Bearer {token}"})
+        response.raise_for_status()
+        return msgspec.json.decode(response.content, type=responses.PublicGameLobby).id
+
+    async def _register_table(self, size: int) -> list[str] | None:
+        """Registers the players of a table, returns their tokens."""
+        async with self._setup:
+            try:
+                return [await self._login() for _ in range(size)]
+            except httpx.HTTPError as exc:
+                self._stats.fail(f"register: {exc!r}"[:80])
+                return None
+
+    async def _seat_table(self, game: str, tokens: list[str]) -> list[tuple[str, bool, _Client]]:
+        """Creates the lobby of a table and connects its players, the first one is the host."""
+        async with self._setup:
+            try:
+                lobby_id = await self._create_lobby(game, tokens[0])
+            except httpx.HTTPError as exc:
+                self._stats.fail(f"create lobby: {exc!r}"[:80])
+                return []
+        clients = await asyncio.gather(*(self._join(game, lobby_id, token) for token in tokens))
+        return [(game, i == 0, client) for i, client in enumerate(clients) if client is not None]
+
+    async def _join(self, game: str, lobby_id: str, token: str) -> _Client | None:
+        async with self._setup:
+            try:
+                return await _Client.connect(
+                    self._ws_url,
+                    game,
+                    lobby_id,
+                    token,
+                    codec=self._codec,
+                    stats=self._stats,
+                    collect=game == "blackjack",
+                )
+            except (OSError, TypeError, TimeoutError, websockets.WebSocketException, msgspec.DecodeError) as exc:
+                self._stats.fail(f"connect: {exc!r}"[:80])
+                return None
+
+    def _script(
+        self, game: str, client: _Client, deadline: float, *, host: bool
+    ) -> Coroutine[typing.Any, typing.Any, None]:
+        think_time = self._args.think_time
+        match game:
+            case "blackjack":
+                return _play_blackjack(client, deadline, think_time, host=host)
+            case "mines":
+                return _play_mines(client, deadline, think_time)
+            case "slots":
+                return _play_slots(client, deadline, think_time)
+            case _:
+                return _play_chickengame(client, deadline, think_time)
+
+    async def _play(self, game: str, client: _Client, deadline: float, *, host: bool) -> None:
+        try:
+            await self._script(game, client, deadline, host=host)
+        except TimeoutError:
+            self._stats.fail(f"{game}: no answer within {EVENT_TIMEOUT}s")
+        except (websockets.ConnectionClosed, ConnectionError):
+            self._stats.fail(f"{game}: closed with {client.close_code}")
+        finally:
+            await client.close()
+
+    async def run(self) -> LoadResult:
+        args = self._args
+        assigned = list(itertools.islice(itertools.cycle(args.games), args.clients))
+        sizes = {game: args.table_size if game == "blackjack" else 1 for game in GAMES}
+        # blackjack clients are grouped into tables, so fewer lobbys are needed for them
+        lobbys: list[tuple[str, int]] = []
+        for game in args.games:
+            count = assigned.count(game)
+            lobbys.extend((game, min(sizes[game], count - i)) for i in range(0, count, sizes[game]))
+
+        print(f"registering {args.clients} clients...", file=sys.stderr)  # noqa: T201
+        registered = await asyncio.gather(*(self._register_table(size) for _, size in lobbys))
+
+        # lobbys are only created now, so that none of them is removed for being empty while clients register
+        print(f"connecting to {len(lobbys)} lobbys...", file=sys.stderr)  # noqa: T201
+        connect_start = time.perf_counter()
+        seated = await asyncio.gather(
+            *(
+                self._seat_table(game, tokens)
+                for (game, _), tokens in zip(lobbys, registered, strict=True)
+                if tokens is not None
+            )
+        )
+        connect_elapsed = time.perf_counter() - connect_start
+
+        print(f"playing for {args.duration}s...", file=sys.stderr)  # noqa: T201
+        received_before = self._stats.events_received
+        play_start = time.perf_counter()
+        deadline = time.monotonic() + args.duration
+        await asyncio.gather(
+            *(self._play(game, client, deadline, host=host) for table in seated for game, host, client in table)
+        )
+        play_elapsed = time.perf_counter() - play_start
+        await self._http.aclose()
+
+        stats = self._stats
+        return LoadResult(
+            clients=args.clients,
+            connected=len(stats.handshakes),
+            failed=sum(stats.failures.values()),
+            connect_per_second=len(stats.handshakes) / connect_elapsed if connect_elapsed else 0.0,
+            handshake_p50_ms=_percentile(stats.handshakes, 0.5) * 1_000,
+            handshake_p99_ms=_percentile(stats.handshakes, 0.99) * 1_000,
+            events_per_second=(stats.events_received - received_before) / play_elapsed,
+            games=[
+                GameResult(
+                    game=game,
+                    clients=assigned.count(game),
+                    actions=len(stats.latencies[game]),
+                    p50_ms=_percentile(stats.latencies[game], 0.5) * 1_000,
+                    p99_ms=_percentile(stats.latencies[game], 0.99) * 1_000,
+                )
+                for game in args.games
+            ],
+        )
+
+    @property
+    def failures(self) -> dict[str, int]:
+        return self._stats.failures
+
+
+def _raise_open_file_limit() -> None:
+    with contextlib.suppress(ImportError, ValueError, OSError):
+        import resource
+
+        _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def run(args: argparse.Namespace) -> tuple[LoadResult, dict[str, int]]:
+    """Runs the load test described by the parsed command line arguments, returns the result and the failures."""
+    generator = _LoadGenerator(args)
+    result = await generator.run()
+    return result, generator.failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="base url of the server")
+    parser.add_argument("-c", "--clients", type=int, default=100, help="amount of simulated clients")
+    parser.add_argument("-d", "--duration", type=float, default=30.0, help="seconds the clients play")
+    parser.add_argument("--games", type=lambda value: value.split(","), default=list(GAMES), help="game modes played")
+    parser.add_argument("--table-size", type=int, default=4, help="players per blackjack table")
+    parser.add_argument("--think-time", type=float, default=0.5, help="seconds between the actions of a client")
+    parser.add_argument("--concurrency", type=int, default=50, help="clients registering or connecting at once")
+    parser.add_argument("--codec", choices=list(codecs.CODECS), default=codecs.MSGPACK.name, help="wire codec")
+    args = parser.parse_args()
+    if unknown := set(args.games) - set(GAMES):
+        parser.error(f"unknown game modes: {', '.join(sorted(unknown))}")
+
+    _raise_open_file_limit()
+    result, failures = asyncio.run(run(args))
+
+    print(  # noqa: T201
+        f"clients {result.clients}, connected {result.connected}, failed {result.failed}\n"
+        f"connections/s {result.connect_per_second:,.1f}, "
+        f"handshake p50 {result.handshake_p50_ms:.1f}ms p99 {result.handshake_p99_ms:.1f}ms\n"
+        f"events/s {result.events_per_second:,.1f}\n"
+    )
+    print(f"{'game':<12} {'clients':>8} {'actions':>8} {'p50 ms':>8} {'p99 ms':>8}")  # noqa: T201
+    for game in result.games:
+        print(  # noqa: T201
+            f"{game.game:<12} {game.clients:>8} {game.actions:>8} {game.p50_ms:>8.1f} {game.p99_ms:>8.1f}"
+        )
+    for reason, count in sorted(failures.items(), key=lambda item: -item[1]):
+        print(f"{count:>6}x {reason}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Measures how many lobbies of every game mode can be created per second.
+
+This is the work done by `POST /<game>/` apart from the http handling. For comparison the cost of scanning an
+instance for listeners using `dir()`, which is what every lobby creation did before listeners were collected once
+per class, is measured as well.
+
+Run it using `python -m benchmarks.lobby_creation`.
+
+Authors: Christopher
+"""
+
+from __future__ import annotations
+
+__all__ = ("LobbyResult", "main", "measure")
+
+import argparse
+import time
+import typing
+
+import msgspec
+
+from backend.blackjack import Blackjack
+from backend.chickengame import Chickengame
+from backend.mines import Mines
+from backend.slots import Slots
+
+if typing.TYPE_CHECKING:
+    from backend.db.queries import Queries
+    from backend.internal.ws import GameLobbyBase
+
+LOBBY_TYPES: typing.Final[tuple[type[GameLobbyBase], ...]] = (Blackjack, Chickengame, Mines, Slots)
+
+
+class LobbyResult(msgspec.Struct):
+    lobby: str
+    listeners: int
+    """Amount of listeners collected for the lobby class."""
+    per_second: float
+    """Lobbies created per second."""
+    dir_scan_us: float
+    """Average time it takes to scan a lobby for listeners using `dir()` in microseconds."""
+
+
+def _scan_listeners(lobby: GameLobbyBase) -> int:
+    found = 0
+    for attr_name in dir(lobby):
+        maybe_listener = getattr(lobby, attr_name)
+        if callable(maybe_listener) and hasattr(maybe_listener, "__event_type__"):
+            found += 1
+    return found
+
+
+def measure(lobby_type: type[GameLobbyBase], number: int) -> LobbyResult:
+    """Creates `number` lobbies of `lobby_type` and measures the time it took."""
+    queries = typing.cast("Queries", None)
+
+    start = time.perf_counter()
+    lobbies = [typing.cast("GameLobbyBase", lobby_type(lobby_id="AAAAA", queries=queries)) for _ in range(number)]
+    elapsed = time.perf_counter() - start
+
+    scan_start = time.perf_counter()
+    for lobby in lobbies:
+        _scan_listeners(lobby)
+    scan_elapsed = time.perf_counter() - scan_start
+
+    return LobbyResult(
+        lobby=lobby_type.__name__,
+        listeners=sum(len(funcs) for _, funcs in lobby_type.__event_listeners__.values()),
+        per_second=number / elapsed,
+        dir_scan_us=scan_elapsed / number * 1_000_000,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--number", type=int, default=20_000, help="lobbies created per game mode")
+    args = parser.parse_args()
+
+    print(f"{'lobby':<12} {'listeners':>9} {'lobbies/s':>12} {'dir() scan us':>14}")  # noqa: T201
+    for lobby_type in LOBBY_TYPES:
+        result = measure(lobby_type, args.number)
+        print(  # noqa: T201
+            f"{result.lobby:<12} {result.listeners:>9} {result.per_second:>12,.0f} {result.dir_scan_us:>14.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
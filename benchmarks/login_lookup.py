@@ -0,0 +1,124 @@
+"""Measures how long looking up a user by username takes, the query every login and sign-up runs.
+
+A temporary database is filled with generated users up to every `--users` size. At every size the lookups are
+measured once as a full table scan, the way the schema was before the unique username index, and once with the index
+created by the `unique_username` migration. Lookups go through `PooledQueries.get_user_by_username`, so the time
+includes handing the query to the thread of the reader connection.
+
+Run it using `python -m benchmarks.login_lookup`.
+
+Authors: Christopher
+"""
+
+from __future__ import annotations
+
+__all__ = ("LookupResult", "main", "measure")
+
+import argparse
+import asyncio
+import pathlib
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import msgspec
+
+from backend.internal import database
+from backend.internal import migrations
+
+_PASSWORD_HASH = "$argon2id$v=19$m=65536,t=3,p=4$" + "x" * 22 + "$" + "y" * 43
+"""Placeholder as long as a real password hash, so rows have a realistic size."""
+
+
+class LookupResult(msgspec.Struct):
+    users: int
+    indexed: bool
+    plan: str
+    """Query plan SQLite chose for the lookup."""
+    mean_us: float
+    p50_us: float
+    p99_us: float
+
+
+def _fill(conn: sqlite3.Connection, start: int, stop: int) -> None:
+    conn.executemany(
+        "INSERT INTO users(id, username, password, money) VALUES (?, ?, ?, ?)",
+        ((i, f"user-{i}", _PASSWORD_HASH, 1_000) for i in range(start, stop)),
+    )
+    conn.commit()
+
+
+async def measure(path: str, users: int, lookups: int, *, indexed: bool) -> LookupResult:
+    """Looks up `lookups` random existing usernames and returns the latency percentiles."""
+    pool = await database.ConnectionPool.open(path, readers=1)
+    queries = database.PooledQueries(pool)
+    try:
+        plan_rows = await pool.writer.execute_fetchall(
+            "EXPLAIN QUERY PLAN SELECT * FROM users WHERE users.username = ?", ("user-0",)
+        )
+        timings: list[float] = []
+        for _ in range(lookups):
+            username = f"user-{random.randrange(users)}"
+            start = time.perf_counter()
+            user = await queries.get_user_by_username(username=username)
+            timings.append((time.perf_counter() - start) * 1_000_000)
+            if user is None:
+                msg = f"{username} not found"
+                raise LookupError(msg)
+    finally:
+        await pool.close()
+
+    percentiles = statistics.quantiles(timings, n=100)
+    return LookupResult(
+        users=users,
+        indexed=indexed,
+        plan="; ".join(row[3] for row in plan_rows),
+        mean_us=statistics.fmean(timings),
+        p50_us=percentiles[49],
+        p99_us=percentiles[98],
+    )
+
+
+async def _run(sizes: list[int], lookups: int, scan_lookups: int) -> list[LookupResult]:
+    results: list[LookupResult] = []
+    unique_username = next(migration for migration in migrations.load() if migration.name == "unique_username")
+    with tempfile.TemporaryDirectory(prefix="casino-login-lookup-") as tmp:
+        path = str(pathlib.Path(tmp) / "users.db")
+        migrations.migrate(path, migrations.load())
+        conn = sqlite3.connect(path)
+        filled = 0
+        for users in sorted(sizes):
+            conn.execute("DROP INDEX IF EXISTS users_username_key")
+            _fill(conn, filled, users)
+            filled = users
+            print(f"measuring {users} users...")  # noqa: T201
+            results.append(await measure(path, users, scan_lookups, indexed=False))
+            conn.executescript(unique_username.sql)
+            results.append(await measure(path, users, lookups, indexed=True))
+        conn.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "-u", "--users", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="database sizes to measure"
+    )
+    parser.add_argument("-n", "--lookups", type=int, default=5_000, help="lookups per size using the index")
+    parser.add_argument("--scan-lookups", type=int, default=50, help="lookups per size without the index")
+    args = parser.parse_args()
+
+    results = asyncio.run(_run(args.users, args.lookups, args.scan_lookups))
+
+    print(f"\n{'users':>9} {'index':<6} {'mean us':>10} {'p50 us':>10} {'p99 us':>10}  plan")  # noqa: T201
+    for result in results:
+        print(  # noqa: T201
+            f"{result.users:>9} {'yes' if result.indexed else 'no':<6} {result.mean_us:>10.1f} "
+            f"{result.p50_us:>10.1f} {result.p99_us:>10.1f}  {result.plan}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Measures every way structs of `shared.models` are serialized, for every event, request and response.
+
+The measured paths are:
+
+- `encode`: the JSON encoder of `backend.internal.serialization.serialize`, including `encode_hook`.
+- `decode`: a JSON decoder like the one of `backend.internal.serialization.deserialize`, including `decode_hook`.
+- `to_builtins` and `convert`: converting a struct to builtin types and back, including the hooks.
+- `convert_struct`: `backend.utils.convert_struct`, measured for the conversions done by the server.
+
+Every case is run `--repeat` times and the fastest run is kept, which keeps the results stable enough to compare.
+`--save` stores the results as a JSON baseline, `--compare` compares the results with a baseline and exits with 1 if
+a case got slower by more than `--threshold`. A baseline is only comparable on the machine it was recorded on.
+
+Run it using `python -m benchmarks.serialization --compare`.
+
+Authors: Christopher
+"""
+
+from __future__ import annotations
+
+__all__ = ("Baseline", "Change", "compare", "main", "measure")
+
+import argparse
+import functools
+import pathlib
+import platform
+import sys
+import time
+import typing
+
+import msgspec
+
+from backend.db.models import User
+from backend.internal import serialization
+from backend.utils import convert_struct
+from benchmarks._samples import all_model_types
+from benchmarks._samples import sample_struct
+from shared.internal import generate_snowflake
+from shared.internal.hooks import decode_hook
+from shared.internal.hooks import encode_hook
+from shared.models import responses
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Callable
+    from collections.abc import Iterator
+
+DEFAULT_BASELINE: typing.Final[pathlib.Path] = pathlib.Path(__file__).parent / "baselines" / "serialization.json"
+
+
+class Baseline(msgspec.Struct):
+    python: str
+    msgspec: str
+    machine: str
+    results: dict[str, float]
+    """Average time per call in nanoseconds, mapped from `<struct>.<path>`."""
+
+
+class Change(msgspec.Struct):
+    case: str
+    baseline_ns: float
+    current_ns: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current_ns / self.baseline_ns
+
+
+def _conversions() -> list[tuple[msgspec.Struct, type[msgspec.Struct]]]:
+    """Conversions done using `convert_struct`. The database models can't be inspected, so their samples are built
+    here.
+    """
+    user = User(id=generate_snowflake(), username="username-sample", password="password-sample", money=1_500)  # noqa: S106
+    return [(user, responses.PublicUser)]
+
+
+def _cases() -> Iterator[tuple[str, Callable[[], object]]]:
+    for struct_type in all_model_types():
+        obj = sample_struct(struct_type)
+        frame = serialization.encoder.encode(obj)
+        builtins = msgspec.to_builtins(obj, enc_hook=encode_hook)
+        decoder = msgspec.json.Decoder(struct_type, dec_hook=decode_hook)
+        name = struct_type.__name__
+        yield f"{name}.encode", functools.partial(serialization.encoder.encode, obj)
+        yield f"{name}.decode", functools.partial(decoder.decode, frame)
+        yield f"{name}.to_builtins", functools.partial(msgspec.to_builtins, obj, enc_hook=encode_hook)
+        yield f"{name}.convert", functools.partial(msgspec.convert, builtins, struct_type, dec_hook=decode_hook)
+
+    for obj, to_type in _conversions():
+        yield f"{type(obj).__name__}.convert_struct", functools.partial(convert_struct, obj, to_type)
+
+
+def _time_per_call(func: Callable[[], object], number: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter_ns() - start) / number)
+    return best
+
+
+def measure(number: int, repeat: int) -> Baseline:
+    """Measures every case, returns the average time per call of the fastest run of each case."""
+    return Baseline(
+        python=platform.python_version(),
+        msgspec=msgspec.__version__,
+        machine=f"{platform.system()} {platform.machine()} {platform.processor()}".strip(),
+        results={case: _time_per_call(func, number, repeat) for case, func in _cases()},
+    )
+
+
+def compare(baseline: Baseline, current: Baseline, threshold: float) -> tuple[list[Change], list[Change]]:
+    """Returns the cases that got slower and the ones that got faster by more than `threshold`."""
+    regressions: list[Change] = []
+    improvements: list[Change] = []
+    for case, current_ns in current.results.items():
+        if (baseline_ns := baseline.results.get(case)) is None:
+            continue
+        change = Change(case=case, baseline_ns=baseline_ns, current_ns=current_ns)
+        if change.ratio > 1 + threshold:
+            regressions.append(change)
+        elif change.ratio < 1 - threshold:
+            improvements.append(change)
+    return regressions, improvements
+
+
+def _print_changes(title: str, changes: list[Change]) -> None:
+    if not changes:
+        return
+    print(f"\n{title}:")  # noqa: T201
+    for change in sorted(changes, key=lambda change: change.ratio, reverse=True):
+        print(  # noqa: T201
+            f"  {change.case:<45} {change.baseline_ns:>9.0f} -> {change.current_ns:>9.0f} ns "
+            f"({change.ratio - 1:>+7.1%})"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--number", type=int, default=5_000, help="calls per run of a case")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs per case, the fastest one is kept")
+    parser.add_argument("--save", type=pathlib.Path, nargs="?", const=DEFAULT_BASELINE, help="store as baseline")
+    parser.add_argument("--compare", type=pathlib.Path, nargs="?", const=DEFAULT_BASELINE, help="compare to baseline")
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative change reported by --compare")
+    args = parser.parse_args()
+
+    current = measure(args.number, args.repeat)
+    regressions: list[Change] = []
+
+    if args.compare is None:
+        print(f"{'case':<45} {'ns':>9}")  # noqa: T201
+        for case, ns in current.results.items():
+            print(f"{case:<45} {ns:>9.0f}")  # noqa: T201
+    else:
+        baseline = msgspec.json.decode(args.compare.read_bytes(), type=Baseline)
+        if (baseline.python, baseline.msgspec, baseline.machine) != (current.python, current.msgspec, current.machine):
+            print(  # noqa: T201
+                f"warning: baseline was recorded with python {baseline.python}, msgspec {baseline.msgspec} on "
+                f"{baseline.machine!r}, results are not comparable",
+                file=sys.stderr,
+            )
+        regressions, improvements = compare(baseline, current, args.threshold)
+        _print_changes("regressions", regressions)
+        _print_changes("improvements", improvements)
+        added = current.results.keys() - baseline.results.keys()
+        removed = baseline.results.keys() - current.results.keys()
+        if added or removed:
+            print(f"\n{len(added)} cases not in the baseline, {len(removed)} cases missing")  # noqa: T201
+        common = current.results.keys() & baseline.results.keys()
+        total_ratio = sum(current.results[case] for case in common) / sum(baseline.results[case] for case in common)
+        print(f"\n{len(common)} cases, total time {total_ratio - 1:+.1%} compared to the baseline")  # noqa: T201
+
+    if args.save is not None:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_bytes(msgspec.json.format(msgspec.json.encode(current)) + b"\n")
+        print(f"\nstored baseline in {args.save}")  # noqa: T201
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Compares the wire codecs of the websocket protocol using the real event types.
+
+For every event the size of a complete DISPATCH frame and the en/decode throughput of each codec is measured.
+Decoding goes from the raw frame to the concrete event type, just like the receiving side does.
+
+Run it using `python -m benchmarks.wire_codecs`.
+
+Authors: Christopher
+"""
+
+from __future__ import annotations
+
+__all__ = ("CodecResult", "main", "measure")
+
+import argparse
+import time
+import typing
+
+import msgspec
+
+from benchmarks._samples import sample_events
+from shared.internal import codecs
+from shared.models.internal import AnyPayload
+from shared.models.internal import DispatchPayload
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from shared.models import events
+
+
+class CodecResult(msgspec.Struct):
+    event: str
+    codec: str
+    size: int
+    """Size of the encoded frame in bytes."""
+    encode_ns: float
+    """Average time it took to encode a frame in nanoseconds."""
+    decode_ns: float
+    """Average time it took to decode a frame in nanoseconds."""
+
+
+def _time_per_call(func: Callable[[], object], number: int) -> float:
+    start = time.perf_counter_ns()
+    for _ in range(number):
+        func()
+    return (time.perf_counter_ns() - start) / number
+
+
+def measure(event: events.BaseEvent, codec: codecs.Codec, number: int) -> CodecResult:
+    """Measures the frame size and en/decode time of a single event using `codec`."""
+    payload = DispatchPayload(d=event)
+    frame = codec.encode(payload)
+
+    return CodecResult(
+        event=event.event_name(),
+        codec=codec.name,
+        size=len(frame),
+        encode_ns=_time_per_call(lambda: codec.encode(payload), number),
+        decode_ns=_time_per_call(lambda: codec.decode(frame, AnyPayload), number),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--number", type=int, default=20_000, help="iterations per event and codec")
+    args = parser.parse_args()
+
+    results = [measure(event, codec, args.number) for event in sample_events() for codec in codecs.CODECS.values()]
+
+    print(f"{'event':<30} {'codec':<8} {'bytes':>6} {'encode ns':>10} {'decode ns':>10}")  # noqa: T201
+    for result in results:
+        print(  # noqa: T201
+            f"{result.event:<30} {result.codec:<8} {result.size:>6} {result.encode_ns:>10.0f} {result.decode_ns:>10.0f}"
+        )
+
+    print()  # noqa: T201
+    baseline = codecs.JSON.name
+    totals = {
+        name: [
+            sum(getattr(r, field) for r in results if r.codec == name) for field in ("size", "encode_ns", "decode_ns")
+        ]
+        for name in codecs.CODECS
+    }
+    for name, (size, encode_ns, decode_ns) in totals.items():
+        base_size, base_encode, base_decode = totals[baseline]
+        print(  # noqa: T201
+            f"{name:<8} total {size:>7} bytes ({size / base_size:>6.1%} of {baseline}), "
+            f"encode {encode_ns / base_encode:>6.1%}, decode {decode_ns / base_decode:>6.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+-- Table of every account. Databases created before migrations were versioned already have it.
+CREATE TABLE IF NOT EXISTS users
+(
+    id       BIGSERIAL PRIMARY KEY NOT NULL,
+    username TEXT NOT NULL,
+    password TEXT NOT NULL,
+    money    INTEGER DEFAULT 0 NOT NULL
+);
@@ -0,0 +1,11 @@
+-- Usernames have to be unique. Databases created before can contain duplicates, every duplicate except the oldest
+-- account gets renamed to `<username>#<id>` before the unique index is created.
+UPDATE users
+SET username = username || '#' || id
+WHERE id IN (
+    SELECT id
+    FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY username ORDER BY id) AS position FROM users)
+    WHERE position > 1
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS users_username_key ON users (username);
@@ -10,9 +10,32 @@ WHERE users.username = ?;
 
 -- name: CreateUser :execrows
 INSERT INTO users(id, username, password, money)
-VALUES (?, ?, ?, ?);
+VALUES (?, ?, ?, ?)
+ON CONFLICT (username) DO NOTHING;
 
 -- name: UpdateUserMoney :exec
 UPDATE users
 SET money = ?
-WHERE id = ?;
\ No newline at end of file
+WHERE id = ?;
+
+-- name: GetUserMoney :one
+SELECT money
+FROM users
+WHERE users.id = ?;
+
+-- name: AddUserMoney :one
+UPDATE users
+SET money = money + sqlc.arg(amount)
+WHERE id = sqlc.arg(id)
+RETURNING money;
+
+-- name: DebitUserMoney :one
+UPDATE users
+SET money = money - sqlc.arg(amount)
+WHERE id = sqlc.arg(id) AND sqlc.arg(amount) > 0 AND money >= sqlc.arg(amount)
+RETURNING money;
+
+-- name: CreditUserMoney :exec
+UPDATE users
+SET money = money + sqlc.arg(amount)
+WHERE id = sqlc.arg(id);
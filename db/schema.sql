@@ -1,7 +1,11 @@
+-- Current schema of the database, which sqlc generates `backend/db` from. The database itself is only ever changed by
+-- the migrations of `db/migrations`, so every change here needs a new migration as well.
 CREATE TABLE IF NOT EXISTS users
 (
     id       BIGSERIAL PRIMARY KEY NOT NULL,
     username TEXT NOT NULL,
     password TEXT NOT NULL,
     money    INTEGER DEFAULT 0 NOT NULL
-)
\ No newline at end of file
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS users_username_key ON users (username);
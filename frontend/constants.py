@@ -33,6 +33,8 @@ WINDOW_NAME, FULL_SCREEN = "Casino", True
 UPDATES_PER_SECOND = 144
 DEFAULT_FPS = 144
 LOBBY_REFRESH_SECONDS = 10
+LOBBY_RESUBSCRIBE_SECONDS = 2
+LOBBY_RESUBSCRIBE_MAX_SECONDS = 60
 
 MENU_WIDTH = 700
 MENU_SPACING = 16
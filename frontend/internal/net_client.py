@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-__all__ = ("NetClient",)
+__all__ = ("LOBBY_DIRECTORY", "NetClient")
 
 import typing
 
@@ -16,6 +16,9 @@ if typing.TYPE_CHECKING:
 
 RestClientT = typing.TypeVar("RestClientT", bound=RestClientBase)
 
+LOBBY_DIRECTORY: typing.Final[str] = "directory"
+"""Path used instead of a lobby id to subscribe to the lobby directory of a game mode."""
+
 
 class NetClient(typing.Generic[RestClientT]):
     """The net client is a network client which is designed to handle all of our network communication.
@@ -69,3 +72,17 @@ class NetClient(typing.Generic[RestClientT]):
             receive_event_queue=receive_event_queue,
             disconnect_callback=disconnect_callback,
         )
+
+    def get_lobby_directory_thread(
+        self,
+        game_mode: c.GameModes,
+        receive_event_queue: queue.Queue[events.BaseEvent],
+        disconnect_callback: ws_thread.DisconnectCallbackT,
+    ) -> ws_thread.WebsocketThread:
+        """Returns a thread subscribed to the lobby directory of a game mode, which receives every lobby change."""
+        return self.get_websocket_thread(
+            game_mode=game_mode,
+            lobby_id=LOBBY_DIRECTORY,
+            receive_event_queue=receive_event_queue,
+            disconnect_callback=disconnect_callback,
+        )
@@ -65,6 +65,8 @@ class RestClientBase(abc.ABC):
         endpoint: CompiledRoute,
         *,
         data: dict[str, typing.Any] | msgspec.Struct | None = None,
+        headers: dict[str, str] | None = None,
+        params: dict[str, str] | None = None,
     ) -> T:
         """Execute a request.
 
@@ -77,6 +79,10 @@ class RestClientBase(abc.ABC):
             The endpoint that should be requested.
         data: dict[str, typing.Any] | msgspec.Struct | None
             Optional data that should be sent in the request body. Will be formatted to json.
+        headers: dict[str, str] | None
+            Optional headers that should be sent with the request.
+        params: dict[str, str] | None
+            Optional query parameters.
 
         Raises
         ------
@@ -90,11 +96,27 @@ class RestClientBase(abc.ABC):
         T
             The expected object.
         """
+        response = self._send_request(endpoint, data=data, headers=headers, params=params)
+        return self._decode_response(expected_response, response)
+
+    def _send_request(
+        self,
+        endpoint: CompiledRoute,
+        *,
+        data: dict[str, typing.Any] | msgspec.Struct | None = None,
+        headers: dict[str, str] | None = None,
+        params: dict[str, str] | None = None,
+    ) -> httpx.Response:
+        """Execute a request without checking the response, see `_perform_request` for the parameters."""
         content: bytes | None = None
         if isinstance(data, (dict, msgspec.Struct)):
             content = self._json_encoder.encode(data)
-        response = self._client.request(method=endpoint.method, url=endpoint.compiled_path, content=content)
+        return self._client.request(
+            method=endpoint.method, url=endpoint.compiled_path, content=content, headers=headers, params=params
+        )
 
+    def _decode_response(self, expected_response: type[T], response: httpx.Response) -> T:
+        """Decode the body of a response into `expected_response`, see `_perform_request` for the errors raised."""
         if response.status_code == http.HTTPStatus.NO_CONTENT and expected_response is type(None):
             return expected_response()  # this returns None but for some reason pyright complains if we do `return None`
 
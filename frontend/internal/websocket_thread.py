@@ -7,11 +7,11 @@ import logging
 import threading
 import typing
 
-import msgspec
 import websocket
 
+from shared.internal import codecs
 from shared.internal import opcodes
-from shared.internal.hooks import decode_hook
+from shared.internal import tracing
 from shared.models import events
 from shared.models import internal as internal_models
 
@@ -19,15 +19,29 @@ if typing.TYPE_CHECKING:
     import queue
 
     from frontend import constants as c
+    from shared.internal import Snowflake
 
 type DisconnectCallbackT = collections.abc.Callable[..., None]
 
 logger = logging.getLogger(__name__)
 
+RESUME_ATTEMPTS: typing.Final[int] = 3
+"""How often the thread tries to resume its session after the connection dropped, before giving up."""
+RESUME_BACKOFF: typing.Final[float] = 0.5
+"""Seconds waited before the first resume attempt, this doubles with every failed attempt."""
+
+
+class _ServerClosedConnectionError(websocket.WebSocketConnectionClosedException):
+    """Raised when the server closed the connection, sessions closed by the server can't be resumed."""
+
+    def __init__(self, code: int | None) -> None:
+        super().__init__(f"Server closed the connection with code {code}")
+        self.code = code
+
 
 class _WebsocketTransport:
     """Class used for low level message transport used with websockets. The main purpose of this class is en/decoding
-    messages from json to objects or from objects to json.
+    messages from the negotiated wire codec to objects or from objects to the wire codec.
 
     It also handles closing the connection.
 
@@ -36,14 +50,21 @@ class _WebsocketTransport:
 
     def __init__(self, *, ws: websocket.WebSocket) -> None:
         self._ws = ws
-        self._decoder = msgspec.json.Decoder(type=internal_models.WebSocketPayload)
-        self._encoder = msgspec.json.Encoder()
+        self._codec: codecs.Codec = codecs.JSON
         self._sent_close = False
 
     @property
     def closed(self) -> bool:
         return self._sent_close
 
+    @property
+    def codec(self) -> codecs.Codec:
+        """Codec used for en/decoding payloads, this is always JSON until the handshake is done."""
+        return self._codec
+
+    def set_codec(self, codec: codecs.Codec) -> None:
+        self._codec = codec
+
     def send_close(self, *, code: int, reason: str) -> None:
         if self._sent_close:
             return
@@ -52,26 +73,31 @@ class _WebsocketTransport:
         logger.debug("sending close frame with code %s and message %s", code, reason)
         self._ws.close(status=code, reason=reason.encode())
 
-    def recieve_payload(self) -> internal_models.WebSocketPayload:
-        json = self._recieve_data()
-
-        logger.debug("received payload with size %s\n    %s", len(json), json)
-
-        return self._decoder.decode(json)
+    def recieve_payload(self) -> internal_models.AnyPayload:
+        data = self._recieve_data()
+        if (tracer := tracing.tracer) is not None:
+            tracer.record(tracing.Direction.RECEIVED, self._codec, data)
+        return self._codec.decode(data, internal_models.AnyPayload)
 
     def send_payload(self, payload: internal_models.WebSocketPayload) -> None:
-        json = self._encoder.encode(payload)
-        logger.debug("sending payload with size %s\n    %s", len(json), json)
+        data = self._codec.encode(payload)
+        if (tracer := tracing.tracer) is not None:
+            tracer.record(tracing.Direction.SENT, self._codec, data)
 
-        self._ws.send(json)
+        if self._codec.binary:
+            self._ws.send_binary(data)
+        else:
+            self._ws.send(data)
 
     def _recieve_data(self) -> bytes:
-        data = self._ws.recv()
-        if isinstance(data, str):
-            msg = "Unexpected message type received TEXT, expected BINARY"
+        opcode, data = self._ws.recv_data()
+        if opcode == websocket.ABNF.OPCODE_CLOSE:
+            raise _ServerClosedConnectionError(int.from_bytes(data[:2]) if len(data) >= 2 else None)  # noqa: PLR2004
+        if not data:
+            msg = "Unexpected empty message received, expected TEXT or BINARY"
             raise websocket.WebSocketProtocolException(msg)
-        if data is None:
-            msg = "Unexpected message received None, expected BINARY"
+        if opcode == websocket.ABNF.OPCODE_TEXT and self._codec.binary:
+            msg = f"Unexpected message type received TEXT, the {self._codec.name} codec expects BINARY"
             raise websocket.WebSocketProtocolException(msg)
         return data
 
@@ -87,7 +113,8 @@ class WebsocketThread(threading.Thread):
     events into a shared queue, so that the game views can pull the events out of the queue and handle them.
 
     This thread also established the websocket connection and authenticated the connection by sending the token of the
-    user to the server.
+    user to the server. If the connection drops, the thread reconnects and resumes the session, so that no events get
+    lost.
 
     Authors: Christopher
     """
@@ -100,6 +127,8 @@ class WebsocketThread(threading.Thread):
         lobby_id: str,
         receive_event_queue: queue.Queue[events.BaseEvent],
         disconnect_callback: DisconnectCallbackT,
+        *,
+        preferred_codecs: collections.abc.Sequence[str] = (codecs.MSGPACK.name, codecs.JSON.name),
     ) -> None:
         super().__init__(daemon=True)
         self._token = token
@@ -108,85 +137,187 @@ class WebsocketThread(threading.Thread):
         self._lobby_id = lobby_id
         self._ws_uri = ws_uri
         self._disconnect_callback = disconnect_callback
+        self._preferred_codecs = preferred_codecs
 
-        self._event_maps: dict[str, type[events.BaseEvent]] = {}
+        self._event_types: set[type[events.BaseEvent]] = set()
 
         self._ws: _WebsocketTransport | None = None
         self._stop_event = threading.Event()
+        self._ready_event = threading.Event()
+        self._heartbeat_acked = True
+        self._session_id: Snowflake | None = None
+        self._seq = 0
 
     def register_event(self, event_type: type[events.BaseEvent]) -> None:
-        self._event_maps[event_type.event_name()] = event_type
+        self._event_types.add(event_type)
 
-    def dispatch_event(self, data: dict[str, typing.Any], event_name: str) -> None:
-        if self._ws:
-            self._ws.send_payload(internal_models.WebSocketPayload(op=opcodes.DISPATCH, d=data, t=event_name))
-
-    def __handle_dispatch(self, payload: internal_models.WebSocketPayload) -> None:
-        if payload.op == opcodes.READY:
-            if (event := self._event_maps.get(events.ReadyEvent.event_name())) is None:
+    def dispatch_event(self, event: events.BaseEvent) -> None:
+        if not self._ready_event.is_set() or self._ws is None:
+            logger.debug("Not connected, dropping %s.", event.event_name())
+            return
+        try:
+            self._ws.send_payload(internal_models.DispatchPayload(d=event))
+        except (websocket.WebSocketException, OSError) as exc:
+            logger.debug("Failed sending %s: %s", event.event_name(), exc)
+
+    def __handle_dispatch(self, payload: internal_models.DispatchPayload | internal_models.ReadyPayload) -> None:
+        """Puts the already decoded event of a payload into the queue, if an event handler was registered for it."""
+        if isinstance(payload, internal_models.DispatchPayload) and payload.s is not None:
+            self._seq = payload.s
+        if type(payload.d) in self._event_types:
+            self._receive_event_queue.put(payload.d)
+
+    def _send_heartbeats(self, ws: _WebsocketTransport, interval: float) -> None:
+        """Function run in a separate thread, sending a HEARTBEAT every `interval` seconds over the connection `ws`.
+
+        If the server didn't acknowledge the previous heartbeat, the connection is considered dead and gets dropped,
+        which makes the thread try to resume the session. The function returns once `ws` is no longer used.
+
+        Authors: Christopher
+        """
+        self._heartbeat_acked = True
+        while not self._stop_event.wait(interval):
+            if self._ws is not ws:
                 return
-        elif payload.t is not None:
-            if (event := self._event_maps.get(payload.t)) is None:
+            if not self._heartbeat_acked:
+                logger.warning("Server did not acknowledge the last heartbeat, dropping connection.")
+                ws.abnormal_shutdown()
+                return
+            self._heartbeat_acked = False
+            try:
+                ws.send_payload(internal_models.HeartbeatPayload())
+            except (websocket.WebSocketException, OSError) as exc:
+                logger.debug("Failed sending heartbeat: %s", exc)
                 return
-        else:
-            return
 
-        event_obj = msgspec.convert(payload.d, type=event, dec_hook=decode_hook)
-        self._receive_event_queue.put(event_obj)
+    def _negotiate_codec(self, server_codecs: collections.abc.Sequence[str]) -> codecs.Codec:
+        """Picks the first preferred codec the server supports, falling back to JSON."""
+        for name in self._preferred_codecs:
+            if name in server_codecs and (codec := codecs.CODECS.get(name)) is not None:
+                return codec
+        return codecs.JSON
 
-    @typing.override
-    def run(self) -> None:
+    def _open_connection(self) -> internal_models.HelloPayload:
+        """Connects to the lobby and waits for the HELLO payload of the server."""
         ws_endpoint = f"{self._ws_uri}{self._game_mode.value}/{self._lobby_id}/"
-        try:
-            ws = websocket.create_connection(ws_endpoint)
-        except websocket.WebSocketException as exc:
-            logger.exception(
-                "Error while connecting to the websocket server with endpoint %s.", ws_endpoint, exc_info=exc
-            )
-            self._disconnect_callback()
-            return
-
-        self._ws = _WebsocketTransport(ws=ws)
+        self._ws = _WebsocketTransport(ws=websocket.create_connection(ws_endpoint))
         logger.debug("Established websocket connection with server using endpoint %s. Waiting for hello.", ws_endpoint)
+        payload = self._ws.recieve_payload()
+        if not isinstance(payload, internal_models.HelloPayload):
+            self._unexpected_payload(payload, opcodes.HELLO, "HELLO")
+        return payload
+
+    def _unexpected_payload(self, payload: internal_models.WebSocketPayload, opcode: int, name: str) -> typing.NoReturn:
+        logger.error(
+            "Expected opcode %s (%s), but received %s. Closing connection.", opcode, name, payload.__struct_config__.tag
+        )
+        if self._ws is not None:
+            self._ws.send_close(code=websocket.STATUS_ABNORMAL_CLOSED, reason=f"Expected {name} opcode.")
+        raise _ServerClosedConnectionError(None)
+
+    def _start_heartbeats(self, ws: _WebsocketTransport, hello: internal_models.HelloPayload) -> None:
+        if heartbeat_interval := hello.d.heartbeat_interval:
+            threading.Thread(target=self._send_heartbeats, args=(ws, heartbeat_interval / 1_000), daemon=True).start()
+
+    def _identify(self) -> None:
+        """Opens a connection and authenticates with the server, starting a new session."""
+        hello = self._open_connection()
+        ws = typing.cast("_WebsocketTransport", self._ws)
+        codec = self._negotiate_codec(hello.d.codecs)
+        logger.debug("Received HELLO opcode, sending IDENTIFY using codec %s.", codec.name)
+        ws.send_payload(
+            internal_models.IdentifyPayload(d=internal_models.IdentifyData(token=self._token, codec=codec.name))
+        )
+        ws.set_codec(codec)
+        payload = ws.recieve_payload()
+        if not isinstance(payload, internal_models.ReadyPayload):
+            self._unexpected_payload(payload, opcodes.READY, "READY")
+        logger.debug("Received READY opcode.")
+        self._session_id = payload.d.client_id
+        self._seq = 0
+        self.__handle_dispatch(payload)
+        self._ready_event.set()
+        self._start_heartbeats(ws, hello)
+
+    def _resume(self, session_id: Snowflake) -> None:
+        """Opens a new connection and resumes the session with the id `session_id` on it."""
+        hello = self._open_connection()
+        ws = typing.cast("_WebsocketTransport", self._ws)
+        codec = self._negotiate_codec(hello.d.codecs)
+        logger.debug("Received HELLO opcode, sending RESUME for sequence %s using codec %s.", self._seq, codec.name)
+        ws.send_payload(
+            internal_models.ResumePayload(
+                d=internal_models.ResumeData(token=self._token, session_id=session_id, seq=self._seq, codec=codec.name)
+            )
+        )
+        ws.set_codec(codec)
+        payload = ws.recieve_payload()
+        if not isinstance(payload, internal_models.ResumedPayload):
+            self._unexpected_payload(payload, opcodes.RESUMED, "RESUMED")
+        logger.debug("Received RESUMED opcode, %s events are replayed.", payload.d.replayed)
+        self._ready_event.set()
+        self._start_heartbeats(ws, hello)
+
+    def _try_resume(self) -> bool:
+        """Tries resuming the session a few times with an increasing delay. Returns whether it succeeded.
+
+        Authors: Christopher
+        """
+        if self._session_id is None:
+            return False
+        delay = RESUME_BACKOFF
+        for attempt in range(1, RESUME_ATTEMPTS + 1):
+            if self._stop_event.wait(delay):
+                return False
+            try:
+                self._resume(self._session_id)
+            except _ServerClosedConnectionError as exc:
+                logger.info("Server refused resuming the session: %s", exc)
+                return False
+            except (websocket.WebSocketException, OSError) as exc:
+                logger.debug("Resume attempt %s of %s failed: %s", attempt, RESUME_ATTEMPTS, exc)
+                delay *= 2
+            else:
+                return True
+        return False
+
+    def _receive_payloads(self, ws: _WebsocketTransport) -> bool:
+        """Receives payloads until the connection ends. Returns whether the connection dropped and can be resumed."""
         try:
-            payload = self._ws.recieve_payload()
-            if payload.op != opcodes.HELLO:
-                logger.error(
-                    "Expected opcode %s (HELLO), but received %s. Closing connection.", opcodes.HELLO, payload.op
-                )
-                self._ws.send_close(code=websocket.STATUS_ABNORMAL_CLOSED, reason="Expected HELLO opcode.")
-                self._disconnect_callback()
-                return
-            logger.debug("Received HELLO opcode, sending IDENTIFY.")
-            self._ws.send_payload(internal_models.WebSocketPayload(op=opcodes.IDENTIFY, d={"token": self._token}))
-            payload = self._ws.recieve_payload()
-            if payload.op != opcodes.READY:
-                logger.error(
-                    "Expected opcode %s (READY), but received %s. Closing connection.", opcodes.READY, payload.op
-                )
-                self._ws.send_close(code=websocket.STATUS_ABNORMAL_CLOSED, reason="Expected READY opcode.")
-                self._disconnect_callback()
-                return
-            logger.debug("Received READY opcode.")
-            self.__handle_dispatch(payload)
-        except websocket.WebSocketException as exc:
-            logger.exception("Exception occurred while identifying with the server.", exc_info=exc)
-            self.abnormal_shutdown()
-        except ConnectionResetError as exc:
-            logger.debug(str(exc))
-            self._stop_event.set()
-        try:
-            while not self._stop_event.set():
-                payload = self._ws.recieve_payload()
-                if payload.op == opcodes.DISPATCH:
+            while not self._stop_event.is_set():
+                payload = ws.recieve_payload()
+                if isinstance(payload, internal_models.DispatchPayload):
                     self.__handle_dispatch(payload)
+                elif isinstance(payload, internal_models.HeartbeatAckPayload):
+                    self._heartbeat_acked = True
                 else:
-                    logger.warning("Unexpected opcode %s received in payload.", payload.op)
-        except websocket.WebSocketException:
-            logger.debug("Exception while receiving data, closing connection.")
-            self.abnormal_shutdown()
-        except ConnectionResetError as exc:
+                    logger.warning("Unexpected opcode %s received in payload.", payload.__struct_config__.tag)
+        except _ServerClosedConnectionError as exc:
             logger.debug(str(exc))
+        except (websocket.WebSocketException, OSError) as exc:
+            logger.debug("Exception while receiving data, connection dropped: %s", exc)
+            if (tracer := tracing.tracer) is not None:
+                tracer.log_dump(logger, logging.DEBUG)
+            return not self._stop_event.is_set() and not ws.closed
+        finally:
+            self._ready_event.clear()
+        return False
+
+    @typing.override
+    def run(self) -> None:
+        try:
+            self._identify()
+        except (websocket.WebSocketException, OSError) as exc:
+            logger.exception("Exception occurred while identifying with the server.", exc_info=exc)
+            self.abnormal_shutdown()
+            self._disconnect_callback()
+            return
+
+        while self._ws is not None and self._receive_payloads(self._ws):
+            logger.info("Connection to the server dropped, resuming session.")
+            if not self._try_resume():
+                break
+        self.abnormal_shutdown()
         self._disconnect_callback()
 
     def abnormal_shutdown(self) -> None:
@@ -3,16 +3,15 @@ from __future__ import annotations
 __all__ = ("WebsocketView",)
 
 import abc
+import functools
 import inspect
 import logging
 import queue
 import threading
 import typing
 
-import msgspec
-
 from frontend.views.base import BaseGameView
-from shared.internal.hooks import encode_hook
+from shared.internal import listeners
 
 if typing.TYPE_CHECKING:
     import collections.abc
@@ -31,9 +30,17 @@ WebsocketViewT = typing.TypeVar("WebsocketViewT")
 class _WebsocketViewMeta(abc.ABCMeta):
     """Metaclass for the websocket view to allow the `__post__init__` function to be called.
 
+    It also collects the event listeners of a view class once, when the class gets created.
+
     Authors: Christopher
     """
 
+    __event_listeners__: listeners.ListenerTableT
+
+    def __init__(cls, name: str, bases: tuple[type, ...], namespace: dict[str, typing.Any], /) -> None:
+        super().__init__(name, bases, namespace)
+        cls.__event_listeners__ = listeners.collect_listeners(cls)
+
     @typing.override
     def __call__(
         cls: type[WebsocketViewT], window: MainWindow, game_mode: c.GameModes, lobby_id: str
@@ -48,10 +55,9 @@ class WebsocketView(BaseGameView, metaclass=_WebsocketViewMeta):
     is established after an instance of the class got created by using the provided game_mode and lobby id.
 
     It starts an WebsocketThread which listens for new websocket messages and pulls them out of the shared queue.
-    This class also has a mapping for storing "event handlers". This mapping is populated after an instance of this
-    class got created by looking for functions with an __event_type__ attribute. This is added when using the
-    `add_event_listener` decorator. You can also use the `add_event_callback` function of this class to add new
-    event handlers.
+    Event handlers are functions with an __event_type__ attribute, which is added when using the
+    `add_event_listener` decorator. They are collected once per class by the metaclass. You can also use the
+    `add_event_callback` function of this class to add new event handlers to a single instance.
 
     Authors: Christopher
     """
@@ -76,13 +82,10 @@ class WebsocketView(BaseGameView, metaclass=_WebsocketViewMeta):
     def __post__init__(self) -> None:
         """Function called after an instance of this class got created.
 
-        This starts the websocket thread and looks for event listeners.
+        This registers the events of the class listeners with the websocket thread and starts it.
         """
-        for attr_name in dir(self):
-            maybe_listener = getattr(self, attr_name)
-
-            if callable(maybe_listener) and hasattr(maybe_listener, "__event_type__"):
-                self.add_event_callback(maybe_listener.__event_type__, maybe_listener)  # type: ignore[reportArgumentType]
+        for event_type, _ in type(self).__event_listeners__.values():
+            self._ws_thread.register_event(event_type)
         self.start()
 
     def __on_ws_disconnect(self) -> None:
@@ -113,9 +116,7 @@ class WebsocketView(BaseGameView, metaclass=_WebsocketViewMeta):
 
     def send_event(self, event: events.BaseEvent) -> None:
         """Helper function that sends an event to the websocket thread / server."""
-        event_name = event.event_name()
-        data = msgspec.to_builtins(event, enc_hook=encode_hook)
-        self._ws_thread.dispatch_event(data, event_name)
+        self._ws_thread.dispatch_event(event)
 
     @typing.override
     def on_update(self, delta_time: float) -> bool | None:
@@ -132,18 +133,23 @@ class WebsocketView(BaseGameView, metaclass=_WebsocketViewMeta):
                 except queue.Empty:
                     return None
                 logger.debug("Pulled event %s out of queue", event)
+                if listener_entry := type(self).__event_listeners__.get(event.event_name()):
+                    for listener in listener_entry[1]:
+                        self.__call_handler(functools.partial(listener, self), event)
                 if handlers := self._event_handlers.get(event.event_name()):
                     for handler in handlers:
-                        try:
-                            handler(event)
-                        except Exception as exc:
-                            logger.exception(
-                                "Exception occurred when handling event %s", event.event_name(), exc_info=exc
-                            )
+                        self.__call_handler(handler, event)
                 return consume_event()
 
             consume_event()
 
+    @staticmethod
+    def __call_handler(handler: collections.abc.Callable[[events.BaseEvent], None], event: events.BaseEvent) -> None:
+        try:
+            handler(event)
+        except Exception as exc:
+            logger.exception("Exception occurred when handling event %s", event.event_name(), exc_info=exc)
+
     @typing.override
     def deactivate(self) -> None:
         self._ws_thread.disconnect()
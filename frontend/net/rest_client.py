@@ -2,6 +2,7 @@ from __future__ import annotations
 
 __all__ = ("RestClient",)
 
+import http
 import typing
 
 from frontend.internal.rest_client import RestClientBase
@@ -18,6 +19,10 @@ class RestClient(RestClientBase):
     Authors: Christopher, Quirin
     """
 
+    def __init__(self, base_url: str, token: str | None = None) -> None:
+        super().__init__(base_url, token)
+        self._lobbys_cache: dict[tuple[str, bool, bool], tuple[str, list[responses.PublicGameLobby]]] = {}
+
     @typing.override
     def login(self, username: str, password: str) -> responses.LoginResponse:
         """Rest method to login.
@@ -37,13 +42,32 @@ class RestClient(RestClientBase):
         route = routes.POST_REGISTER.compile()
         return self._perform_request(expected_response=type(None), endpoint=route, data=body)
 
-    def get_lobbys(self, game: str) -> list[responses.PublicGameLobby]:
+    def get_lobbys(
+        self, game: str, *, hide_full: bool = False, hide_single_player: bool = False
+    ) -> list[responses.PublicGameLobby]:
         """Rest method to get all available lobbys for a game mode.
 
+        The last listing is kept together with its ETag, so the server only has to send the listing again if it changed.
+
         Authors: Christopher
         """
         route = routes.GET_LOBBYS.compile(game=game)
-        return self._perform_request(expected_response=list[responses.PublicGameLobby], endpoint=route)
+        params: dict[str, str] = {}
+        if hide_full:
+            params["hide_full"] = "true"
+        if hide_single_player:
+            params["hide_single_player"] = "true"
+        cache_key = (game, hide_full, hide_single_player)
+        cached = self._lobbys_cache.get(cache_key)
+        headers = {"If-None-Match": cached[0]} if cached else None
+
+        response = self._send_request(route, headers=headers, params=params)
+        if cached and response.status_code == http.HTTPStatus.NOT_MODIFIED:
+            return cached[1]
+        lobbys = self._decode_response(list[responses.PublicGameLobby], response)
+        if etag := response.headers.get("ETag"):
+            self._lobbys_cache[cache_key] = (etag, lobbys)
+        return lobbys
 
     def create_lobby(self, game: str) -> responses.PublicGameLobby:
         """Rest method to create a new lobby.
@@ -66,6 +66,9 @@ class CardSprite(arcade.Sprite):
 class BlackjackView(WebsocketView):
     """Blackjack View class displaying the game and handling user interactions.
 
+    The view keeps a local copy of the game state. It gets replaced by every snapshot (`BlackjackUpdateGame`) and is
+    updated by the patch events in between. If a patch is missing, the view asks the server for a new snapshot.
+
     Authors: Nina
     """
 
@@ -176,6 +179,14 @@ class BlackjackView(WebsocketView):
         self.own_money = 0
         self.started = True
 
+        self._seq: int | None = None
+        """Sequence number of the last applied snapshot or patch, None until the first snapshot was received."""
+        self._resync_requested = False
+        self._active_players: list[events.BlackjackPlayerData] = []
+        self._waiting_players: list[events.BlackjackPlayerData] = []
+        self._dealer = events.BlackjackPlayerData(username="")
+        self._pile_indexes: dict[str, int] = {}
+
     ### Ui Inputs
 
     def on_bet_change(self, event: arcade.gui.UIOnChangeEvent) -> None:
@@ -260,23 +271,126 @@ class BlackjackView(WebsocketView):
 
     @add_event_listener(events.BlackjackUpdateGame)
     def on_update_game(self, event: events.BlackjackUpdateGame) -> None:
-        """Listener function that updates the game state.
+        """Listener function that replaces the local game state with a snapshot sent by the server."""
+        if self._seq is not None and event.seq < self._seq:
+            return
+        self._seq = event.seq
+        self._resync_requested = False
+        self.started = event.started
+        self._dealer = events.BlackjackPlayerData(username="")
+        self._active_players = []
+        for player in event.active_players:
+            if player.username == "":
+                self._dealer = player
+            else:
+                self._active_players.append(player)
+        self._waiting_players = event.waiting_players
+        self.render_game()
+
+    @add_event_listener(events.BlackjackPlayerJoined)
+    def on_player_joined(self, event: events.BlackjackPlayerJoined) -> None:
+        """Listener function that adds a player to the game, this changes the seats so everything is rendered again."""
+        if not self.check_seq(event.seq):
+            return
+        if event.waiting:
+            self._waiting_players.append(event.player)
+        else:
+            self._active_players.append(event.player)
+        self.render_game()
 
-        It first resets everything (cards, texts) and then goes through every players data.
-        If the game is not started, each player gets 2 unknown cards to display something while they are waiting for the
-        game to start. If the game is already started, it goes through every players data and sets their cards, their
-        total card value (if they have any cards) and their current bidding amount (if they have already bid).
+    @add_event_listener(events.BlackjackPlayerLeft)
+    def on_player_left(self, event: events.BlackjackPlayerLeft) -> None:
+        """Listener function that removes a player from the game, this changes the seats so everything is rendered
+        again.
+        """
+        if not self.check_seq(event.seq):
+            return
+        self._active_players = [p for p in self._active_players if p.username != event.username]
+        self._waiting_players = [p for p in self._waiting_players if p.username != event.username]
+        self.render_game()
+
+    @add_event_listener(events.BlackjackBetSet)
+    def on_bet_set(self, event: events.BlackjackBetSet) -> None:
+        """Listener function that displays the bet of a single player."""
+        if not self.check_seq(event.seq):
+            return
+        if (player := self.get_player(event.username)) is None:
+            return
+        player.current_bet = event.bet
+        if (pile_index := self._pile_indexes.get(event.username)) is not None:
+            self.render_player_texts(player, pile_index)
+
+    @add_event_listener(events.BlackjackCardAdded)
+    def on_card_added(self, event: events.BlackjackCardAdded) -> None:
+        """Listener function that adds a single card to the pile of a player."""
+        if not self.check_seq(event.seq):
+            return
+        if (player := self.get_player(event.username)) is None:
+            return
+        player.cards.append(event.card)
+        if (pile_index := self._pile_indexes.get(event.username)) is not None and self.started:
+            card = CardSprite(event.card.name or UNKNOWN_CARD_NAME)
+            self.add_card_to_pile(card, pile_index)
+            self._card_list.append(card)
+            self.render_player_texts(player, pile_index)
+
+    @add_event_listener(events.BlackjackCardRevealed)
+    def on_card_revealed(self, event: events.BlackjackCardRevealed) -> None:
+        """Listener function that reveals a hidden card, only the pile of the card is rendered again."""
+        if not self.check_seq(event.seq):
+            return
+        if (player := self.get_player(event.username)) is None or event.index >= len(player.cards):
+            return
+        player.cards[event.index] = event.card
+        if (pile_index := self._pile_indexes.get(event.username)) is not None:
+            for card in self._piles[pile_index]:
+                self._card_list.remove(card)
+            self._piles[pile_index] = []
+            self.render_player(player, pile_index)
+
+    ### Game State
+
+    def check_seq(self, seq: int) -> bool:
+        """Helper function that checks if a patch with the sequence number `seq` can be applied.
+
+        Patches that are older than the local state are ignored. If a patch is missing, a new snapshot is requested
+        and every patch is ignored until it arrives.
+        """
+        if self._seq is None or seq <= self._seq:
+            return False
+        if seq != self._seq + 1:
+            if not self._resync_requested:
+                logger.debug("Missed blackjack patches %s to %s, requesting resync", self._seq + 1, seq - 1)
+                self._resync_requested = True
+                self.send_event(events.BlackjackRequestResync())
+            return False
+        self._seq = seq
+        return True
+
+    def get_player(self, username: str) -> events.BlackjackPlayerData | None:
+        """Helper function returning the local state of a player, the dealer has an empty username."""
+        if username == "":
+            return self._dealer
+        for player in (*self._active_players, *self._waiting_players):
+            if player.username == username:
+                return player
+        return None
+
+    def render_game(self) -> None:
+        """Function that renders the whole local game state.
 
+        It first resets everything (cards, texts) and then goes through every players data.
         If the current user is not in the active players (that means he joined into an ongoing game) his controls will
-        bedisabled, and he can watch the other players until a new round starts.
+        be disabled, and he can watch the other players until a new round starts.
         """
-        self.set_started(event.started)
+        self.set_started(self.started)
         self.reset_cards()
         self.reset_texts()
+        self._pile_indexes = {}
         own_playing = False
 
         player_index = 2
-        for player in event.active_players:
+        for player in (*self._active_players, self._dealer):
             pile_index = player_index
             if player.username == self.own_username:
                 own_playing = True
@@ -285,37 +399,9 @@ class BlackjackView(WebsocketView):
                 pile_index = DEALER_PILE
             else:
                 self._username_texts[pile_index].text = player.username
-            if not event.started:
-                card1 = CardSprite(UNKNOWN_CARD_NAME)
-                card2 = CardSprite(UNKNOWN_CARD_NAME)
-                self.add_card_to_pile(card1, pile_index)
-                self.add_card_to_pile(card2, pile_index)
-                self._card_list.append(card1)
-                self._card_list.append(card2)
-                continue
-
-            total_card_value = 0
-            for card_data in player.cards:
-                total_card_value += card_data.value
-                card_name = card_data.name
-                if card_name == "":
-                    card_name = UNKNOWN_CARD_NAME
-                card = CardSprite(card_name)
-                self.add_card_to_pile(card, pile_index)
-                self._card_list.append(card)
-            if total_card_value != 0:
-                self._card_value_texts[pile_index].text = str(total_card_value)
-
-            if player.current_bet != 0:
-                self._money_texts[pile_index].text = f"{player.current_bet}$"
-
-                if player.username == self.own_username:
-                    self.set_bet_button.disabled = True
-                    self.bet_input.disabled = True
-                    self.bet_input.text = ""
-
-            if pile_index not in {OWN_PILE, DEALER_PILE}:
                 player_index += 1
+            self._pile_indexes[player.username] = pile_index
+            self.render_player(player, pile_index)
 
         if not own_playing:
             self.box.visible = False
@@ -325,6 +411,38 @@ class BlackjackView(WebsocketView):
             self.draw_card_button.disabled = True
             self.hold_card_button.disabled = True
 
+    def render_player(self, player: events.BlackjackPlayerData, pile_index: int) -> None:
+        """Function that renders the cards and texts of a single player.
+
+        If the game is not started, each player gets 2 unknown cards to display something while they are waiting for the
+        game to start.
+        """
+        if not self.started:
+            for _ in range(2):
+                card = CardSprite(UNKNOWN_CARD_NAME)
+                self.add_card_to_pile(card, pile_index)
+                self._card_list.append(card)
+            return
+
+        for card_data in player.cards:
+            card = CardSprite(card_data.name or UNKNOWN_CARD_NAME)
+            self.add_card_to_pile(card, pile_index)
+            self._card_list.append(card)
+        self.render_player_texts(player, pile_index)
+
+    def render_player_texts(self, player: events.BlackjackPlayerData, pile_index: int) -> None:
+        """Function that renders the total card value and the current bet of a single player."""
+        total_card_value = sum(card_data.value for card_data in player.cards)
+        self._card_value_texts[pile_index].text = str(total_card_value) if total_card_value != 0 else ""
+
+        if player.current_bet != 0:
+            self._money_texts[pile_index].text = f"{player.current_bet}$"
+
+            if player.username == self.own_username:
+                self.set_bet_button.disabled = True
+                self.bet_input.disabled = True
+                self.bet_input.text = ""
+
     ### Utility Functions
 
     def add_card_to_pile(self, new_card: CardSprite, pile: int) -> None:
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import logging
+import queue
+import threading
 import typing
 
 import arcade
@@ -14,10 +16,12 @@ from frontend.ui import Button
 from frontend.ui import ButtonStyle
 from frontend.ui import Label
 from frontend.views.base import BaseGUI
+from shared.models import events
 
 if typing.TYPE_CHECKING:
     import collections.abc
 
+    from frontend.internal.websocket_thread import WebsocketThread
     from frontend.window import MainWindow
     from shared.models import responses
 
@@ -36,6 +40,11 @@ def try_get(iterable: collections.abc.Sequence[T], index: int) -> T | None:
 class LobbysView(BaseGUI):
     """View that shows every available lobby for a game mode and lets you pick & join a lobby.
 
+    While the view is active it is subscribed to the lobby directory of the game mode, which pushes every change of
+    the lobbys. Only while the subscription is lost, the lobbys are fetched every `LOBBY_REFRESH_SECONDS` instead and
+    the view tries subscribing again, waiting twice as long after every failed try, up to
+    `LOBBY_RESUBSCRIBE_MAX_SECONDS`.
+
     Authors: Christopher
     """
 
@@ -46,6 +55,13 @@ class LobbysView(BaseGUI):
 
         self._lobbys: list[responses.PublicGameLobby] = []
         self._selected: int | None = None
+        self._directory_events: queue.Queue[events.BaseEvent] = queue.Queue()
+        self._directory_thread: WebsocketThread | None = None
+        # every subscription gets its own event, the thread of an old subscription sets it when it ends as well
+        self._directory_lost = threading.Event()
+        self._active = False
+        self._resubscribe_delay: float = c.LOBBY_RESUBSCRIBE_SECONDS
+        self._time_since_lost: float = 0
 
         self.anchor = self.ui.add(arcade.gui.UIAnchorLayout())
         self.box_layout = self.anchor.add(
@@ -100,13 +116,14 @@ class LobbysView(BaseGUI):
             self._lobbys_list.add(child=arcade.gui.UILabel(text="No lobbys found!", font_size=c.MENU_FONT_SIZE))
 
     def refresh_lobbys(self) -> None:
-        """Function that fetches new lobbys from the backend and refreshes the ui after that.
+        """Function that fetches new lobbys from the backend and refreshes the ui after that."""
+        self._set_lobbys(self.window.net_client.rest.get_lobbys(game=self._game_mode.value))
+        self._time_since_refresh = 0
 
-        It saves the current selected lobby id, so that the _selected attribute can be correctly set again.
-        """
+    def _set_lobbys(self, lobbys: list[responses.PublicGameLobby]) -> None:
+        """Replaces the shown lobbys and refreshes the ui, keeping the selected lobby selected if it's not full."""
         selected_lobby_id = self._lobbys[self._selected - 1].id if self._selected else None
-        self._lobbys = self.window.net_client.rest.get_lobbys(game=self._game_mode.value)
-        self._time_since_refresh = 0
+        self._lobbys = lobbys
         if selected_lobby_id:
             for i, lobby in enumerate(self._lobbys):
                 if lobby.id == selected_lobby_id and not lobby.full:
@@ -119,6 +136,50 @@ class LobbysView(BaseGUI):
                     self._selected = None
         self.refresh_ui()
 
+    def _subscribe(self) -> None:
+        """Subscribes to the lobby directory, the events are applied in `on_update`."""
+        if self._directory_thread is not None or not self.window.net_client.authorized:
+            return
+        self._directory_lost = threading.Event()
+        self._directory_events = queue.Queue()
+        self._directory_thread = self.window.net_client.get_lobby_directory_thread(
+            game_mode=self._game_mode,
+            receive_event_queue=self._directory_events,
+            disconnect_callback=self._directory_lost.set,
+        )
+        for event_type in (events.LobbyList, events.LobbyCreated, events.LobbyUpdated, events.LobbyRemoved):
+            self._directory_thread.register_event(event_type)
+        self._directory_thread.start()
+
+    def _unsubscribe(self) -> None:
+        if self._directory_thread is not None:
+            self._directory_thread.disconnect()
+            self._directory_thread = None
+
+    def _apply_directory_events(self) -> None:
+        """Applies every received change of the lobby directory and refreshes the ui once if something changed."""
+        lobbys: dict[str, responses.PublicGameLobby] | None = None
+        while True:
+            try:
+                event = self._directory_events.get_nowait()
+            except queue.Empty:
+                break
+            if lobbys is None:
+                lobbys = {lobby.id: lobby for lobby in self._lobbys}
+            match event:
+                case events.LobbyList():
+                    lobbys = {lobby.id: lobby for lobby in event.lobbys}
+                    # the subscription works again
+                    self._resubscribe_delay = c.LOBBY_RESUBSCRIBE_SECONDS
+                case events.LobbyCreated() | events.LobbyUpdated():
+                    lobbys[event.lobby.id] = event.lobby
+                case events.LobbyRemoved():
+                    lobbys.pop(event.lobby_id, None)
+                case _:
+                    logger.debug("Ignoring unexpected lobby directory event %s", event.event_name())
+        if lobbys is not None:
+            self._set_lobbys(sorted(lobbys.values(), key=lambda lobby: lobby.id))
+
     def add_lobby(self, lobby_code: str, max_players: int, num_players: int) -> None:
         """This function adds a new lobby row."""
         self._add_lobbys_row(self._game_mode.value.title(), lobby_code, f"{num_players}/{max_players} Players")
@@ -187,10 +248,21 @@ class LobbysView(BaseGUI):
     @typing.override
     def on_update(self, delta_time: float) -> None:
         self._join_button.disabled = self._selected is None
+        self._apply_directory_events()
+        if not self._active or (self._directory_thread is not None and not self._directory_lost.is_set()):
+            return
+        if self._directory_thread is not None:
+            # the connection of the subscription dropped, its thread already ended
+            self._directory_thread = None
+            self._time_since_lost = 0
         self._time_since_refresh += delta_time
         if self._time_since_refresh >= c.LOBBY_REFRESH_SECONDS:
             self.refresh_lobbys()
-            # TODO: Check if this works
+        self._time_since_lost += delta_time
+        if self._time_since_lost >= self._resubscribe_delay:
+            self._time_since_lost = 0
+            self._resubscribe_delay = min(self._resubscribe_delay * 2, c.LOBBY_RESUBSCRIBE_MAX_SECONDS)
+            self._subscribe()
 
     @typing.override
     def on_show_view(self) -> None:
@@ -202,6 +274,14 @@ class LobbysView(BaseGUI):
     def can_pause(self) -> bool:
         return True
 
+    @typing.override
+    def activate(self) -> None:
+        self._active = True
+        self._resubscribe_delay = c.LOBBY_RESUBSCRIBE_SECONDS
+        self._subscribe()
+
     @typing.override
     def deactivate(self) -> None:
+        self._active = False
         self._selected = None
+        self._unsubscribe()
@@ -11,7 +11,8 @@ from nox import options
 
 BACKEND_PATH = pathlib.Path(__file__).parent / "backend"
 FRONTEND_PATH = pathlib.Path(__file__).parent / "frontend"
-PYTHON_PATHS = [BACKEND_PATH, "noxfile.py", FRONTEND_PATH]
+BENCHMARKS_PATH = pathlib.Path(__file__).parent / "benchmarks"
+PYTHON_PATHS = [BACKEND_PATH, "noxfile.py", FRONTEND_PATH, BENCHMARKS_PATH]
 REFORMATTING_PATHS = PYTHON_PATHS
 
 
@@ -114,6 +115,15 @@ def pyright(session: nox.Session) -> None:
     session.run("pyright", *PYTHON_PATHS)
 
 
+@nox.session(reuse_venv=True)
+def benchmark(session: nox.Session) -> None:
+    """Run a benchmark, e.g. `nox -s benchmark -- wire_codecs`."""
+    uv_sync(session, include_self=True, groups=["backend", "frontend"])
+    session.run(
+        "python", "-m", f"benchmarks.{session.posargs[0] if session.posargs else 'wire_codecs'}", *session.posargs[1:]
+    )
+
+
 @nox.session(venv_backend="none")
 def check_trailing_whitespaces(session: nox.Session) -> None:
     """Check for trailing whitespaces in the project."""
@@ -0,0 +1,95 @@
+"""Wire codecs that can be negotiated for the websocket protocol.
+
+The HELLO and IDENTIFY payloads are always sent as JSON, the codec the client picked in its IDENTIFY payload is
+used for every payload after that.
+"""
+
+from __future__ import annotations
+
+import typing
+
+import msgspec
+
+from shared.internal.hooks import decode_hook
+from shared.internal.hooks import encode_hook
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Callable
+    from collections.abc import Mapping
+
+__all__ = ("CODECS", "JSON", "MSGPACK", "Codec")
+
+T = typing.TypeVar("T")
+type DecoderT = msgspec.json.Decoder[typing.Any] | msgspec.msgpack.Decoder[typing.Any]
+
+
+class Codec:
+    """A wire format used to en/decode websocket payloads.
+
+    Decoders are created once per type and then reused.
+
+    Authors: Christopher
+    """
+
+    __slots__ = ("_decoder_factory", "_decoders", "_encoder", "binary", "name")
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        binary: bool,
+        encoder: msgspec.json.Encoder | msgspec.msgpack.Encoder,
+        decoder_factory: Callable[[type[typing.Any]], DecoderT],
+    ) -> None:
+        self.name = name
+        """Name the codec is negotiated with."""
+        self.binary = binary
+        """Whether frames encoded by this codec have to be sent as BINARY frames."""
+        self._encoder = encoder
+        self._decoder_factory = decoder_factory
+        self._decoders: dict[typing.Any, DecoderT] = {}
+
+    def encode(self, obj: object) -> bytes:
+        return self._encoder.encode(obj)
+
+    @typing.overload
+    def decode(self, data: bytes | str, type_: type[T]) -> T: ...
+    @typing.overload
+    def decode(self, data: bytes | str, type_: typing.Any) -> typing.Any: ...  # noqa: ANN401
+    def decode(self, data: bytes | str, type_: typing.Any) -> typing.Any:
+        """Decodes a received frame into `type_`, which can also be a (tagged) union of types.
+
+        TEXT frames are only accepted by text based codecs, they are decoded as is without encoding them first.
+        """
+        if (decoder := self._decoders.get(type_)) is None:
+            decoder = self._decoders[type_] = self._decoder_factory(type_)
+        if isinstance(data, str):
+            if self.binary:
+                msg = f"Unexpected message type received TEXT, the {self.name} codec expects BINARY"
+                raise msgspec.DecodeError(msg)
+            return typing.cast("msgspec.json.Decoder[typing.Any]", decoder).decode(data)
+        return decoder.decode(data)
+
+    @typing.override
+    def __repr__(self) -> str:
+        return f"Codec({self.name!r})"
+
+
+JSON: typing.Final[Codec] = Codec(
+    "json",
+    binary=False,
+    encoder=msgspec.json.Encoder(enc_hook=encode_hook),
+    decoder_factory=lambda type_: msgspec.json.Decoder(type_, dec_hook=decode_hook),
+)
+"""JSON codec, this is the fallback every client and server has to support."""
+
+MSGPACK: typing.Final[Codec] = Codec(
+    "msgpack",
+    binary=True,
+    encoder=msgspec.msgpack.Encoder(enc_hook=encode_hook),
+    decoder_factory=lambda type_: msgspec.msgpack.Decoder(type_, dec_hook=decode_hook),
+)
+"""MessagePack codec, produces smaller frames and is cheaper to en/decode than JSON."""
+
+CODECS: typing.Final[Mapping[str, Codec]] = {codec.name: codec for codec in (MSGPACK, JSON)}
+"""Every codec that can be negotiated, ordered by preference. This order is advertised to clients in HELLO."""
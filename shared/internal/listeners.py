@@ -0,0 +1,42 @@
+"""Collecting event listeners, marked by the `add_event_listener` decorators of the backend and the frontend.
+
+Listeners are collected once per class when the class gets created, instances then share the resulting table.
+"""
+
+from __future__ import annotations
+
+import types
+import typing
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Callable
+    from collections.abc import Mapping
+
+__all__ = ("ListenerTableT", "collect_listeners")
+
+type ListenerTableT = Mapping[str, tuple[type[typing.Any], tuple[Callable[..., typing.Any], ...]]]
+"""Maps an event name to its event type and the unbound functions listening for it."""
+
+
+def collect_listeners(cls: type) -> ListenerTableT:
+    """Builds an immutable table of every function of `cls` and its bases with an `__event_type__` attribute.
+
+    A listener overridden in a subclass is replaced by the override, or dropped if the override isn't a listener.
+
+    Authors: Christopher
+    """
+    by_attr_name: dict[str, Callable[..., typing.Any]] = {}
+    for klass in reversed(cls.__mro__):
+        for attr_name, attr in vars(klass).items():
+            if callable(attr) and hasattr(attr, "__event_type__"):
+                by_attr_name[attr_name] = attr
+            else:
+                by_attr_name.pop(attr_name, None)
+
+    table: dict[str, tuple[type[typing.Any], list[Callable[..., typing.Any]]]] = {}
+    for listener in by_attr_name.values():
+        event_type = listener.__event_type__  # type: ignore[reportFunctionMemberAccess]
+        table.setdefault(event_type.event_name(), (event_type, []))[1].append(listener)
+    return types.MappingProxyType(
+        {event_name: (event_type, tuple(funcs)) for event_name, (event_type, funcs) in table.items()}
+    )
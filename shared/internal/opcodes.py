@@ -2,9 +2,13 @@ from __future__ import annotations
 
 import typing
 
-__all__ = ("DISPATCH", "HELLO", "IDENTIFY", "READY")
+__all__ = ("DISPATCH", "HEARTBEAT", "HEARTBEAT_ACK", "HELLO", "IDENTIFY", "READY", "RESUME", "RESUMED")
 
 DISPATCH: typing.Final[int] = 0
 HELLO: typing.Final[int] = 1
 IDENTIFY: typing.Final[int] = 2
 READY: typing.Final[int] = 3
+HEARTBEAT: typing.Final[int] = 4
+HEARTBEAT_ACK: typing.Final[int] = 5
+RESUME: typing.Final[int] = 6
+RESUMED: typing.Final[int] = 7
@@ -0,0 +1,124 @@
+"""Wire tracing for the websocket transports.
+
+Tracing is disabled by default, in which case the transports only check `tracer` for None. When enabled, every
+(sampled) frame is stored in a fixed size ring buffer together with its direction and a timestamp. Frames are only
+referenced when they get recorded, the opcode and event name are decoded when the buffer gets dumped.
+
+Tracing can be enabled with the `WIRE_TRACE` environment variable, which sets the size of the ring buffer, and
+`WIRE_TRACE_SAMPLE_RATE`, which sets the fraction of frames that get recorded.
+"""
+
+from __future__ import annotations
+
+import collections
+import enum
+import logging
+import os
+import random
+import time
+import typing
+
+import msgspec
+
+if typing.TYPE_CHECKING:
+    from shared.internal.codecs import Codec
+
+__all__ = ("Direction", "TraceRecord", "WireTracer", "disable", "enable", "tracer")
+
+
+class Direction(enum.StrEnum):
+    SENT = "sent"
+    RECEIVED = "received"
+
+
+class TraceRecord(typing.NamedTuple):
+    timestamp: float
+    """Unix timestamp of when the frame was sent or received."""
+    direction: Direction
+    size: int
+    """Size of the frame in bytes."""
+    opcode: int | None
+    """Opcode of the payload, None if the frame could not be decoded."""
+    event: str | None
+    """Name of the event for DISPATCH and READY payloads."""
+
+
+class _EventHeader(msgspec.Struct):
+    t: str | None = None
+
+
+class _PayloadHeader(msgspec.Struct):
+    op: int
+    d: _EventHeader | None = None
+
+
+class WireTracer:
+    """Ring buffer storing the most recent frames sent and received by a transport.
+
+    Authors: Christopher
+    """
+
+    __slots__ = ("_frames", "sample_rate")
+
+    def __init__(self, *, size: int = 1_024, sample_rate: float = 1.0) -> None:
+        self._frames: collections.deque[tuple[float, Direction, Codec, bytes | str]] = collections.deque(maxlen=size)
+        self.sample_rate = sample_rate
+        """Fraction of frames that get recorded."""
+
+    def record(self, direction: Direction, codec: Codec, frame: bytes | str) -> None:
+        """Stores a frame in the buffer, if it was sampled."""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        self._frames.append((time.time(), direction, codec, frame))
+
+    def dump(self) -> list[TraceRecord]:
+        """Returns every record in the buffer, oldest first."""
+        records: list[TraceRecord] = []
+        for timestamp, direction, codec, frame in list(self._frames):
+            size = len(frame.encode()) if isinstance(frame, str) else len(frame)
+            try:
+                header = codec.decode(frame, _PayloadHeader)
+            except msgspec.DecodeError:
+                records.append(TraceRecord(timestamp, direction, size, None, None))
+            else:
+                event = header.d.t if header.d is not None else None
+                records.append(TraceRecord(timestamp, direction, size, header.op, event))
+        return records
+
+    def clear(self) -> None:
+        self._frames.clear()
+
+    def log_dump(self, logger: logging.Logger, level: int = logging.INFO) -> None:
+        """Writes every record in the buffer to `logger`, one line per record."""
+        records = self.dump()
+        logger.log(level, "wire trace with %s records", len(records))
+        for record in records:
+            logger.log(
+                level,
+                "%.6f %-8s op=%s event=%s size=%s",
+                record.timestamp,
+                record.direction,
+                record.opcode,
+                record.event,
+                record.size,
+            )
+
+
+tracer: WireTracer | None = None
+"""The active tracer, None if tracing is disabled."""
+
+
+def enable(*, size: int = 1_024, sample_rate: float = 1.0) -> WireTracer:
+    """Enables tracing for every transport, replacing the active tracer."""
+    global tracer  # noqa: PLW0603
+    tracer = WireTracer(size=size, sample_rate=sample_rate)
+    return tracer
+
+
+def disable() -> None:
+    global tracer  # noqa: PLW0603
+    tracer = None
+
+
+if _size := int(os.getenv("WIRE_TRACE", "0")):
+    enable(size=_size, sample_rate=float(os.getenv("WIRE_TRACE_SAMPLE_RATE", "1.0")))
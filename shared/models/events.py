@@ -9,15 +9,27 @@ from shared.models import responses
 from shared.internal import snowflakes
 
 
-class BaseEvent(msgspec.Struct):
+def _event_name(class_name: str) -> str:
+    result = []
+    for i, char in enumerate(class_name):
+        if char.isupper() and i != 0:
+            result.append("_")
+        result.append(char)
+    return "".join(result).upper()
+
+class BaseEvent(msgspec.Struct, tag=_event_name, tag_field="t"):
+    """Base class of every event.
+
+    Events are a tagged union, the name of an event is stored in the `t` field, so that a received event can be
+    decoded into its concrete type in a single pass.
+    """
+
+    supersedable: typing.ClassVar[bool] = False
+    """Whether the event is a full state update, meaning a newer event of the same type makes older ones obsolete."""
+
     @classmethod
     def event_name(cls) -> str:
-        result = []
-        for i, char in enumerate(cls.__name__):
-            if char.isupper() and i != 0:
-                result.append("_")
-            result.append(char)
-        return "".join(result).upper()
+        return typing.cast("str", cls.__struct_config__.tag)
 
 class ReadyEvent(BaseEvent):
     user: responses.PublicUser
@@ -27,11 +39,29 @@ class ReadyEvent(BaseEvent):
 class LeaveEvent(BaseEvent):
     pass
 
+class LobbyList(BaseEvent):
+    """Every lobby of a game mode, sent by the lobby directory when subscribing to it."""
+
+    supersedable: typing.ClassVar[bool] = True
+
+    lobbys: list[responses.PublicGameLobby]
+
+class LobbyCreated(BaseEvent):
+    lobby: responses.PublicGameLobby
+
+class LobbyUpdated(BaseEvent):
+    lobby: responses.PublicGameLobby
+
+class LobbyRemoved(BaseEvent):
+    lobby_id: str
+
 class PrintText(BaseEvent):
     text: str
     text2: str
 
 class UpdateMoney(BaseEvent):
+    supersedable: typing.ClassVar[bool] = True
+
     money: int
 
 class StartSpin(BaseEvent):
@@ -100,11 +130,44 @@ class BlackjackSetBet(BaseEvent):
     bet: int
 
 class BlackjackUpdateGame(BaseEvent):
+    """Snapshot of the whole game state, every patch with a higher `seq` is applied on top of it."""
+
+    supersedable: typing.ClassVar[bool] = True
+
+    seq: int
     started: bool
 
     active_players: list[BlackjackPlayerData]
     waiting_players: list[BlackjackPlayerData]
 
+class BlackjackPlayerJoined(BaseEvent):
+    seq: int
+    player: BlackjackPlayerData
+    waiting: bool
+
+class BlackjackPlayerLeft(BaseEvent):
+    seq: int
+    username: str
+
+class BlackjackBetSet(BaseEvent):
+    seq: int
+    username: str
+    bet: int
+
+class BlackjackCardAdded(BaseEvent):
+    seq: int
+    username: str
+    card: BlackjackCardData
+
+class BlackjackCardRevealed(BaseEvent):
+    seq: int
+    username: str
+    index: int
+    card: BlackjackCardData
+
+class BlackjackRequestResync(BaseEvent):
+    pass
+
 class BlackjackStartGame(BaseEvent):
     pass
 
@@ -147,4 +210,20 @@ class UpdateMultiplierResponse(BaseEvent):
     step_text: int
 
 class UpdateTotal(BaseEvent):
-    total: int
\ No newline at end of file
+    total: int
+
+
+def _all_events() -> tuple[type[BaseEvent], ...]:
+    result: list[type[BaseEvent]] = []
+    pending = BaseEvent.__subclasses__()
+    while pending:
+        event = pending.pop(0)
+        result.append(event)
+        pending.extend(event.__subclasses__())
+    return tuple(result)
+
+if typing.TYPE_CHECKING:
+    AnyEvent = BaseEvent
+else:
+    AnyEvent = typing.Union[_all_events()]
+    """Union of every event defined above, this is used to decode an event into its concrete type."""
@@ -4,18 +4,106 @@ import typing
 
 import msgspec
 
-__all__ = ("IdentifyPayload", "WebSocketPayload")
+from shared.internal import Snowflake
+from shared.internal import opcodes
+from shared.models import events
 
-if typing.TYPE_CHECKING:
-    from shared.internal import Snowflake
-    from shared.models.responses import PublicUser
+__all__ = (
+    "AnyPayload",
+    "DispatchPayload",
+    "HeartbeatAckPayload",
+    "HeartbeatPayload",
+    "HelloData",
+    "HelloPayload",
+    "IdentifyData",
+    "IdentifyPayload",
+    "ReadyPayload",
+    "ResumeData",
+    "ResumePayload",
+    "ResumedData",
+    "ResumedPayload",
+    "WebSocketPayload",
+)
 
 
-class WebSocketPayload(msgspec.Struct):
-    op: int
-    d: dict[str, typing.Any]
-    t: str | None = msgspec.field(default=None)
+class WebSocketPayload(msgspec.Struct, tag_field="op"):
+    """Base class of every payload, the opcode of a payload is stored in the `op` field.
 
+    Payloads are a tagged union keyed on the opcode, which allows decoding a received frame including its data
+    in a single pass.
+    """
 
-class IdentifyPayload(msgspec.Struct):
+
+class HelloData(msgspec.Struct):
+    codecs: list[str] = msgspec.field(default_factory=lambda: ["json"])
+    """Codecs supported by the server, ordered by preference."""
+    heartbeat_interval: int = msgspec.field(default=0)
+    """Interval in milliseconds in which the client has to send a HEARTBEAT, 0 if heartbeats are not required."""
+
+
+class IdentifyData(msgspec.Struct):
     token: str
+    codec: str = msgspec.field(default="json")
+    """Codec used for every payload after the IDENTIFY payload."""
+
+
+class ResumeData(msgspec.Struct):
+    token: str
+    session_id: Snowflake
+    """The `client_id` of the READY event of the session that should be resumed."""
+    seq: int
+    """Sequence number of the last DISPATCH payload the client received."""
+    codec: str = msgspec.field(default="json")
+    """Codec used for every payload after the RESUME payload."""
+
+
+class ResumedData(msgspec.Struct):
+    replayed: int
+    """Amount of DISPATCH payloads that are replayed after this payload."""
+
+
+class DispatchPayload(WebSocketPayload, tag=opcodes.DISPATCH, omit_defaults=True):
+    d: events.AnyEvent
+    s: int | None = msgspec.field(default=None)
+    """Sequence number of the payload inside its lobby, only set for payloads sent by the server."""
+
+
+class HelloPayload(WebSocketPayload, tag=opcodes.HELLO):
+    d: HelloData = msgspec.field(default_factory=HelloData)
+
+
+class IdentifyPayload(WebSocketPayload, tag=opcodes.IDENTIFY):
+    d: IdentifyData
+
+
+class ReadyPayload(WebSocketPayload, tag=opcodes.READY):
+    d: events.ReadyEvent
+
+
+class ResumePayload(WebSocketPayload, tag=opcodes.RESUME):
+    d: ResumeData
+
+
+class ResumedPayload(WebSocketPayload, tag=opcodes.RESUMED):
+    d: ResumedData
+
+
+class HeartbeatPayload(WebSocketPayload, tag=opcodes.HEARTBEAT):
+    pass
+
+
+class HeartbeatAckPayload(WebSocketPayload, tag=opcodes.HEARTBEAT_ACK):
+    pass
+
+
+AnyPayload = (
+    DispatchPayload
+    | HelloPayload
+    | IdentifyPayload
+    | ReadyPayload
+    | HeartbeatPayload
+    | HeartbeatAckPayload
+    | ResumePayload
+    | ResumedPayload
+)
+"""Union of every payload, this is the type received frames are decoded into."""